@@ -0,0 +1,230 @@
+"""
+Annotation of new texts with a trained CRF model.
+
+The `Annotator` keeps in memory everything that is needed to annotate a text (the model,
+the dictionaries, the feature template, the sentence tokenizer and the POS tagger), so that it can
+be created once and then used for any number of pages. Sentences are collected across pages and
+sent to the model in micro-batches.
+
+The annotator can also be used as a small local HTTP service:
+
+Usage:
+    annotator.py [-p PORT] <config-file>
+
+Options:
+    -p PORT --port=PORT  Port of the service [default: 8765]
+
+POST the text to /annotate (pages separated by form feeds); the response is a JSON object
+with the annotated sentences of every page. Use /annotate?format=tsv to get WebAnno TSV instead.
+"""
+
+import json
+import logging
+from collections import namedtuple
+from templates import template1
+
+logger = logging.getLogger(__name__)
+
+Annotation = namedtuple('Annotation', ['token', 'pos', 'lemma', 'header', 'ne'])
+
+TSV_HEADER = '''# de.tudarmstadt.ukp.dkpro.core.api.lexmorph.type.pos.POS | PosValue # de.tudarmstadt.ukp.dkpro.core.api.segmentation.type.Lemma|value  # webanno.custom.Tex | LayoutElement # webanno.custom.LetterEntity | entity_id | value\n'''
+
+
+def _setEntityId(netag):
+    if netag == 'O':
+        entity_tag = 'O'
+    else:
+        entity_tag = netag[0] + '-webanno.custom.LetterEntity_'
+    return entity_tag
+
+
+def toTSV(annotated_sentences, tokenized_sentences):
+    assert len(annotated_sentences) == len(tokenized_sentences), "Mismatch between annotated and tokenized sentences!"
+    lines = [TSV_HEADER]
+    for sent_num, (anno_sent, tok_sent) in enumerate(zip(annotated_sentences, tokenized_sentences)):
+        lines.append("#id={}\n#text={}\n".format(sent_num + 1, tok_sent.replace("\n", ' ')))
+        for i, t in enumerate(anno_sent):
+            tok = Annotation(*t)
+            entity_id = _setEntityId(tok.ne)
+            tsv_line = (
+            "{}-{}".format(sent_num + 1, i + 1), tok.token, tok.pos, tok.lemma, tok.header, entity_id, tok.ne, "")
+            lines.append("{}\n".format("\t".join(tsv_line)))
+        lines.append("\n")
+
+    return "".join(lines)
+
+
+def merge_predictions(tagged_sents, y_pred):
+    """Replaces the last column of every tagged token with the predicted label"""
+    assert len(tagged_sents) == len(y_pred), "The lists of tokens and predictions are not in sync!"
+    anno = []
+    for s, p in zip(tagged_sents, y_pred):
+        anno.append([tuple(list(tok_sent[:-1]) + [tok_pred]) for tok_sent, tok_pred in zip(s, p)])
+    return anno
+
+
+class Annotator:
+    """
+    Holds the model and the resources needed to annotate text.
+
+    :param model: a model (or the path to a model, loaded with `model_store.load_model`)
+    :param dictionaries: dictionary ( dict_type : list of values)
+    :param template: the feature template the model was trained with
+    :param sent_tokenizer_path: path to the pickled Punkt sentence tokenizer
+    :param batch_size: number of sentences sent to the model at once
+    :param word_types_path: file where the table of the word type features is persisted between runs
+    :param instrumentation: an `instrumentation.Instrumentation` that times the stages (tokenize, pos_tag,
+        featurize, predict, tsv) and counts pages, sentences and tokens (default: disabled)
+    """
+
+    def __init__(self, model, dictionaries, template=template1, sent_tokenizer_path=None, batch_size=256,
+                 word_types_path=None, instrumentation=None):
+        from model_store import load_model
+        from training import WordTypeTable
+        from instrumentation import Instrumentation
+
+        self.model = load_model(model, template=template, dictionaries=dictionaries) \
+            if isinstance(model, str) else model
+        self.dictionaries = dictionaries
+        self.template = template
+        self.batch_size = batch_size
+        self._sent_tokenizer_path = sent_tokenizer_path
+        self._tagger = None
+        self.word_types = WordTypeTable(dictionaries, word_types_path)
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation.disabled()
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """Creates an annotator with the model, dictionaries and tokenizer of a project configuration"""
+        from config_reader import ProjectCofiguration
+        from training import load_dictionaries
+
+        conf = ProjectCofiguration(config) if isinstance(config, str) else config
+        return cls(conf.model, load_dictionaries(conf.dictionaries),
+                   sent_tokenizer_path=conf.sentence_tokenizer or None, **kwargs)
+
+    @property
+    def tagger(self):
+        # TreeTagger is expensive to start: keep one instance for the whole life of the annotator
+        if self._tagger is None:
+            from treetagger import TreeTagger
+            self._tagger = TreeTagger(language='german')
+        return self._tagger
+
+    def tokenize(self, text):
+        from idai_journals.nlp import DAITokenizeSent
+        with self.instrumentation.stage("tokenize"):
+            return DAITokenizeSent(text, self._sent_tokenizer_path)
+
+    def pos_tag(self, tokenized_sents):
+        tagged_sents = []
+        with self.instrumentation.stage("pos_tag"):
+            for s in tokenized_sents:
+                tags = [t for t in self.tagger.tag(s) if len(t) > 1]
+                tagged_sents.append([tuple(tag + ["_", ""]) for tag in tags])
+        return tagged_sents
+
+    def featurize(self, tagged_sents):
+        from training import InstanceFeatureExtractor
+        with self.instrumentation.stage("featurize"):
+            return InstanceFeatureExtractor(tagged_sents, self.dictionaries,
+                                            self.word_types).extract_features(self.template)
+
+    def predict(self, X):
+        with self.instrumentation.stage("predict"):
+            return self.model.predict(X)
+
+    def save_word_types(self):
+        """Saves the word type table (if a path was given), so that the next run can start from it"""
+        if self.word_types._path:
+            self.word_types.save()
+
+    def annotate_sents(self, tagged_sents):
+        """Annotates a list of POS-tagged sentences (features are extracted for the list as a whole)"""
+        return merge_predictions(tagged_sents, self.predict(self.featurize(tagged_sents)))
+
+    def annotate_pages(self, pages):
+        """
+        Annotates a stream of pages (raw text). Features are extracted page by page (as in training,
+        sentences are ranked within their page), while predictions are made in batches of sentences
+        that can span several pages.
+
+        :param pages: iterable of str
+        :return: generator of tuples (tokenized sentences, annotated sentences), one per page
+        """
+        pending, n = [], 0
+        for page in pages:
+            sents = self.tokenize(page)
+            tagged = self.pos_tag(sents)
+            pending.append((sents, tagged, self.featurize(tagged)))
+            n += len(sents)
+            if self.instrumentation.enabled:
+                self.instrumentation.count("pages")
+                self.instrumentation.count("sentences", len(sents))
+                self.instrumentation.count("tokens", sum(len(t) for t in tagged))
+            if n >= self.batch_size:
+                yield from self._flush(pending)
+                pending, n = [], 0
+        yield from self._flush(pending)
+
+    def _flush(self, pending):
+        X = [x for _, _, page_X in pending for x in page_X]
+        y_pred = self.predict(X) if X else []
+        start = 0
+        for sents, tagged, page_X in pending:
+            end = start + len(page_X)
+            yield sents, merge_predictions(tagged, y_pred[start:end])
+            start = end
+
+    def annotate_text(self, text):
+        """Annotates a single text; returns a list of annotated sentences"""
+        return next(self.annotate_pages([text]))[1]
+
+    def annotate_pages_tsv(self, pages):
+        """Like `annotate_pages`, but yields the WebAnno TSV of every page"""
+        for sents, annotated in self.annotate_pages(pages):
+            with self.instrumentation.stage("tsv"):
+                tsv = toTSV(annotated, sents)
+            yield tsv
+
+
+def serve(annotator, host="localhost", port=8765):
+    """Exposes an annotator as local HTTP service (single-threaded: the annotator is not thread-safe)"""
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import urlparse, parse_qs
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/annotate":
+                self.send_error(404)
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            pages = self.rfile.read(length).decode("utf-8").split("\f")
+            if parse_qs(url.query).get("format") == ["tsv"]:
+                body = "\f".join(annotator.annotate_pages_tsv(pages)).encode("utf-8")
+                ctype = "text/tab-separated-values; charset=utf-8"
+            else:
+                result = [{"sentences": sents, "annotations": anno} for sents, anno in annotator.annotate_pages(pages)]
+                body = json.dumps(result, ensure_ascii=False).encode("utf-8")
+                ctype = "application/json; charset=utf-8"
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = HTTPServer((host, port), Handler)
+    logger.info("Annotation service listening on http://{}:{}/annotate".format(host, port))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    logging.basicConfig(level=logging.INFO)
+    args = docopt(__doc__)
+    serve(Annotator.from_config(args["<config-file>"]), port=int(args["--port"]))
@@ -0,0 +1,34 @@
+"""Benchmarks of the import of the EAD metadata into Neo4j (with the synthetic EAD file and a stub driver)"""
+
+import pytest
+
+from conftest import EAD_LETTERS, NAMES
+
+
+@pytest.mark.benchmark(group="graph import")
+def test_process_ead_file(benchmark, ead_file):
+    from ead_reader.main import process_ead_file
+
+    letters = benchmark(process_ead_file, ead_file)
+    assert len(letters) == EAD_LETTERS
+    # every person is a single shared instance
+    assert len({id(person) for letter in letters for person in letter.authors + letter.recipients}) == len(NAMES)
+
+
+@pytest.mark.benchmark(group="graph import")
+def test_neo4j_writer(benchmark, ead_file, stub_driver):
+    from ead_reader.main import process_ead_file
+    neo4j_writer = pytest.importorskip("neo4j_writer")
+
+    letters = process_ead_file(ead_file)
+    benchmark(neo4j_writer.write_data, stub_driver, letters)
+    # 4 schema statements and 12 data statements per round
+    assert len(stub_driver.statements) % 16 == 0
+
+
+@pytest.mark.benchmark(group="graph import")
+def test_pipelined_import(benchmark, ead_file, stub_driver):
+    pipeline = pytest.importorskip("pipeline")
+
+    written = benchmark(pipeline.pipelined_import, [ead_file], stub_driver, batch_size=100)
+    assert written == EAD_LETTERS
@@ -0,0 +1,66 @@
+"""
+Startup cost: import time of the library modules (measured with `python -X importtime` in a new
+interpreter) and wall time of `--help` of the annotate scripts, which must not load any resource.
+"""
+
+import ast
+import os
+import subprocess
+import sys
+
+import pytest
+from docopt import docopt
+
+from conftest import REPO_ROOT
+
+# max cumulative import time (seconds) of a module, including everything it imports
+IMPORT_BUDGETS = {
+    "training": 0.1,
+    "annotator": 0.1,
+    "model_store": 0.1,
+    "preprocessing": 0.1,
+    "tei_reader": 0.15,
+    "evaluation": 0.4,
+}
+
+
+def _env():
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+
+
+def import_time(module):
+    """Cumulative import time of a module (seconds), as reported by `python -X importtime`"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module], cwd=REPO_ROOT,
+                            env=_env(), stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e6
+    raise ValueError("{} not found in the output of -X importtime".format(module))
+
+
+@pytest.mark.parametrize("module", sorted(IMPORT_BUDGETS))
+def test_import_budget(module):
+    seconds = import_time(module)
+    assert seconds < IMPORT_BUDGETS[module], "import {} takes {:.3f}s".format(module, seconds)
+
+
+@pytest.mark.benchmark(group="startup")
+@pytest.mark.parametrize("script", ["annotateXML.py", "annotateTXT.py"])
+def test_script_help(benchmark, script):
+    result = benchmark.pedantic(subprocess.run, args=([sys.executable, script, "--help"],),
+                                kwargs={"cwd": os.path.join(REPO_ROOT, "scripts"), "env": _env(),
+                                        "stdout": subprocess.PIPE, "stderr": subprocess.PIPE},
+                                rounds=3)
+    assert result.returncode == 0 and b"Usage" in result.stdout
+
+
+@pytest.mark.parametrize("script,path_arg", [("annotateXML.py", "<file.xml>"), ("annotateTXT.py", "<path_to_txt_file>")])
+def test_script_usage(script, path_arg):
+    # the docstring is read without running the script, which loads its configuration when imported
+    with open(os.path.join(REPO_ROOT, "scripts", script)) as f:
+        usage = ast.get_docstring(ast.parse(f.read()), clean=False)
+    args = docopt(usage, argv=["--stats", "stats.json", "input"])
+    assert args == {"--stats": "stats.json", "--profile": None, path_arg: "input"}
+    assert docopt(usage, argv=["input"])[path_arg] == "input"
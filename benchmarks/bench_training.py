@@ -0,0 +1,60 @@
+"""Benchmarks of the training and annotation pipeline on the sample of the gold corpus"""
+
+import pytest
+
+from conftest import COLUMNS
+from templates import template1
+
+
+@pytest.mark.benchmark(group="corpus")
+def test_corpus_load(benchmark, gold_sample):
+    from korr_corpusreader import KorrIOBCorpusReader
+
+    folder = gold_sample[0]
+
+    def load():
+        return list(KorrIOBCorpusReader(folder, r".*\.iob", columntypes=COLUMNS).full_tagged_sents())
+
+    sents = benchmark(load)
+    assert len(sents) > 0
+
+
+@pytest.mark.benchmark(group="features")
+def test_set_feats_labels(benchmark, trainer):
+    from training import WordTypeTable
+
+    def new_table():
+        trainer.word_types = WordTypeTable(trainer.dictionaries)
+
+    # every round starts with an empty word type table, as in a new process
+    benchmark.pedantic(trainer.set_feats_labels, args=(template1,), setup=new_table, rounds=5)
+    assert len(trainer.X_train) == len(trainer.training)
+    assert len(trainer.X_test) == len(trainer.test)
+
+
+@pytest.mark.benchmark(group="crf")
+def test_fit(benchmark, featurized):
+    benchmark.pedantic(featurized.fit, rounds=3)
+    assert featurized.iterations > 0
+
+
+@pytest.mark.benchmark(group="crf")
+def test_predict(benchmark, fitted):
+    y_pred = benchmark(fitted.crf.predict, fitted.X_test)
+    assert len(y_pred) == len(fitted.y_test)
+
+
+@pytest.mark.benchmark(group="annotation")
+def test_toTSV(benchmark, fitted):
+    from annotator import merge_predictions, toTSV
+
+    annotated = merge_predictions(fitted.test, fitted.crf.predict(fitted.X_test))
+    tokenized = [" ".join(tok[0] for tok in sent) for sent in fitted.test]
+    tsv = benchmark(toTSV, annotated, tokenized)
+    assert tsv.count("#id=") == len(fitted.test)
+
+
+@pytest.mark.benchmark(group="crf")
+def test_evaluate(benchmark, fitted):
+    scores = benchmark(fitted.evaluate)
+    assert 0 < scores["F1_general"] <= 1
@@ -0,0 +1,37 @@
+"""Benchmarks of the XMI serialization of the TEI sample"""
+
+import pytest
+
+pyxmi = pytest.importorskip("pyxmi")
+
+
+def _spans(text):
+    from nltk.tokenize import WordPunctTokenizer
+
+    return list(WordPunctTokenizer().span_tokenize(text))
+
+
+def _serializer(text, spans):
+    serializer = pyxmi.XMISerializer("benchmark", text, "fr")
+    serializer.generateTokens(spans)
+    return serializer
+
+
+@pytest.mark.benchmark(group="xmi")
+def test_generate_tokens(benchmark, tei_text):
+    spans = _spans(tei_text)
+    serializer = benchmark(_serializer, tei_text, spans)
+    assert len(serializer.tokens) == len(spans)
+
+
+@pytest.mark.benchmark(group="xmi")
+def test_add_pos_tags(benchmark, tei_text):
+    spans = _spans(tei_text)
+    tagged = [(tei_text[b:e], "NN", tei_text[b:e]) for b, e in spans]
+
+    def add_pos_tags():
+        # the tokens are created in the setup, only the POS and lemma annotations are timed
+        serializer = _serializer(tei_text, spans)
+        return (serializer,), {}
+
+    benchmark.pedantic(lambda s: s.addPOSTags(tagged, spans), setup=add_pos_tags, rounds=5)
@@ -0,0 +1,211 @@
+"""
+Fixtures of the benchmark suite.
+
+The inputs are fixed, so that the timings of two runs can be compared:
+
+* a sample of the gold corpus: the first `PAGES_PER_VOLUME` pages of every volume of `data/IOB_GOLD`
+  (the last of them is the test page of the volume, the others are the training pages);
+* the TEI letter in `data/TEI/sample`;
+* a synthetic EAD file with `EAD_LETTERS` letters, generated with a fixed seed. The authority data of its
+  persons and places are put in the caches of the EAD reader beforehand, so that no request is sent to GND
+  or to the Gazetteer while it is parsed;
+* a stub Neo4j driver, which only collects the statements and their parameters.
+"""
+
+import json
+import os
+import random
+import shutil
+import sys
+from datetime import date
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for p in (REPO_ROOT, os.path.join(REPO_ROOT, "graph_db_imports")):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+GOLD_DIR = os.path.join(REPO_ROOT, "data/IOB_GOLD")
+TEI_SAMPLE = os.path.join(REPO_ROOT, "data/TEI/sample/Brief01vonBuchanBeausobre.xml")
+COLUMNS = ["words", "pos", "lemma", "textlayer", "chunk", "entityid"]
+
+PAGES_PER_VOLUME = 6
+EAD_LETTERS = 500
+EAD_SEED = 42
+
+
+def _gold_sample():
+    """The fileids of the sample of the gold corpus, as (training pages, test pages)"""
+    from letter_index import page_key
+
+    volumes = {}
+    for f in sorted((f for f in os.listdir(GOLD_DIR) if f.endswith(".iob")), key=page_key):
+        volumes.setdefault(page_key(f)[0], []).append(f)
+    train, test = [], []
+    for pages in volumes.values():
+        train.extend(pages[:PAGES_PER_VOLUME - 1])
+        test.append(pages[PAGES_PER_VOLUME - 1])
+    return train, test
+
+
+@pytest.fixture(scope="session")
+def gold_sample(tmp_path_factory):
+    """A folder with a copy of the sample of the gold corpus; returns (folder, training pages, test pages)"""
+    folder = tmp_path_factory.mktemp("iob_gold")
+    train, test = _gold_sample()
+    for f in train + test:
+        shutil.copy(os.path.join(GOLD_DIR, f), str(folder))
+    return str(folder), train, test
+
+
+@pytest.fixture(scope="session")
+def config_file(gold_sample, tmp_path_factory):
+    """A project configuration whose training corpus is the sample of the gold corpus"""
+    with open(os.path.join(REPO_ROOT, "lib/config/korr_main.json")) as f:
+        conf = json.load(f)
+    conf["project_root"] = REPO_ROOT + "/"
+    conf["root_training"] = gold_sample[0]
+    path = tmp_path_factory.mktemp("config").joinpath("korr_bench.json")
+    path.write_text(json.dumps(conf))
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def trainer(config_file, gold_sample):
+    """A `Trainer` with the training and test pages of the sample"""
+    import training as trn
+
+    _, train, test = gold_sample
+    t = trn.Trainer(config_file)
+    t.training = list(t._corpus.full_tagged_sents(fileids=train))
+    t.test = list(t._corpus.full_tagged_sents(fileids=test))
+    return t
+
+
+@pytest.fixture(scope="session")
+def featurized(trainer):
+    from templates import template1
+
+    trainer.set_feats_labels(template1)
+    return trainer
+
+
+@pytest.fixture(scope="session")
+def fitted(featurized):
+    featurized.fit()
+    return featurized
+
+
+@pytest.fixture(scope="session")
+def tei_text():
+    """The text of the body of the TEI sample"""
+    from lxml import etree
+    from tei_reader import ns
+
+    body = etree.parse(TEI_SAMPLE).find(".//tei:body", namespaces=ns)
+    return " ".join("".join(body.itertext()).split())
+
+
+NAMES = ["Gerhard, Eduard", "Braun, Emil", "Henzen, Wilhelm", "Brunn, Heinrich", "Mommsen, Theodor",
+         "Helbig, Wolfgang", "Lepsius, Richard", "Bunsen, Christian Karl Josias von", "Panofka, Theodor",
+         "Welcker, Friedrich Gottlieb", "Jahn, Otto", "Kestner, August"]
+PLACES = ["Rom", "Berlin", "Neapel", "Florenz", "Bonn", "Dresden", "Paris", "London", "Athen", "Leipzig"]
+
+
+def write_ead(path, letters=EAD_LETTERS, seed=EAD_SEED):
+    """
+    Writes a synthetic EAD file (in the format of the Kalliope exports) and returns the authority data
+    of its persons {gnd: (birth, death)} and places {gnd: (gazetteer id, lat, lng)}
+    """
+    from xml.sax.saxutils import escape, quoteattr
+
+    rnd = random.Random(seed)
+    persons = {"1{:08d}".format(i): name for i, name in enumerate(NAMES)}
+    places = {"4{:07d}".format(i): name for i, name in enumerate(PLACES)}
+    items = []
+    for n in range(letters):
+        gnds = rnd.sample(sorted(persons), 4)
+        place = rnd.choice(sorted(places))
+        year, month, day = rnd.randint(1829, 1885), rnd.randint(1, 12), rnd.randint(1, 28)
+        unitdate = "{}{:02d}{:02d}".format(year, month, day) if n % 5 else "{}-{:02d}".format(year, month)
+        access = "".join('<persname role={} source="GND" authfilenumber="{}" normal={}>{}</persname>'.format(
+            quoteattr(role), gnd, quoteattr(persons[gnd]), escape(persons[gnd]))
+            for role, gnd in zip(["Verfasser", "Adressat", "Erwähnt", "Behandelt"], gnds))
+        access += '<geogname role="Entstehungsort" source="GND" authfilenumber="{0}" normal="{1}">{1}</geogname>'.format(
+            place, places[place])
+        items.append("""
+      <c level="item" id="DE-Benchmark-{n}">
+        <did>
+          <unittitle>Brief von {author} an {addressee}</unittitle>
+          <unitdate label="Entstehungsdatum" normal="{unitdate}">{unitdate}</unitdate>
+          <langmaterial><language langcode="ger"/></langmaterial>
+          <physdesc label="Angaben zum Material"><extent label="Umfang">{pages} Bl.</extent></physdesc>
+          <note label="Bemerkung"><p>Empfängerort: {reception}</p></note>
+          <dao xlink:href="https://kalliope-verbund.info/DE-Benchmark-{n}/scan" xlink:title="Digitalisat"/>
+          <dao xlink:href="https://kalliope-verbund.info/DE-Benchmark-{n}/beilage" xlink:title="Beilage"/>
+        </did>
+        <scopecontent><head>Inhaltsangabe</head><p>Synthetic letter {n}.</p></scopecontent>
+        <controlaccess>{access}</controlaccess>
+      </c>""".format(n=n, author=escape(persons[gnds[0]]), addressee=escape(persons[gnds[1]]), unitdate=unitdate,
+                     pages=rnd.randint(1, 8), reception=rnd.choice(PLACES), access=access))
+    with open(path, "w", encoding="utf-8") as out:
+        out.write("""<?xml version="1.0" encoding="UTF-8"?>
+<ead xmlns="urn:isbn:1-931666-22-9" xmlns:xlink="http://www.w3.org/1999/xlink">
+  <archdesc level="collection">
+    <did><repository><corpname authfilenumber="DE-Benchmark">Benchmark</corpname></repository></did>
+    <dsc>{}
+    </dsc>
+  </archdesc>
+</ead>
+""".format("".join(items)))
+    authority_persons = {gnd: (date(1780 + i, 1, 1), date(1850 + i, 12, 31)) for i, gnd in enumerate(sorted(persons))}
+    authority_places = {gnd: ("2{:06d}".format(i), 41.9 + i, 12.5 + i) for i, gnd in enumerate(sorted(places))}
+    return authority_persons, authority_places
+
+
+@pytest.fixture(scope="session")
+def ead_file(tmp_path_factory):
+    """The synthetic EAD file; the caches of the EAD reader are filled with its authority data"""
+    main = pytest.importorskip("ead_reader.main")
+    places = pytest.importorskip("ead_reader.places")
+
+    path = str(tmp_path_factory.mktemp("ead").joinpath("ead_benchmark.xml"))
+    persons, gnd_places = write_ead(path)
+    main.gnd_biographical_person_data_dict.update(persons)
+    places.gnd_to_gazetteer_mapping.update(gnd_places)
+    return path
+
+
+class StubTransaction:
+    def __init__(self, driver):
+        self._driver = driver
+
+    def run(self, statement, parameters=None):
+        self._driver.statements.append((statement, parameters))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class StubSession(StubTransaction):
+    def begin_transaction(self):
+        return StubTransaction(self._driver)
+
+
+class StubDriver:
+    """Stands in for `neo4j.v1.Driver`: the statements are collected instead of being sent to the database"""
+
+    def __init__(self):
+        self.statements = []
+
+    def session(self):
+        return StubSession(self)
+
+
+@pytest.fixture
+def stub_driver():
+    return StubDriver()
@@ -5,6 +5,7 @@ Copyright 2010,2011 Naoaki Okazaki.
 
 import optparse
 import sys
+from sys import intern
 
 def apply_templates(X, templates):
     """
@@ -32,7 +33,8 @@ def apply_templates(X, templates):
                     break
                 values.append(X[p][field])
             if values:
-                X[t]['F'][name] = '|'.join(values)
+                # single values are shared with the item; joined ones are interned, since they repeat a lot
+                X[t]['F'][name] = values[0] if len(values) == 1 else intern('|'.join(values))
 
 def readiter(fi, names, sep=' '):
     """
@@ -0,0 +1,76 @@
+"""
+Normalization of the dates of the letters (e.g. the DATEletter entities) to ISO format.
+
+Dates are matched with a single precompiled regex over a table of month names (German,
+Italian and French, full and abbreviated), so that the result does not depend on the
+locale of the machine. The grammar covers the formats that were parsed with `strptime`
+under the `de_DE` locale::
+
+    "%d %B %Y", "%d . %B %Y", "%d %B , %Y", "%d . %B , %Y", "%d.%B %Y", "%d.%B.%Y", "%B %Y"
+
+plus the same formats with Italian/French, abbreviated or Roman numeral month names
+(e.g. "23 Luglio 1835", "4 . Aug. 1851", "7/XI/1847"). Dates without a day are normalized to the first day of the month.
+"""
+
+import re
+from datetime import date
+
+_MONTH_NAMES = {
+    1: ["januar", "jänner", "jan", "gennaio", "genn", "janvier", "janv"],
+    2: ["februar", "feber", "febr", "feb", "febbraio", "febbr", "février", "fevrier", "févr", "fevr"],
+    3: ["märz", "maerz", "mart", "marzo", "mars"],
+    4: ["april", "apr", "aprile", "avril", "avr"],
+    5: ["mai", "maggio", "magg"],
+    6: ["juni", "jun", "giugno", "giu", "juin"],
+    7: ["juli", "jul", "luglio", "lug", "juillet", "juil"],
+    8: ["august", "aug", "agosto", "ago", "août", "aout"],
+    9: ["september", "sept", "sep", "settembre", "sett", "set", "septembre"],
+    10: ["oktober", "october", "okt", "oct", "ottobre", "ott", "octobre"],
+    11: ["november", "nov", "novembre"],
+    12: ["dezember", "december", "dez", "dec", "dicembre", "dic", "décembre", "decembre", "déc"],
+}
+
+_ROMAN = ["i", "ii", "iii", "iv", "v", "vi", "vii", "viii", "ix", "x", "xi", "xii"]
+
+# lower-cased month name (or Roman numeral) -> month number
+MONTHS = {name: n for n, names in _MONTH_NAMES.items() for name in names}
+MONTHS.update((r, n) for n, r in enumerate(_ROMAN, 1))
+
+DATE_PATTERN = re.compile(
+    r"^\s*(?:(?P<day>\d{1,2})\s*[./]?\s*)?"
+    r"(?P<month>" + "|".join(sorted(map(re.escape, MONTHS), key=len, reverse=True)) + r")\b\.?"
+    r"\s*[.,/]?\s*(?P<year>\d{4})\s*$",
+    re.IGNORECASE)
+
+
+def parse_date(text):
+    """
+    Parses a date; returns a `datetime.date`, or None if the text is not a (valid) date
+
+    >>> parse_date("23 . Juli 1835")
+    datetime.date(1835, 7, 23)
+    >>> parse_date("Luglio 1835")
+    datetime.date(1835, 7, 1)
+    >>> parse_date("31 . Februar 1835") is None
+    True
+    """
+    m = DATE_PATTERN.match(text)
+    if m is None:
+        return None
+    try:
+        return date(int(m.group("year")), MONTHS[m.group("month").lower()], int(m.group("day") or 1))
+    except ValueError:
+        return None
+
+
+def normalize_date(text):
+    """
+    Returns the date in ISO format (YYYY-MM-DD), or None
+
+    >>> normalize_date("4.Aug.1851")
+    '1851-08-04'
+    >>> normalize_date("7 / XI / 1847")
+    '1847-11-07'
+    """
+    d = parse_date(text)
+    return d.isoformat() if d is not None else None
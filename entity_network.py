@@ -0,0 +1,207 @@
+"""
+Network of the entities co-occurring in the letters of the annotated corpus.
+
+The pages (TSV files written by the annotation scripts, or the IOB files of the gold corpus) are read
+in parallel: every worker decodes the BIO tags of a page into entity mentions (type and text), and
+the mentions are assigned to letters with the `LetterIndex` of the page folder. Two entities are
+linked if they are mentioned in the same letter; the weight of a link is the number of letters
+where they co-occur. Only the sets of entities of the letters being read and the counts are kept in
+memory. The network is written as an edge list (CSV, as imported by Gephi) or as GEXF.
+
+Usage:
+    entity_network.py [options] <folder>...
+
+Options:
+    -o FILE --out=FILE          Output file: GEXF if it ends with .gexf, else CSV edge list [default: network.gexf]
+    -l LABELS --labels=LABELS   Comma-separated entity types (e.g. PERauthor,PERaddressee,PLACEfrom) (default: all)
+    -w N --min-weight=N         Drop the links found in less than N letters [default: 1]
+    -j N --jobs=N               Number of processes (default: number of CPUs)
+"""
+
+import csv
+import logging
+import os
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from xml.sax.saxutils import quoteattr
+
+logger = logging.getLogger(__name__)
+
+# pages read by a worker task
+PAGES_PER_TASK = 16
+
+
+def decode_spans(tags):
+    """
+    Decodes a list of BIO tags into spans (label, start, end); an I- tag that does not continue
+    an entity of the same label opens a new one (as in nltk's conlltags2tree)
+
+    >>> decode_spans(["B-PERauthor", "O", "B-DATEletter", "I-DATEletter", "I-PLACEfrom"])
+    [('PERauthor', 0, 1), ('DATEletter', 2, 4), ('PLACEfrom', 4, 5)]
+    """
+    spans = []
+    label, start = None, 0
+    for i, tag in enumerate(tags):
+        if tag.startswith("I-") and tag[2:] == label:
+            continue
+        if label is not None:
+            spans.append((label, start, i))
+        label, start = (tag[2:], i) if tag[:2] in ("B-", "I-") else (None, i)
+    if label is not None:
+        spans.append((label, start, len(tags)))
+    return spans
+
+
+def page_mentions(path, labels=None):
+    """
+    The entity mentions of a page
+
+    :param path: path to a TSV or IOB page file
+    :param labels: entity types to keep (None: all)
+    :return: list of tuples (sentence, token, label, text)
+    """
+    from korr_corpusreader import read_tagged_page
+
+    mentions = []
+    for s, sent in enumerate(read_tagged_page(path)):
+        for label, start, end in decode_spans([tok[-1] for tok in sent]):
+            if labels is None or label in labels:
+                mentions.append((s, start, label, " ".join(tok[0] for tok in sent[start:end])))
+    return mentions
+
+
+def _pages_mentions(paths, labels):
+    return [page_mentions(path, labels) for path in paths]
+
+
+def _iter_mentions(pool, paths, labels, tasks):
+    """
+    The mentions of the pages, in order, read by the pool with at most `tasks` tasks
+    submitted (or done) and not yet read
+    """
+    pending = deque()
+    for i in range(0, len(paths), PAGES_PER_TASK):
+        pending.append(pool.submit(_pages_mentions, paths[i:i + PAGES_PER_TASK], labels))
+        if len(pending) >= tasks:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+def _corpus(folder):
+    from korr_corpusreader import KorrIOBCorpusReader, KorrTSVCorpusReader
+
+    if any(f.endswith(".tsv") for f in os.listdir(folder)):
+        return KorrTSVCorpusReader(folder)
+    return KorrIOBCorpusReader(folder, r".*\.iob", columntypes=["words", "pos", "lemma", "textlayer", "chunk",
+                                                                 "entityid"])
+
+
+class EntityNetwork:
+    """
+    Co-occurrence counts of the entities of the letters.
+
+    Entities are tuples (label, text); `nodes` counts their mentions, `edges` the letters where
+    two entities co-occur (keys are sorted pairs of entities).
+    """
+
+    def __init__(self):
+        self.nodes = Counter()
+        self.edges = Counter()
+        self.letters = 0
+
+    def add_letter(self, mentions):
+        """Adds the entities (label, text) mentioned in a letter"""
+        self.letters += 1
+        self.nodes.update(mentions)
+        for pair in combinations(sorted(set(mentions)), 2):
+            self.edges[pair] += 1
+
+    def add_folder(self, folder, labels=None, jobs=None, index_path=None):
+        """
+        Reads the pages of a folder (in parallel) and adds its letters
+
+        :param folder: folder with TSV or IOB page files
+        :param labels: entity types to keep (None: all)
+        :param index_path: where the letter index of the folder is stored (default: in the folder)
+        """
+        from letter_index import LetterIndex, Position, page_key
+
+        corpus = _corpus(folder)
+        index = LetterIndex.for_corpus(corpus, index_path)
+        fileids = sorted(corpus.fileids(), key=page_key)
+        letter, mentions = None, []
+        workers = jobs or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            paths = [os.path.join(folder, f) for f in fileids]
+            # pages come back in order and the workers are at most two tasks per worker ahead,
+            # so that only the letter being read and a fixed number of pages are kept in memory
+            for fileid, page in zip(fileids, _iter_mentions(pool, paths, labels, 2 * workers)):
+                for s, t, label, text in page:
+                    l = index.letter_at(Position(fileid, s, t))
+                    if l is None:
+                        continue
+                    if l.id != letter:
+                        if mentions:
+                            self.add_letter(mentions)
+                        letter, mentions = l.id, []
+                    mentions.append((label, text))
+        if mentions:
+            self.add_letter(mentions)
+        logger.info("{}: {} letters, {} entities, {} links".format(folder, self.letters, len(self.nodes),
+                                                                  len(self.edges)))
+        return self
+
+    @staticmethod
+    def node_id(entity):
+        return "{}:{}".format(*entity)
+
+    def write_csv(self, path, min_weight=1):
+        """Writes the edge list (Source, Target, Weight, Type) as CSV"""
+        with open(path, "w", newline="") as out:
+            writer = csv.writer(out)
+            writer.writerow(["Source", "Target", "Weight", "Type"])
+            for (a, b), w in self.edges.most_common():
+                if w < min_weight:
+                    break
+                writer.writerow([self.node_id(a), self.node_id(b), w, "Undirected"])
+
+    def write_gexf(self, path, min_weight=1):
+        """Writes the network as GEXF 1.2 (nodes have the entity type and the number of mentions)"""
+        edges = [(pair, w) for pair, w in self.edges.items() if w >= min_weight]
+        nodes = sorted({e for pair, _ in edges for e in pair} if min_weight > 1 else self.nodes)
+        with open(path, "w", encoding="utf-8") as out:
+            out.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                      '<gexf xmlns="http://www.gexf.net/1.2draft" version="1.2">\n'
+                      '<graph defaultedgetype="undirected" mode="static">\n'
+                      '<attributes class="node">'
+                      '<attribute id="0" title="type" type="string"/>'
+                      '<attribute id="1" title="mentions" type="integer"/></attributes>\n<nodes>\n')
+            for e in nodes:
+                out.write('<node id={} label={}><attvalues><attvalue for="0" value={}/>'
+                          '<attvalue for="1" value="{}"/></attvalues></node>\n'.format(
+                              quoteattr(self.node_id(e)), quoteattr(e[1]), quoteattr(e[0]), self.nodes[e]))
+            out.write('</nodes>\n<edges>\n')
+            for n, ((a, b), w) in enumerate(edges):
+                out.write('<edge id="{}" source={} target={} weight="{}"/>\n'.format(
+                    n, quoteattr(self.node_id(a)), quoteattr(self.node_id(b)), w))
+            out.write('</edges>\n</graph>\n</gexf>\n')
+
+    def write(self, path, min_weight=1):
+        if path.endswith(".gexf"):
+            self.write_gexf(path, min_weight)
+        else:
+            self.write_csv(path, min_weight)
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    logging.basicConfig(level=logging.INFO)
+    args = docopt(__doc__)
+    labels = set(args["--labels"].split(",")) if args["--labels"] else None
+    network = EntityNetwork()
+    for folder in args["<folder>"]:
+        network.add_folder(folder, labels=labels, jobs=int(args["--jobs"]) if args["--jobs"] else None)
+    network.write(args["--out"], min_weight=int(args["--min-weight"]))
@@ -0,0 +1,264 @@
+"""
+Evaluation of the predictions of a sequence labeller (token and entity level).
+
+The gold and predicted labels (lists of sentences, as `y_test` and `crf.predict(X_test)`) are encoded
+once as integer NumPy arrays; all the scores are then computed with array operations:
+
+* token level: confusion matrix, precision/recall/F1 of every label and their micro, macro and weighted
+  averages (`flat_f1_score` gives the same results as the function of `sklearn_crfsuite.metrics`, so that
+  it can be used as scorer of a hyperparameter search);
+* span level (entities decoded from the BIO tags, as in `entity_network.decode_spans`): exact matches
+  (same type and boundaries) and partial matches (same type and at least one token in common);
+* bootstrap confidence intervals of the weighted token F1 and of the exact span F1, by resampling the
+  sentences; the replicates are split among processes.
+
+>>> ev = Evaluation([["B-PER", "I-PER", "O"], ["B-LOC"]], [["B-PER", "O", "O"], ["B-LOC"]])
+>>> round(ev.flat_f1(), 3)
+0.667
+>>> ev.span_scores()["exact"]["f1"], ev.span_scores()["partial"]["f1"]
+(0.5, 1.0)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+import numpy as np
+
+# number of bootstrap replicates drawn at once (the weights of a chunk are a chunk x sentences matrix)
+BOOTSTRAP_CHUNK = 100
+
+
+def _prf(tp, n_pred, n_gold):
+    """Precision, recall and F1 arrays (0 where undefined, as in scikit-learn)"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = np.where(n_pred > 0, tp / np.maximum(n_pred, 1), 0.0)
+        r = np.where(n_gold > 0, tp / np.maximum(n_gold, 1), 0.0)
+        f = np.where(p + r > 0, 2 * p * r / np.where(p + r > 0, p + r, 1), 0.0)
+    return p, r, f
+
+
+def _span_prf(tp_pred, n_pred, tp_gold, n_gold):
+    """Like `_prf`, with the matches counted separately among the predicted and the gold spans"""
+    p = _prf(tp_pred, n_pred, n_gold)[0]
+    r = _prf(tp_gold, n_pred, n_gold)[1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f = np.where(p + r > 0, 2 * p * r / np.where(p + r > 0, p + r, 1), 0.0)
+    return p, r, f
+
+
+def _weighted_f1(tp, n_pred, n_gold):
+    """Support-weighted F1 over the last axis (works on a batch of count vectors)"""
+    f = _prf(tp, n_pred, n_gold)[2]
+    support = n_gold.sum(axis=-1)
+    return np.where(support > 0, (f * n_gold).sum(axis=-1) / np.maximum(support, 1), 0.0)
+
+
+def _micro_f1(tp, n_pred, n_gold):
+    return _prf(tp.sum(axis=-1), n_pred.sum(axis=-1), n_gold.sum(axis=-1))[2]
+
+
+class Evaluation:
+    """
+    :param y_true: gold labels (list of sentences, i.e. of lists of labels)
+    :param y_pred: predicted labels, with the same shape
+    :param labels: the labels that are scored (default: all but 'O')
+    """
+
+    def __init__(self, y_true, y_pred, labels=None):
+        lengths = np.fromiter(map(len, y_true), dtype=np.int64, count=len(y_true))
+        if len(y_pred) != len(y_true) or not np.array_equal(
+                lengths, np.fromiter(map(len, y_pred), dtype=np.int64, count=len(y_pred))):
+            raise ValueError("The gold and predicted labels do not have the same shape")
+        n = int(lengths.sum())
+        flat = np.array(list(chain(chain.from_iterable(y_true), chain.from_iterable(y_pred))), dtype=str)
+        self.classes, codes = np.unique(flat, return_inverse=True)
+        self.gold, self.pred = codes[:n].astype(np.int64), codes[n:].astype(np.int64)
+        self.n_sents = len(lengths)
+        self.sent = np.repeat(np.arange(self.n_sents), lengths)
+        self.sent_start = np.zeros(n, dtype=bool)
+        self.sent_start[(np.cumsum(lengths) - lengths)[lengths > 0]] = True
+        if labels is None:
+            labels = [c for c in self.classes if c != "O"]
+        self.labels = list(labels)
+        index = {c: i for i, c in enumerate(self.classes)}
+        # labels that never occur have no code: they are scored with 0 counts
+        self._label_codes = np.array([index.get(l, -1) for l in self.labels], dtype=np.int64)
+        self._types, self._class_type, self._class_begin = self._entity_types()
+
+    # token level
+
+    def confusion_matrix(self):
+        """Matrix (gold x predicted) of the counts over `self.classes`"""
+        k = len(self.classes)
+        return np.bincount(self.gold * k + self.pred, minlength=k * k).reshape(k, k)
+
+    def _token_counts(self, cm=None):
+        cm = self.confusion_matrix() if cm is None else cm
+        codes = self._label_codes
+        known = codes >= 0
+        tp, n_pred, n_gold = (np.zeros(len(codes), dtype=np.int64) for _ in range(3))
+        tp[known] = cm[codes[known], codes[known]]
+        n_pred[known] = cm.sum(axis=0)[codes[known]]
+        n_gold[known] = cm.sum(axis=1)[codes[known]]
+        return tp, n_pred, n_gold
+
+    def token_scores(self):
+        """Precision, recall, F1 and support of every label, plus the micro, macro and weighted averages"""
+        tp, n_pred, n_gold = self._token_counts()
+        p, r, f = _prf(tp, n_pred, n_gold)
+        scores = {l: {"precision": p[i], "recall": r[i], "f1": f[i], "support": int(n_gold[i])}
+                  for i, l in enumerate(self.labels)}
+        support = int(n_gold.sum())
+        mp, mr, mf = _prf(tp.sum(), n_pred.sum(), n_gold.sum())
+        scores["micro avg"] = {"precision": float(mp), "recall": float(mr), "f1": float(mf), "support": support}
+        scores["macro avg"] = {"precision": p.mean(), "recall": r.mean(), "f1": f.mean(), "support": support}
+        w = n_gold / support if support else np.zeros(len(n_gold))
+        scores["weighted avg"] = {"precision": (p * w).sum(), "recall": (r * w).sum(), "f1": (f * w).sum(),
+                                  "support": support}
+        return {k: {m: float(v) if m != "support" else v for m, v in s.items()} for k, s in scores.items()}
+
+    def flat_f1(self, average="weighted"):
+        """F1 over the scored labels: `average` is 'weighted', 'micro' or 'macro'"""
+        return self.token_scores()["{} avg".format(average)]["f1"]
+
+    def report(self, labels=None, digits=3):
+        """Text report of the token scores (in the format of `sklearn.metrics.classification_report`)"""
+        scores = self.token_scores()
+        labels = labels or self.labels
+        width = max(len(l) for l in list(labels) + ["weighted avg"])
+        head = ("{:>{w}s} " + " {:>9s}" * 4 + "\n\n").format("", "precision", "recall", "f1-score", "support",
+                                                            w=width)
+        row = "{:>{w}s} " + " {:>9.{d}f}" * 3 + " {:>9d}\n"
+        lines = [row.format(l, scores[l]["precision"], scores[l]["recall"], scores[l]["f1"], scores[l]["support"],
+                            w=width, d=digits) for l in labels]
+        lines.append("\n")
+        lines.extend(row.format(a, scores[a]["precision"], scores[a]["recall"], scores[a]["f1"], scores[a]["support"],
+                                w=width, d=digits) for a in ("micro avg", "macro avg", "weighted avg"))
+        return head + "".join(lines)
+
+    # span level
+
+    def _entity_types(self):
+        """Entity types of the classes: (types, type code of every class (0: outside), is a B- class)"""
+        types = ["O"]
+        class_type = np.zeros(len(self.classes), dtype=np.int64)
+        class_begin = np.zeros(len(self.classes), dtype=bool)
+        for i, c in enumerate(self.classes):
+            if c[:2] in ("B-", "I-"):
+                if c[2:] not in types:
+                    types.append(c[2:])
+                class_type[i] = types.index(c[2:])
+                class_begin[i] = c.startswith("B-")
+        return types, class_type, class_begin
+
+    def _spans(self, codes):
+        """Spans of a label sequence: (span id of every token (-1: outside), starts, ends, types)"""
+        types = self._class_type[codes]
+        prev = np.concatenate(([0], types[:-1]))
+        begin = (types > 0) & (self._class_begin[codes] | (prev != types) | self.sent_start)
+        ids = np.where(types > 0, np.cumsum(begin) - 1, -1)
+        starts = np.flatnonzero(begin)
+        ends = starts + np.bincount(ids[ids >= 0], minlength=len(starts))
+        return ids, starts, ends, types[starts]
+
+    def _span_counts(self):
+        """Per sentence and entity type: exact and partial matches of the gold and predicted spans, and counts"""
+        n_types = len(self._types)
+        g_ids, g_starts, g_ends, g_types = self._spans(self.gold)
+        p_ids, p_starts, p_ends, p_types = self._spans(self.pred)
+        size = len(self.gold) + 1
+        g_keys = (g_starts * size + g_ends) * n_types + g_types
+        p_keys = (p_starts * size + p_ends) * n_types + p_types
+        exact = np.isin(g_keys, p_keys, assume_unique=True)
+        # tokens inside a gold and a predicted span of the same type
+        both = (g_ids >= 0) & (p_ids >= 0) & (self._class_type[self.gold] == self._class_type[self.pred])
+        g_partial = np.zeros(len(g_starts), dtype=bool)
+        g_partial[g_ids[both]] = True
+        p_partial = np.zeros(len(p_starts), dtype=bool)
+        p_partial[p_ids[both]] = True
+
+        def per_sent(starts, types, mask=None):
+            keys = self.sent[starts] * n_types + types
+            if mask is not None:
+                keys = keys[mask]
+            return np.bincount(keys, minlength=self.n_sents * n_types).reshape(self.n_sents, n_types)
+
+        return {"gold": per_sent(g_starts, g_types), "pred": per_sent(p_starts, p_types),
+                "exact": per_sent(g_starts, g_types, exact),
+                "partial_gold": per_sent(g_starts, g_types, g_partial),
+                "partial_pred": per_sent(p_starts, p_types, p_partial)}
+
+    def span_scores(self):
+        """Precision, recall and F1 of the entities (exact and partial matches), overall and by type"""
+        counts = {k: v.sum(axis=0) for k, v in self._span_counts().items()}
+        scores = {}
+        # a partial match is counted once on each side, even if it overlaps several spans
+        for match, tp_gold, tp_pred in (("exact", "exact", "exact"), ("partial", "partial_gold", "partial_pred")):
+            p, r, f = _span_prf(counts[tp_pred], counts["pred"], counts[tp_gold], counts["gold"])
+            mp, mr, mf = _span_prf(counts[tp_pred].sum(), counts["pred"].sum(), counts[tp_gold].sum(),
+                                   counts["gold"].sum())
+            scores[match] = {"precision": float(mp), "recall": float(mr), "f1": float(mf),
+                             "types": {t: {"precision": float(p[i]), "recall": float(r[i]), "f1": float(f[i]),
+                                           "support": int(counts["gold"][i])}
+                                       for i, t in enumerate(self._types) if i > 0}}
+        return scores
+
+    # bootstrap
+
+    def _sentence_stats(self):
+        """Matrix (sentences x statistics) of the counts the bootstrapped scores are computed from"""
+        k = len(self.labels)
+        codes = np.full(len(self.classes) + 1, -1, dtype=np.int64)
+        known = self._label_codes >= 0
+        codes[self._label_codes[known]] = np.flatnonzero(known)
+
+        def per_sent(label_idx, mask):
+            keys = self.sent[mask] * k + label_idx[mask]
+            return np.bincount(keys, minlength=self.n_sents * k).reshape(self.n_sents, k)
+
+        g, p = codes[self.gold], codes[self.pred]
+        tokens = [per_sent(g, (g >= 0) & (self.gold == self.pred)), per_sent(p, p >= 0), per_sent(g, g >= 0)]
+        spans = self._span_counts()
+        span_stats = np.stack([spans["exact"].sum(axis=1), spans["pred"].sum(axis=1), spans["gold"].sum(axis=1)],
+                              axis=1)
+        return np.hstack(tokens + [span_stats]).astype(np.float64), k
+
+    def bootstrap(self, n=1000, alpha=0.05, jobs=None, seed=0):
+        """
+        Confidence intervals of the weighted token F1 and of the exact span F1 (percentile bootstrap over
+        the sentences)
+
+        :param n: number of replicates
+        :param alpha: 1 - confidence level
+        :param jobs: number of processes (default: number of CPUs; 1 computes them here)
+        :return: dict {score: (low, high)}
+        """
+        stats, k = self._sentence_stats()
+        # the replicates are drawn in chunks with their own seeds: the result does not depend on `jobs`
+        sizes = [min(BOOTSTRAP_CHUNK, n - i) for i in range(0, n, BOOTSTRAP_CHUNK)]
+        args = [(stats, k, size, s) for size, s in zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes)))]
+        if jobs == 1 or len(args) == 1:
+            results = [_bootstrap_scores(a) for a in args]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(_bootstrap_scores, args))
+        token_f1, span_f1 = (np.concatenate(r) for r in zip(*results))
+        q = [100 * alpha / 2, 100 * (1 - alpha / 2)]
+        return {"token_f1": tuple(float(v) for v in np.percentile(token_f1, q)),
+                "span_f1": tuple(float(v) for v in np.percentile(span_f1, q))}
+
+
+def _bootstrap_scores(args):
+    """Scores of `n` bootstrap replicates: every replicate weighs the sentences with multinomial counts"""
+    stats, k, n, seed = args
+    rng = np.random.default_rng(seed)
+    weights = rng.multinomial(len(stats), np.full(len(stats), 1 / len(stats)), size=n)
+    totals = weights @ stats
+    token_f1 = _weighted_f1(totals[:, :k], totals[:, k:2 * k], totals[:, 2 * k:3 * k])
+    span_f1 = _micro_f1(totals[:, 3 * k:3 * k + 1], totals[:, 3 * k + 1:3 * k + 2], totals[:, 3 * k + 2:])
+    return token_f1, span_f1
+
+
+def flat_f1_score(y_true, y_pred, labels=None, average="weighted"):
+    """Token F1 (drop-in replacement of `sklearn_crfsuite.metrics.flat_f1_score`, e.g. in `make_scorer`)"""
+    return Evaluation(y_true, y_pred, labels).flat_f1(average)
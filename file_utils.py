@@ -0,0 +1,32 @@
+"""
+Atomic writes: a file is written next to its destination under a temporary name, then renamed,
+so that readers (and the incremental builds that compare the outputs) never see half-written files.
+"""
+
+import os
+import uuid
+
+
+def write_atomic(path, data, encoding=None):
+    """
+    Writes a text (or bytes) to `path` atomically. The file gets the usual mode of new files
+    (0666 minus the umask) and the temporary file is removed if the write fails.
+
+    :param path: destination
+    :param data: str or bytes
+    :param encoding: encoding of a text (default: that of `open`)
+    """
+    tmp = os.path.join(os.path.dirname(path) or ".", ".tmp-" + uuid.uuid4().hex)
+    # created by open(), which applies the umask (unlike mkstemp, that always creates it with mode 0600)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        if isinstance(data, bytes):
+            with os.fdopen(fd, "wb") as out:
+                out.write(data)
+        else:
+            with os.fdopen(fd, "w", encoding=encoding) as out:
+                out.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
@@ -1,9 +1,15 @@
 from datetime import date
 from enum import Enum
-from typing import List
+from typing import Dict, List, Tuple
 
 
 class Place:
+    """A place; places with the same name and authority id are equal (see `interned`)."""
+
+    __slots__ = ('name', 'name_presumed', 'auth_source', 'auth_id', 'auth_name', 'auth_lat', 'auth_lng', '_hash')
+
+    # the shared instances, by (name, auth_source, auth_id)
+    registry: Dict[Tuple[str, str, str], 'Place'] = {}
 
     def __init__(self,
                  name: str,
@@ -21,14 +27,36 @@ class Place:
         self.auth_name: str = auth_name
         self.auth_lat: float = auth_lat
         self.auth_lng: float = auth_lng
+        # name, auth_source and auth_id must not change afterwards
+        self._hash: int = hash((name, auth_source, auth_id))
+
+    @classmethod
+    def interned(cls,
+                 name: str,
+                 name_presumed: bool,
+                 auth_source: str = None,
+                 auth_id: str = None,
+                 auth_name: str = None,
+                 auth_lat: float = None,
+                 auth_lng: float = None) -> 'Place':
+        """The shared instance of a place: a new one the first time, afterwards the instance of the first
+        occurrence (with its other attributes)."""
+        key: Tuple[str, str, str] = (name, auth_source, auth_id)
+        place: Place = cls.registry.get(key)
+        if place is None:
+            place = cls.registry.setdefault(
+                key, cls(name, name_presumed, auth_source, auth_id, auth_name, auth_lat, auth_lng))
+        return place
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, type(self)):
             return NotImplemented
         return self.name == other.name and self.auth_source == other.auth_source and self.auth_id == other.auth_id
 
     def __hash__(self):
-        return hash((self.name, self.auth_source, self.auth_id))
+        return self._hash
 
     def __str__(self):
         return str(dict({
@@ -43,6 +71,13 @@ class Place:
 
 
 class Person:
+    """A person or corporation; persons with the same name and authority id are equal (see `interned`)."""
+
+    __slots__ = ('name', 'name_presumed', 'is_corporation', 'auth_source', 'auth_id', 'auth_name', 'auth_first_name',
+                 'auth_last_name', 'auth_birth_date', 'auth_death_date', '_hash')
+
+    # the shared instances, by (name, auth_source, auth_id)
+    registry: Dict[Tuple[str, str, str], 'Person'] = {}
 
     def __init__(self,
                  name: str,
@@ -66,14 +101,40 @@ class Person:
         self.auth_last_name: str = auth_last_name
         self.auth_birth_date: date = auth_birth_date
         self.auth_death_date: date = auth_death_date
+        # name, auth_source and auth_id must not change afterwards
+        self._hash: int = hash((name, auth_source, auth_id))
+
+    @classmethod
+    def interned(cls,
+                 name: str,
+                 name_presumed: bool,
+                 is_corporation: bool,
+                 auth_source: str = None,
+                 auth_id: str = None,
+                 auth_name: str = None,
+                 auth_first_name: str = None,
+                 auth_last_name: str = None,
+                 auth_birth_date: date = None,
+                 auth_death_date: date = None) -> 'Person':
+        """The shared instance of a person: a new one the first time, afterwards the instance of the first
+        occurrence (with its other attributes)."""
+        key: Tuple[str, str, str] = (name, auth_source, auth_id)
+        person: Person = cls.registry.get(key)
+        if person is None:
+            person = cls.registry.setdefault(
+                key, cls(name, name_presumed, is_corporation, auth_source, auth_id, auth_name, auth_first_name,
+                         auth_last_name, auth_birth_date, auth_death_date))
+        return person
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, type(self)):
             return NotImplemented
         return self.name == other.name and self.auth_source == other.auth_source and self.auth_id == other.auth_id
 
     def __hash__(self):
-        return hash((self.name, self.auth_source, self.auth_id))
+        return self._hash
 
     def __str__(self):
         return str(dict({
@@ -98,18 +159,23 @@ class ContentType(Enum):
 
 class DigitalArchivalObject:
 
+    __slots__ = ('url', 'content_type', 'title', '_hash')
+
     def __init__(self, url: str, content_type: ContentType, title: str):
         self.url: str = url
         self.content_type: ContentType = content_type
         self.title: str = title
+        self._hash: int = hash((url, content_type, title))
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, type(self)):
             return NotImplemented
         return self.url == other.url and self.content_type == other.content_type and self.title == other.title
 
     def __hash__(self):
-        return hash((self.url, self.content_type, self.title))
+        return self._hash
 
     def __str__(self):
         return str(dict({'dao_url': self.url, 'content_type': self.content_type, 'dao_title': self.title}))
@@ -117,6 +183,10 @@ class DigitalArchivalObject:
 
 class Letter:
 
+    __slots__ = ('kalliope_id', 'archive_id', 'title', 'language_codes', 'origin_date_from', 'origin_date_till',
+                 'origin_date_presumed', 'extent', 'digital_archival_objects', 'arachne_id', 'authors', 'recipients',
+                 'mentioned_persons', 'origin_places', 'reception_place', 'summary_paragraphs')
+
     def __init__(self,
                  kalliope_id: str,
                  archive_id: str,
@@ -171,3 +241,9 @@ class Letter:
             'reception_place': self.reception_place,
             'summary': self.summary_paragraphs
         }))
+
+
+def clear_registries() -> None:
+    """Forgets the shared places and persons (e.g. before importing another, unrelated set of files)."""
+    Place.registry.clear()
+    Person.registry.clear()
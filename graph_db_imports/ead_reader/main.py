@@ -1,17 +1,22 @@
 import calendar
+import copy
 import logging
 import sys
 import re
+import time
 import requests
 import ead_reader.places as places
+import gnd_index
 
 from config import *
 from data_structures import *
 from datetime import date
 from lxml import etree
-from typing import Tuple, Dict, Match, Pattern, Any
+from metrics import metrics
+from typing import Tuple, Dict, Iterator, Match, Pattern, Any
 from rdflib import Graph, URIRef, Literal
 from urllib.error import HTTPError
+from validation import report
 
 logging.basicConfig(format='%(asctime)s %(message)s')
 logger: logging.Logger = logging.getLogger(__name__)
@@ -21,17 +26,10 @@ PRESUMED_PERSON_IDENTIFIER: str = '[vermutlich]'
 ARCHIVE_SEQUENCE_PATTERN: Pattern = re.compile('http://arachne.uni-koeln.de/books/(.+)')
 
 gnd_biographical_person_data_dict: Dict[str, Tuple[date, date]] = {}
-person_name_differs_from_authority_name_log: List[Tuple[str, str, str]] = []
-person_without_gnd_authority_source_log: List[Tuple[str, str, str, str, str]] = []
-person_gnd_id_invalid_log: List[Tuple[str, str, str, str, str, str]] = []
-letter_origin_date_invalid_log: List[Tuple[str, str, str]] = []
 
 
 def _extract_persons(kalliope_id: str, person_xml_elements: List[etree.Element]) -> List[Person]:
     global gnd_biographical_person_data_dict
-    global person_name_differs_from_authority_name_log
-    global person_without_gnd_authority_source_log
-    global person_gnd_id_invalid_log
     persons: List[Person] = []
 
     for person_xml_element in person_xml_elements:
@@ -46,8 +44,9 @@ def _extract_persons(kalliope_id: str, person_xml_elements: List[etree.Element])
         gnd_date_of_birth: date = None
         gnd_date_of_death: date = None
 
-        if name != name_normal and (name, name_normal) not in person_name_differs_from_authority_name_log:
-            person_name_differs_from_authority_name_log.append((name, name_normal, kalliope_id))
+        if name != name_normal:
+            report.add('person_name_differs_from_authority_name', (name, name_normal, kalliope_id),
+                       key=(name, name_normal))
 
         if PRESUMED_PERSON_IDENTIFIER in name.lower():
             name_presumed = True
@@ -65,11 +64,10 @@ def _extract_persons(kalliope_id: str, person_xml_elements: List[etree.Element])
             is_corporation = True
 
         if auth_source != 'GND':
-            log_entry: Tuple[str, str, str, str, str] = (name, auth_source, auth_id, name_normal, kalliope_id)
-            if log_entry not in person_without_gnd_authority_source_log:
-                person_without_gnd_authority_source_log.append(log_entry)
+            report.add('person_without_gnd_authority_source', (name, auth_source, auth_id, name_normal, kalliope_id))
 
         if auth_source == 'GND':
+            metrics.cache('gnd_person', auth_id in gnd_biographical_person_data_dict)
             try:
                 gnd_date_of_birth, gnd_date_of_death = gnd_biographical_person_data_dict[auth_id]
 
@@ -82,21 +80,19 @@ def _extract_persons(kalliope_id: str, person_xml_elements: List[etree.Element])
                     logger.error(f'_fetch_gnd_biographical_data: Got {error.code} for {error.url}. kalliope id: {kalliope_id}')
 
                     if error.code == 404:
-                        log_entry: Tuple[str, str, str, str, str] = (name, auth_source, auth_id, name_normal, error.url, kalliope_id)
-
-                        if log_entry not in person_gnd_id_invalid_log:
-                            person_gnd_id_invalid_log.append(log_entry)
-
-        person = Person(name,
-                        name_presumed,
-                        is_corporation,
-                        auth_source=auth_source,
-                        auth_id=auth_id,
-                        auth_name=name_normal,
-                        auth_first_name=auth_first_name,
-                        auth_last_name=auth_last_name,
-                        auth_birth_date=gnd_date_of_birth,
-                        auth_death_date=gnd_date_of_death)
+                        report.add('person_gnd_id_invalid',
+                                   (name, auth_source, auth_id, name_normal, error.url, kalliope_id))
+
+        person = Person.interned(name,
+                                 name_presumed,
+                                 is_corporation,
+                                 auth_source=auth_source,
+                                 auth_id=auth_id,
+                                 auth_name=name_normal,
+                                 auth_first_name=auth_first_name,
+                                 auth_last_name=auth_last_name,
+                                 auth_birth_date=gnd_date_of_birth,
+                                 auth_death_date=gnd_date_of_death)
         persons.append(person)
 
     return persons
@@ -112,8 +108,17 @@ def _fetch_gnd_biographical_person_data(kalliope_id: str, gnd_id: str) -> None:
     date_of_birth: date = None
     date_of_death: date = None
 
-    rdf_graph.load(url)
-    rdf_objects: List[Literal] = list(rdf_graph.objects(predicate=URIRef(date_of_birth_uri)))
+    entry: gnd_index.GndEntry = gnd_index.lookup(gnd_id)
+    if entry is None:
+        with metrics.request('d-nb.info'):
+            rdf_graph.load(url)
+        dates_of_birth: List[Literal] = list(rdf_graph.objects(predicate=URIRef(date_of_birth_uri)))
+        dates_of_death: List[Literal] = list(rdf_graph.objects(predicate=URIRef(date_of_death_uri)))
+    else:
+        dates_of_birth: List[str] = [entry.birth] if entry.birth else []
+        dates_of_death: List[str] = [entry.death] if entry.death else []
+
+    rdf_objects: List[Literal] = dates_of_birth
 
     if len(rdf_objects) == 1:
         rdf_date_of_birth: Literal = rdf_objects[0]
@@ -130,7 +135,7 @@ def _fetch_gnd_biographical_person_data(kalliope_id: str, gnd_id: str) -> None:
     else:
         raise Exception(f'Found more than one date of birth for GND person {gnd_id}:\n{rdf_objects}, kalliope id: {kalliope_id}')
 
-    rdf_objects = list(rdf_graph.objects(predicate=URIRef(date_of_death_uri)))
+    rdf_objects = dates_of_death
 
     if len(rdf_objects) == 1:
         rdf_date_of_death: Literal = rdf_objects[0]
@@ -196,8 +201,9 @@ def _fetch_entity_id(archive_sequence: str) -> Any:     # -> str:
     json_entity_id = None
 
     try:
-        response: requests.Response = requests.get(url=url)
-        response.raise_for_status()
+        with metrics.request('arachne'):
+            response: requests.Response = requests.get(url=url)
+            response.raise_for_status()
         json_data = response.json()
         json_entity_id = json_data['entityId']
 
@@ -283,8 +289,6 @@ def _extract_letter(archive_id: str,
                     mentioned_persons: List[Person],
                     places_of_origin: List[Place],
                     place_of_reception: Place) -> Letter:
-    global letter_origin_date_invalid_log
-
     # obligatory elements
     xml_element_id: List[str] = xml_element_ead_component.xpath('./@id')
     xml_element_unittitle: List[etree.Element] = xml_element_ead_component.xpath(f'./{DF}:did/{DF}:unittitle',
@@ -321,8 +325,7 @@ def _extract_letter(archive_id: str,
             origin_date_presumed = origin_dates[2]
         except ValueError as error:
             logger.error(f"Invalid letter origin date: {origin_date} ({error}). kalliope id: {kalliope_id}")
-            if (kalliope_id, origin_date) not in letter_origin_date_invalid_log:
-                letter_origin_date_invalid_log.append((kalliope_id, origin_date, kalliope_id))
+            report.add('letter_origin_date_invalid', (kalliope_id, origin_date))
 
     extent: str = None
     if len(xml_element_extent) == 1:
@@ -362,139 +365,85 @@ def process_ead_files(file_paths: List[str]) -> List[Letter]:
     return result
 
 
+def iter_ead_components(ead_file: str) -> Iterator[Tuple[str, etree.Element]]:
+    """Yields (archive id, EAD component) for every letter (`<c level="item">`) of an EAD file, as soon as the
+    component has been parsed.
+
+    The components are detached copies, which can be read by other threads while the file is parsed: the parsed
+    components are cleared from the tree, so that it never grows with the size of the file."""
+    archive_id: str = None
+    corpname_tag: str = '{%s}corpname' % (NS[DF])
+    repository_tag: str = '{%s}repository' % (NS[DF])
+
+    for _, xml_element in etree.iterparse(ead_file, events=('end',), tag=[corpname_tag, '{%s}c' % (NS[DF])]):
+        if xml_element.tag == corpname_tag:
+            if archive_id is None and xml_element.getparent().tag == repository_tag:
+                archive_id = xml_element.get('authfilenumber')
+            continue
+
+        if xml_element.get('level') == 'item':
+            yield archive_id, copy.deepcopy(xml_element)
+
+        # the letters of a series or file have already been yielded
+        xml_element.clear()
+        parent: etree.Element = xml_element.getparent()
+        # drop the components already seen
+        while parent is not None and xml_element.getprevious() is not None:
+            del parent[0]
+
+
+def extract_letter(archive_id: str, xml_element_ead_component: etree.Element) -> Letter:
+    """Extracts a letter from its EAD component, with the authority data of its persons and places."""
+    kalliope_id: str = str(xml_element_ead_component.xpath('./@id')[0])
+
+    '''digital_archival_objects: List[DigitalArchivalObject] = \
+        _extract_digital_archival_objects(xml_element_ead_component)'''
+    digital_archival_objects, entity_id = _extract_digital_archival_objects(xml_element_ead_component)
+    authors: List[Person] = _extract_persons(kalliope_id, xml_element_ead_component.xpath(
+        f'./{DF}:controlaccess/{DF}:persname[@role="Verfasser"] | '
+        f'./{DF}:controlaccess/{DF}:corpname[@role="Verfasser"]', namespaces=NS))
+    recipients: List[Person] = _extract_persons(kalliope_id, xml_element_ead_component.xpath(
+        f'./{DF}:controlaccess/{DF}:persname[@role="Adressat"] | '
+        f'./{DF}:controlaccess/{DF}:corpname[@role="Adressat"]', namespaces=NS))
+    mentioned_persons: List[Person] = _extract_persons(kalliope_id, xml_element_ead_component.xpath(
+        f'./{DF}:controlaccess/{DF}:persname[@role="Erwähnt"] | '
+        f'./{DF}:controlaccess/{DF}:corpname[@role="Erwähnt"] | '
+        f'./{DF}:controlaccess/{DF}:persname[@role="Behandelt"] | '
+        f'./{DF}:controlaccess/{DF}:corpname[@role="Behandelt"] | '
+        f'./{DF}:controlaccess/{DF}:persname[@role="Dokumentiert"] | '
+        f'./{DF}:controlaccess/{DF}:corpname[@role="Dokumentiert"]', namespaces=NS))
+
+    origin_places: List[Place] = places.extract_places_of_origin(kalliope_id, xml_element_ead_component.xpath(
+        f'./{DF}:controlaccess/{DF}:geogname[@role="Entstehungsort"]', namespaces=NS))
+
+    recipient_place: Place = places.extract_place_of_reception(kalliope_id, xml_element_ead_component)
+
+    return _extract_letter(archive_id,
+                           xml_element_ead_component,
+                           digital_archival_objects,
+                           entity_id,
+                           authors,
+                           recipients,
+                           mentioned_persons,
+                           origin_places,
+                           recipient_place)
+
+
 def process_ead_file(ead_file: str) -> List[Letter]:
-    global person_without_gnd_authority_source_log
-    global person_name_differs_from_authority_name_log
-    global person_gnd_id_invalid_log
-    global letter_origin_date_invalid_log
     result: List[Letter] = []
 
     logger.info(f'Parsing input file {ead_file} ...')
+    parse_start: float = time.perf_counter()
 
-    xml_parser: etree.XMLParser = etree.XMLParser()
-    xml_element_tree: etree.ElementTree = etree.parse(ead_file, xml_parser)
-
-    archive_id = xml_element_tree.xpath(
-        f'/{DF}:ead/{DF}:archdesc/{DF}:did/{DF}:repository/{DF}:corpname/@authfilenumber',
-        namespaces=NS
-    )[0]
+    components: List[Tuple[str, etree.Element]] = list(iter_ead_components(ead_file))
 
-    xml_element_ead_component_list: List[etree.Element] = xml_element_tree.xpath(f'//{DF}:c[@level="item"]',
-                                                                                 namespaces=NS)
+    with report.file_scope(ead_file):
+        places.prefetch_gazetteer_locations([xml_element for _, xml_element in components])
+        for archive_id, xml_element_ead_component in components:
+            result.append(extract_letter(archive_id, xml_element_ead_component))
 
-    places.place_without_gnd_authority_source_log = []
-    places.place_without_gnd_gazetteer_mapping_log = []
-    places.place_without_authority_coordinates_log = []
-    places.place_name_differs_from_authority_name_log = []
-    places.place_gnd_id_invalid_log = []
-    person_without_gnd_authority_source_log = []
-    person_name_differs_from_authority_name_log = []
-    person_gnd_id_invalid_log = []
-    letter_origin_date_invalid_log = []
-
-    for xml_element_ead_component in xml_element_ead_component_list:
-
-        kalliope_id: str = str(xml_element_ead_component.xpath('./@id')[0])
-
-        '''digital_archival_objects: List[DigitalArchivalObject] = \
-            _extract_digital_archival_objects(xml_element_ead_component)'''
-        digital_archival_objects, entity_id = _extract_digital_archival_objects(xml_element_ead_component)
-        authors: List[Person] = _extract_persons(kalliope_id, xml_element_ead_component.xpath(
-            f'./{DF}:controlaccess/{DF}:persname[@role="Verfasser"] | '
-            f'./{DF}:controlaccess/{DF}:corpname[@role="Verfasser"]', namespaces=NS))
-        recipients: List[Person] = _extract_persons(kalliope_id, xml_element_ead_component.xpath(
-            f'./{DF}:controlaccess/{DF}:persname[@role="Adressat"] | '
-            f'./{DF}:controlaccess/{DF}:corpname[@role="Adressat"]', namespaces=NS))
-        mentioned_persons: List[Person] = _extract_persons(kalliope_id, xml_element_ead_component.xpath(
-            f'./{DF}:controlaccess/{DF}:persname[@role="Erwähnt"] | '
-            f'./{DF}:controlaccess/{DF}:corpname[@role="Erwähnt"] | '
-            f'./{DF}:controlaccess/{DF}:persname[@role="Behandelt"] | '
-            f'./{DF}:controlaccess/{DF}:corpname[@role="Behandelt"] | '
-            f'./{DF}:controlaccess/{DF}:persname[@role="Dokumentiert"] | '
-            f'./{DF}:controlaccess/{DF}:corpname[@role="Dokumentiert"]', namespaces=NS))
-
-        origin_places: List[Place] = places.extract_places_of_origin(kalliope_id, xml_element_ead_component.xpath(
-            f'./{DF}:controlaccess/{DF}:geogname[@role="Entstehungsort"]', namespaces=NS))
-
-        recipient_place: Place = places.extract_place_of_reception(kalliope_id, xml_element_ead_component)
-
-        letter: Letter = _extract_letter(archive_id,
-                                         xml_element_ead_component,
-                                         digital_archival_objects,
-                                         entity_id,
-                                         authors,
-                                         recipients,
-                                         mentioned_persons,
-                                         origin_places,
-                                         recipient_place)
-
-        result.append(letter)
-
-    if len(places.place_without_gnd_authority_source_log) > 0:
-        logger.info('-----')
-        logger.info('Places without GND authority source (place name, authority source, authority id, authority name, kalliope_id):')
-        logger.info('-----')
-        for place in sorted(places.place_without_gnd_authority_source_log):
-            logger.info(f'{place}')
-
-    if len(places.place_without_gnd_gazetteer_mapping_log) > 0:
-        logger.info('-----')
-        logger.info('Places without GND Gazetteer mapping (authority id, authority source, kalliope_id):')
-        logger.info('-----')
-        for place_without_gnd_gazetteer_mapping in sorted(places.place_without_gnd_gazetteer_mapping_log):
-            logger.info(f'{place_without_gnd_gazetteer_mapping}')
-
-    if len(places.place_without_authority_coordinates_log) > 0:
-        logger.info('-----')
-        logger.info('Places without authority coordinates (GND id, Gazetteer id, kalliope_id):')
-        logger.info('-----')
-        for place_without_authority_coordinates in sorted(places.place_without_authority_coordinates_log):
-            logger.info(f'{place_without_authority_coordinates}')
-
-    if len(places.place_name_differs_from_authority_name_log) > 0:
-        logger.info('-----')
-        logger.info('Places where the name does not match the authority place name (place name, authority name, kalliope_id):')
-        logger.info('-----')
-        for (place_name, auth_place_name, kalliope_id) in sorted(places.place_name_differs_from_authority_name_log):
-            logger.info(f'{place_name} | {auth_place_name} | {kalliope_id}')
-
-    if len(places.place_gnd_id_invalid_log) > 0:
-        logger.info('-----')
-        logger.info('Places with GND authority id on which the GND server does not respond '
-                    '(authority source, authority id, authority url, kalliope_id):')
-        logger.info('-----')
-        for (auth_source, auth_id, auth_url, kalliope_id) in sorted(places.place_gnd_id_invalid_log):
-            logger.info(f'{auth_source} | {auth_id} | {auth_url}  | {kalliope_id}')
-
-    if len(person_without_gnd_authority_source_log) > 0:
-        logger.info('-----')
-        logger.info('Persons without GND authority source '
-                    '(person name, authority source, authority id, authority name, kalliope_id):')
-        logger.info('-----')
-        for person_without_gnd_authority_source_log_entry in sorted(person_without_gnd_authority_source_log):
-            logger.info(f'{person_without_gnd_authority_source_log_entry}')
-
-    if len(person_name_differs_from_authority_name_log) > 0:
-        logger.info('-----')
-        logger.info('Persons where the name does not match the authority name (person name, authority name, kalliope_id):')
-        logger.info('-----')
-        for (person_name, auth_person_name, kalliope_id) in sorted(person_name_differs_from_authority_name_log):
-            logger.info(f'{person_name} | {auth_person_name} | {kalliope_id}')
-
-    if len(person_gnd_id_invalid_log) > 0:
-        logger.info('-----')
-        logger.info('Persons with GND authority id on which the GND server does not respond '
-                    '(person name, authority source, authority id, authority name, url, kalliope_id):')
-        logger.info('-----')
-        for (name, auth_source, auth_id, auth_name, auth_url, kalliope_id) in sorted(person_gnd_id_invalid_log):
-            logger.info(f'{name} | {auth_source} | {auth_id} | {auth_name} | {auth_url} | {kalliope_id}')
-
-    if len(letter_origin_date_invalid_log) > 0:
-        logger.info('-----')
-        logger.info('Letters with invalid origin dates (letter id, origin_date, kalliope_id):')
-        logger.info('-----')
-        for letter_origin_date_invalid_log_entry in sorted(letter_origin_date_invalid_log):
-            logger.info(f'{letter_origin_date_invalid_log_entry}')
+    metrics.add_letters(len(result), time.perf_counter() - parse_start)
+    report.log(ead_file)
 
     logger.info('=====')
     logger.info('Parsing done.')
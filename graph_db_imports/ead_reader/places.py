@@ -1,3 +1,5 @@
+import gnd_index
+import json
 import logging
 import re
 import requests
@@ -5,9 +7,11 @@ import requests
 from config import NS, DF
 from data_structures import Place
 from lxml import etree
+from metrics import metrics
 from rdflib import Graph, URIRef
 from typing import Any, Dict, List, Match, Pattern, Tuple
 from urllib.error import HTTPError
+from validation import report
 
 logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
 logger: logging.Logger = logging.getLogger(__name__)
@@ -16,30 +20,29 @@ COORDINATES_PATTERN: Pattern = re.compile(r'Point \(\s(.*)\s(.*).*\s\).*')
 RECIPIENT_PLACE_PATTERN: Pattern = re.compile(r'Empfängerort:\s(.*)')
 RECIPIENT_PLACE_GND_ID_PATTERN: Pattern = re.compile(r'(.*)\s\(GND: ([0-9a-zA-Z\-]+)\)')
 PRESUMED_PLACE_IDENTIFIER: str = '[vermutlich]'
+GAZETTEER_URL: str = 'https://gazetteer.dainst.org/search.json'
+# GND ids per Gazetteer request (the query is sent in the URL)
+GAZETTEER_BATCH_SIZE: int = 30
+GAZETTEER_RESULTS_PER_ID: int = 10
+
+# keep-alive connections to the Gazetteer, shared by the threads of a pipelined import
+session: requests.Session = requests.Session()
+session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=8))
+session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=8))
 
 gnd_coordinates_mapping: Dict[str, Tuple[float, float]] = {}
 gnd_id_to_name_mapping: Dict[str, str] = {}
 gnd_to_gazetteer_mapping: Dict[str, Tuple[str, float, float]] = {}
-place_without_gnd_authority_source_log: List[Tuple[str, str, str, str, str]] = []
-place_without_authority_coordinates_log: List[Tuple[str, str, str]] = []
-place_without_gnd_gazetteer_mapping_log: List[Tuple[str, str, str]] = []
-place_gnd_id_invalid_log: List[Tuple[str, str, str, str]] = []
-place_name_differs_from_authority_name_log: List[Tuple[str, str, str]] = []
 
 
 def _extract_gazetteer_coordinates(kalliope_id: str, gnd_id: str, json_data: Any):
     global gnd_to_gazetteer_mapping
-    global place_without_gnd_gazetteer_mapping_log
-    global place_without_authority_coordinates_log
     result_total: int = json_data['total']
 
     if result_total == 0:
         logger.debug(f'No GND (id: {gnd_id}) to Gazetteer mapping found!')
         gnd_to_gazetteer_mapping[gnd_id] = (None, None, None)
-        log_entry: Tuple[str, str, str] = (gnd_id, 'GND', kalliope_id)
-
-        if log_entry not in place_without_gnd_gazetteer_mapping_log:
-            place_without_gnd_gazetteer_mapping_log.append(log_entry)
+        report.add('place_without_gnd_gazetteer_mapping', (gnd_id, 'GND', kalliope_id))
 
     elif result_total > 0:
         gaz_id: str = json_data['result'][0]['gazId']
@@ -57,10 +60,7 @@ def _extract_gazetteer_coordinates(kalliope_id: str, gnd_id: str, json_data: Any
             if len(gaz_coordinates) == 0:
                 logger.debug(f'Found no coordinate set for Gazetteer place {gaz_id}.')
                 gnd_to_gazetteer_mapping[gnd_id] = (gaz_id, None, None)
-                log_entry: Tuple[str, str, str] = (gnd_id, gaz_id, kalliope_id)
-
-                if log_entry not in place_without_authority_coordinates_log:
-                    place_without_authority_coordinates_log.append(log_entry)
+                report.add('place_without_authority_coordinates', (gnd_id, gaz_id, kalliope_id))
 
             elif len(gaz_coordinates) == 2:
                 lng: float = gaz_coordinates[0]
@@ -71,16 +71,21 @@ def _extract_gazetteer_coordinates(kalliope_id: str, gnd_id: str, json_data: Any
                 logger.error(f'Found more than one coordinate set for Gazetteer place {gaz_id}.')
 
 
-def _fetch_gazetteer_location_as_json(gnd_id: str) -> Any:
-    query: str = '{"bool":{"must":[{"bool":{"should":[{"nested":{"path":"names",' \
-            '"query":{"match":{"names.language":"deu"}}}},{"match":{"prefName.language":"deu"}}]}},' \
-            '{"nested":{"path":"ids","query":{"bool":{"must":[{"match":{' \
-            '"ids.value":{"query": "%s","operator":"and"}}},{"match":{"ids.context":"GND-ID"}}]}}}}]}}' % gnd_id
-    url: str = 'https://gazetteer.dainst.org/search.json'
-    payload: Dict[str, str] = {'offset': '0',
-                               'limit': '10',
+def _gazetteer_query(gnd_ids: List[str]) -> str:
+    """The query of the places with German names that have one of the GND ids."""
+    return json.dumps({'bool': {'must': [
+        {'bool': {'should': [{'nested': {'path': 'names', 'query': {'match': {'names.language': 'deu'}}}},
+                             {'match': {'prefName.language': 'deu'}}]}},
+        {'nested': {'path': 'ids', 'query': {'bool': {'must': [
+            {'bool': {'should': [{'match': {'ids.value': {'query': gnd_id, 'operator': 'and'}}} for gnd_id in gnd_ids]}},
+            {'match': {'ids.context': 'GND-ID'}}]}}}}]}})
+
+
+def _fetch_gazetteer_locations_as_json(gnd_ids: List[str], url: str = None, offset: int = 0) -> Any:
+    payload: Dict[str, str] = {'offset': str(offset),
+                               'limit': str(GAZETTEER_RESULTS_PER_ID * len(gnd_ids)),
                                'noPolygons': 'true',
-                               'q': query,
+                               'q': _gazetteer_query(gnd_ids),
                                # 'add': 'parents,access,history,sort',
                                'fq': '_exists_:prefLocation.coordinates',
                                'type': 'extended'}
@@ -88,24 +93,96 @@ def _fetch_gazetteer_location_as_json(gnd_id: str) -> Any:
     json_data = None
 
     try:
-        response: requests.Response = requests.get(url=url, params=payload)
-        response.raise_for_status()
+        with metrics.request('gazetteer.dainst.org'):
+            response: requests.Response = session.get(url=url or GAZETTEER_URL, params=payload)
+            response.raise_for_status()
         json_data = response.json()
 
     except ValueError:
         logger.error('JSON decoding fails!\n' + response.text)
 
     except requests.exceptions.RequestException as exception:
-        logger.error(f'Arachne service request fails!\nRequest: {exception.request}\nResponse: {exception.response}')
+        logger.error(f'Gazetteer service request fails!\nRequest: {exception.request}\nResponse: {exception.response}')
 
     return json_data
 
 
+def _fetch_gazetteer_location_as_json(gnd_id: str) -> Any:
+    return _fetch_gazetteer_locations_as_json([gnd_id])
+
+
 def _fetch_gaz_location_coordinates(kalliope_id: str, gnd_id: str) -> None:
     json_data: Any = _fetch_gazetteer_location_as_json(gnd_id)
     _extract_gazetteer_coordinates(kalliope_id, gnd_id, json_data)
 
 
+def fetch_gazetteer_locations(gnd_ids: Dict[str, str], batch_size: int = GAZETTEER_BATCH_SIZE, url: str = None) -> None:
+    """Maps GND ids to Gazetteer places (`gnd_to_gazetteer_mapping`) with one request per `batch_size` ids.
+
+    The results of a request are assigned to the GND ids they have; an id with several results is mapped to the first
+    one, as with one request per id. If the Gazetteer returns fewer places than it found, the next ones are requested
+    with an offset. The ids of a request that failed are left out of the mapping, and so are the ids without results
+    if not all the places could be read, so that they are requested again one by one when their letter is read.
+
+    :param gnd_ids: GND id: kalliope id of a letter with the place (for the validation report)
+    """
+    pending: List[str] = [gnd_id for gnd_id in gnd_ids if gnd_id not in gnd_to_gazetteer_mapping]
+
+    for i in range(0, len(pending), batch_size):
+        batch: List[str] = pending[i:i + batch_size]
+        results: Dict[str, List[Any]] = {gnd_id: [] for gnd_id in batch}
+        offset: int = 0
+        complete: bool = False
+
+        while not complete:
+            json_data: Any = _fetch_gazetteer_locations_as_json(batch, url, offset)
+            if json_data is None:
+                break
+
+            for result in json_data['result']:
+                for identifier in result.get('identifiers', result.get('ids', [])):
+                    if identifier.get('context') == 'GND-ID' and identifier.get('value') in results:
+                        results[identifier['value']].append(result)
+            offset += len(json_data['result'])
+            complete = offset >= json_data['total']
+            if not json_data['result']:
+                break
+
+        if not complete and offset > 0:
+            logger.warning(f'Gazetteer returned {offset} places for {len(batch)} GND ids, but found more; '
+                           f'the ids without places are requested again one by one.')
+
+        for gnd_id in batch:
+            if complete or results[gnd_id]:
+                _extract_gazetteer_coordinates(gnd_ids[gnd_id], gnd_id,
+                                               {'total': len(results[gnd_id]), 'result': results[gnd_id]})
+
+
+def place_gnd_ids(xml_element_ead_component: etree.Element) -> List[str]:
+    """The GND ids of the places of origin and of the place of reception of a letter."""
+    gnd_ids: List[str] = xml_element_ead_component.xpath(
+        f'./{DF}:controlaccess/{DF}:geogname[@role="Entstehungsort"][@source="GND"]/@authfilenumber', namespaces=NS)
+
+    for note in xml_element_ead_component.xpath(f'./{DF}:did/{DF}:note[@label="Bemerkung"]/{DF}:p', namespaces=NS)[:1]:
+        match: Match = RECIPIENT_PLACE_PATTERN.match(note.text or '')
+        if match is not None:
+            match_gnd: Match = RECIPIENT_PLACE_GND_ID_PATTERN.match(match.group(1))
+            if match_gnd is not None:
+                gnd_ids.append(match_gnd.group(2))
+
+    return [str(gnd_id) for gnd_id in gnd_ids]
+
+
+def prefetch_gazetteer_locations(xml_elements_ead_component: List[etree.Element],
+                                 batch_size: int = GAZETTEER_BATCH_SIZE) -> None:
+    """Fetches the Gazetteer places of all the letters in batches, before the letters are read."""
+    gnd_ids: Dict[str, str] = {}
+    for xml_element_ead_component in xml_elements_ead_component:
+        for gnd_id in place_gnd_ids(xml_element_ead_component):
+            gnd_ids.setdefault(gnd_id, xml_element_ead_component.get('id'))
+    fetch_gazetteer_locations(gnd_ids, batch_size)
+
+
 def _fetch_gnd_location_coordinates(kalliope_id: str, gnd_id: str) -> None:
     global gnd_coordinates_mapping
     gnd_coordinates_mapping[gnd_id] = (None, None)
@@ -113,10 +190,16 @@ def _fetch_gnd_location_coordinates(kalliope_id: str, gnd_id: str) -> None:
 
     url: str = f'http://d-nb.info/gnd/{gnd_id}/about/lds'
     coordinate_uri: str = 'http://www.opengis.net/ont/geosparql#asWKT'
-    rdf_graph: Graph = Graph()
-    rdf_graph.load(url)
+    entry: gnd_index.GndEntry = gnd_index.lookup(gnd_id)
+    if entry is None:
+        rdf_graph: Graph = Graph()
+        with metrics.request('d-nb.info'):
+            rdf_graph.load(url)
+        wkt_literals: List[str] = list(rdf_graph.objects(predicate=URIRef(coordinate_uri)))
+    else:
+        wkt_literals: List[str] = entry.wkt
 
-    for rdf_object in rdf_graph.objects(predicate=URIRef(coordinate_uri)):
+    for rdf_object in wkt_literals:
         match: Match = COORDINATES_PATTERN.match(rdf_object)
 
         if match is not None:
@@ -129,10 +212,7 @@ def _fetch_gnd_location_coordinates(kalliope_id: str, gnd_id: str) -> None:
 
     elif len(coordinate_list) == 0:
         logger.debug(f'Found no coordinate set for GND place {gnd_id}.')
-        log_entry: Tuple[str, str, str] = (gnd_id, None, kalliope_id)
-
-        if log_entry not in place_without_authority_coordinates_log:
-            place_without_authority_coordinates_log.append(log_entry)
+        report.add('place_without_authority_coordinates', (gnd_id, None, kalliope_id))
 
     else:
         logger.error(f'Found more than one coordinate set for GND place {gnd_id}.')
@@ -142,16 +222,22 @@ def _fetch_gnd_location_name(gnd_id: str, kalliope_id: str) -> str:
     url: str = f'http://d-nb.info/gnd/{gnd_id}/about/lds'
     predicate: str = 'https://d-nb.info/standards/elementset/gnd#preferredNameForThePlaceOrGeographicName'
 
-    rdf_graph: Graph = Graph()
-    rdf_graph.load(url)
-
+    metrics.cache('gnd_place_name', gnd_id in gnd_id_to_name_mapping)
     if gnd_id in gnd_id_to_name_mapping:
         return gnd_id_to_name_mapping[gnd_id]
     else:
         name = ""
-        for pref_name in rdf_graph.objects(predicate=URIRef(predicate)):
-            name = pref_name
-            break
+        entry: gnd_index.GndEntry = gnd_index.lookup(gnd_id)
+        if entry is None:
+            rdf_graph: Graph = Graph()
+            with metrics.request('d-nb.info'):
+                rdf_graph.load(url)
+
+            for pref_name in rdf_graph.objects(predicate=URIRef(predicate)):
+                name = pref_name
+                break
+        elif entry.name is not None:
+            name = entry.name
         if name == "":
             logger.error(f"No name found for GND ID {gnd_id}, kalliope ID: {kalliope_id}.")
         gnd_id_to_name_mapping[gnd_id] = name
@@ -160,7 +246,6 @@ def _fetch_gnd_location_name(gnd_id: str, kalliope_id: str) -> str:
 
 # TODO: Further refactoring needed, this method seems to have morphed far from its original purpose.
 def _get_authority_data(kalliope_id: str, place_auth_source: str, gnd_id: str) -> (str, str, Tuple[float, float]):
-    global place_gnd_id_invalid_log
     (gaz_id, lat, lng) = gnd_to_gazetteer_mapping[gnd_id]
 
     if gaz_id is not None:
@@ -169,6 +254,7 @@ def _get_authority_data(kalliope_id: str, place_auth_source: str, gnd_id: str) -
         place_auth_coordinates = (lat, lng)
 
     else:
+        metrics.cache('gnd_coordinates', gnd_id in gnd_coordinates_mapping)
         try:
             place_auth_coordinates = gnd_coordinates_mapping[gnd_id]
 
@@ -182,17 +268,12 @@ def _get_authority_data(kalliope_id: str, place_auth_source: str, gnd_id: str) -
                 logger.error(f'_fetch_gnd_location_coordinates: Got {error.code} for {error.url}.')
 
                 if error.code == 404:
-                    log_entry: Tuple[str, str, str, str] = (place_auth_source, gnd_id, error.url, kalliope_id)
-
-                    if log_entry not in place_gnd_id_invalid_log:
-                        place_gnd_id_invalid_log.append(log_entry)
+                    report.add('place_gnd_id_invalid', (place_auth_source, gnd_id, error.url, kalliope_id))
 
     return place_auth_source, gnd_id, place_auth_coordinates
 
 
 def extract_places_of_origin(kalliope_id, xml_elements_geoname: List[etree.Element]) -> List[Place]:
-    global place_name_differs_from_authority_name_log
-    global place_without_gnd_authority_source_log
     places: List[Place] = []
 
     for xml_element_geoname in xml_elements_geoname:
@@ -206,18 +287,17 @@ def extract_places_of_origin(kalliope_id, xml_elements_geoname: List[etree.Eleme
             place_name_presumed = True
 
         if place_name != place_auth_name:
-            if (place_name, place_auth_name) not in place_name_differs_from_authority_name_log:
-                place_name_differs_from_authority_name_log.append((place_name, place_auth_name, kalliope_id))
+            report.add('place_name_differs_from_authority_name', (place_name, place_auth_name, kalliope_id),
+                       key=(place_name, place_auth_name))
 
         if place_auth_source != 'GND':
             place_auth_coordinates: Tuple[float, float] = (None, None)
 
-            log_entry: Tuple[str, str, str, str, str] = (place_name, place_auth_source, place_auth_id, place_auth_name, kalliope_id)
-
-            if log_entry not in place_without_gnd_authority_source_log:
-                place_without_gnd_authority_source_log.append(log_entry)
+            report.add('place_without_gnd_authority_source',
+                       (place_name, place_auth_source, place_auth_id, place_auth_name, kalliope_id))
 
         else:
+            metrics.cache('gnd_to_gazetteer', place_auth_id in gnd_to_gazetteer_mapping)
             try:
                 place_auth_source, place_auth_id, place_auth_coordinates = \
                     _get_authority_data(kalliope_id, place_auth_source, place_auth_id)
@@ -227,13 +307,13 @@ def extract_places_of_origin(kalliope_id, xml_elements_geoname: List[etree.Eleme
                 place_auth_source, place_auth_id, place_auth_coordinates = \
                     _get_authority_data(kalliope_id, place_auth_source, place_auth_id)
 
-        place: Place = Place(name=place_name,
-                             name_presumed=place_name_presumed,
-                             auth_source=place_auth_source,
-                             auth_id=place_auth_id,
-                             auth_name=place_auth_name,
-                             auth_lat=place_auth_coordinates[0],
-                             auth_lng=place_auth_coordinates[1])
+        place: Place = Place.interned(name=place_name,
+                                      name_presumed=place_name_presumed,
+                                      auth_source=place_auth_source,
+                                      auth_id=place_auth_id,
+                                      auth_name=place_auth_name,
+                                      auth_lat=place_auth_coordinates[0],
+                                      auth_lng=place_auth_coordinates[1])
 
         places.append(place)
 
@@ -259,6 +339,7 @@ def extract_place_of_reception(kalliope_id: str, item: etree.Element) -> Place:
             if match_gnd is not None:
                 place_name = match_gnd.group(1)
                 gnd_id = match_gnd.group(2)
+                metrics.cache('gnd_to_gazetteer', gnd_id in gnd_to_gazetteer_mapping)
                 try:
                     place_auth_source, auth_id, place_auth_coordinates = \
                         _get_authority_data(kalliope_id, 'GND', gnd_id)
@@ -269,19 +350,19 @@ def extract_place_of_reception(kalliope_id: str, item: etree.Element) -> Place:
 
                 place_auth_name = _fetch_gnd_location_name(gnd_id, kalliope_id)
 
-                return Place(name=place_name,
-                             name_presumed=place_name_presumed,
-                             auth_source=place_auth_source,
-                             auth_id=gnd_id,
-                             auth_name=place_auth_name,
-                             auth_lat=place_auth_coordinates[0],
-                             auth_lng=place_auth_coordinates[1])
+                return Place.interned(name=place_name,
+                                      name_presumed=place_name_presumed,
+                                      auth_source=place_auth_source,
+                                      auth_id=gnd_id,
+                                      auth_name=place_auth_name,
+                                      auth_lat=place_auth_coordinates[0],
+                                      auth_lng=place_auth_coordinates[1])
 
             else:
                 if PRESUMED_PLACE_IDENTIFIER in place_name.lower():
                     place_name_presumed = True
 
-                return Place(
+                return Place.interned(
                     name=place_name,
                     name_presumed=place_name_presumed
                 )
@@ -0,0 +1,296 @@
+"""
+Local index of the GND authority data used by the EAD reader: dates of birth and death, preferred names and WKT
+coordinates, built from bulk dumps of the GND (https://data.dnb.de/opendata/) instead of one request to d-nb.info per
+GND id.
+
+The dumps are streamed (gzipped or not), so they are never loaded into memory:
+
+* N-Triples (`.nt`, `.nt.gz`), e.g. `authorities-gnd-person_lds.nt.gz`;
+* JSON-LD with one node, or one list of nodes, per line (`.jsonld`, `.jsonl`, `.json` and gzipped), with full IRIs
+  (expanded JSON-LD) or short keys as in the lobid-gnd dumps (`dateOfBirth`, `preferredName...`, `hasGeometry`...).
+
+Every GND id of the dumps gets an entry, even without any of these fields, so that an id missing from the index is
+one the dumps do not describe; only those are still requested from d-nb.info. Ingest the person and the geographic
+dumps (not the full GND) to keep the index small.
+
+Usage:
+    python gnd_index.py <index file> <dump file>...
+"""
+
+import gzip
+import json
+import logging
+import re
+import sqlite3
+import sys
+import threading
+
+from metrics import metrics
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Pattern, TextIO, Tuple
+
+logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+logger: logging.Logger = logging.getLogger(__name__)
+
+GND_ID_PATTERN: Pattern = re.compile(r'^https?://d-nb\.info/gnd/([^/#]+)$')
+LITERAL_PATTERN: Pattern = re.compile(r'^"((?:[^"\\]|\\.)*)"')
+ESCAPE_PATTERN: Pattern = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)')
+ESCAPES: Dict[str, str] = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+# local names of the predicates that are indexed, and the column they go to
+COLUMNS: Dict[str, str] = {'dateOfBirth': 'birth', 'dateOfDeath': 'death'}
+# preferredNameForThePerson, preferredNameForThePlaceOrGeographicName... (preferredName in lobid-gnd)
+PREFERRED_NAME_PREFIX: str = 'preferredName'
+HAS_GEOMETRY: str = 'hasGeometry'
+AS_WKT: str = 'asWKT'
+
+# rows written per transaction while building
+BATCH_SIZE: int = 10000
+
+# (subject, local name of the predicate, object: IRI, blank node or value of a literal)
+Triple = Tuple[str, str, str]
+
+
+class GndEntry(NamedTuple):
+    birth: Optional[str]
+    death: Optional[str]
+    name: Optional[str]
+    # WKT literals of the geometries (usually 0 or 1)
+    wkt: List[str]
+
+
+def _local_name(iri: str) -> str:
+    return re.split('[#/]', iri.rstrip('>'))[-1]
+
+
+def _unescape(literal: str) -> str:
+    def replace(match) -> str:
+        escape: str = match.group(1)
+        if escape[0] in 'uU' and len(escape) > 1:
+            return chr(int(escape[1:], 16))
+        return ESCAPES.get(escape, escape)
+    return ESCAPE_PATTERN.sub(replace, literal) if '\\' in literal else literal
+
+
+def _open(path: str) -> TextIO:
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def read_ntriples(lines: Iterable[str]) -> Iterator[Triple]:
+    """The triples of N-Triples lines; the objects are only read for the predicates of the index."""
+    for line in lines:
+        if not line.strip() or line.startswith('#'):
+            continue
+        try:
+            subject, predicate, rest = line.split(' ', 2)
+        except ValueError:
+            logger.warning(f'Invalid N-Triples line: {line.strip()}')
+            continue
+
+        name: str = _local_name(predicate)
+        if rest.startswith('"'):
+            if not (name in COLUMNS or name == AS_WKT or name.startswith(PREFERRED_NAME_PREFIX)):
+                yield subject.strip('<>'), name, None
+                continue
+            match = LITERAL_PATTERN.match(rest)
+            if match is None:
+                logger.warning(f'Invalid N-Triples literal: {line.strip()}')
+                continue
+            yield subject.strip('<>'), name, _unescape(match.group(1))
+        elif name == HAS_GEOMETRY:
+            yield subject.strip('<>'), name, rest.rstrip().rstrip('.').rstrip().strip('<>')
+        else:
+            yield subject.strip('<>'), name, None
+
+
+def _jsonld_values(value: Any) -> List[Any]:
+    values: List[Any] = value if isinstance(value, list) else [value]
+    return [v.get('@value', v.get('value', v)) if isinstance(v, dict) and ('@value' in v or 'value' in v) else v
+            for v in values]
+
+
+def _jsonld_node_triples(node: Dict, subject: str = None) -> Iterator[Triple]:
+    subject = subject or node.get('@id') or node.get('id')
+    if subject is None and 'gndIdentifier' in node:
+        subject = f'https://d-nb.info/gnd/{node["gndIdentifier"]}'
+    if subject is None:
+        return
+
+    yield subject, 'type', None
+    for key, value in node.items():
+        name: str = _local_name(key)
+        if name == HAS_GEOMETRY:
+            for i, geometry in enumerate(_jsonld_values(value)):
+                if isinstance(geometry, dict):
+                    geometry_id: str = geometry.get('@id') or geometry.get('id') or f'{subject}#geometry{i}'
+                    yield subject, HAS_GEOMETRY, geometry_id
+                    yield from _jsonld_node_triples(geometry, geometry_id)
+                else:
+                    yield subject, HAS_GEOMETRY, geometry
+        elif name in COLUMNS or name == AS_WKT or name.startswith(PREFERRED_NAME_PREFIX):
+            for v in _jsonld_values(value):
+                if isinstance(v, str):
+                    yield subject, name, v
+
+
+def read_jsonld(lines: Iterable[str]) -> Iterator[Triple]:
+    """The triples of JSON-LD lines (one node or one list of nodes per line, possibly with a `@graph`)."""
+    for line in lines:
+        line = line.strip().rstrip(',')
+        if not line or line in ('[', ']'):
+            continue
+        try:
+            data: Any = json.loads(line)
+        except ValueError:
+            logger.warning(f'Invalid JSON-LD line: {line[:200]}')
+            continue
+
+        nodes: List[Any] = data if isinstance(data, list) else data.get('@graph', [data])
+        for node in nodes:
+            if isinstance(node, dict):
+                yield from _jsonld_node_triples(node)
+
+
+def read_dump(path: str) -> Iterator[Triple]:
+    with _open(path) as lines:
+        if '.nt' in path:
+            yield from read_ntriples(lines)
+        else:
+            yield from read_jsonld(lines)
+
+
+class GndIndex:
+    """A GND index (an SQLite database), which can be read by several threads."""
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self._connection: sqlite3.Connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS gnd '
+                                 '(id TEXT PRIMARY KEY, birth TEXT, death TEXT, name TEXT, wkt TEXT) WITHOUT ROWID')
+        self._lock: threading.Lock = threading.Lock()
+
+    def get(self, gnd_id: str) -> Optional[GndEntry]:
+        """The entry of a GND id, or None if the dumps do not describe it."""
+        with self._lock:
+            row: Tuple = self._connection.execute(
+                'SELECT birth, death, name, wkt FROM gnd WHERE id = ?', (gnd_id,)).fetchone()
+        if row is None:
+            return None
+        return GndEntry(row[0], row[1], row[2], row[3].split('\n') if row[3] else [])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute('SELECT count(*) FROM gnd').fetchone()[0]
+
+    def _write(self, rows: List[Tuple]) -> None:
+        # the first date and name of an id are kept, its WKT literals are appended
+        self._connection.executemany(
+            'INSERT INTO gnd VALUES (?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET '
+            'birth = coalesce(gnd.birth, excluded.birth), death = coalesce(gnd.death, excluded.death), '
+            'name = coalesce(gnd.name, excluded.name), '
+            "wkt = CASE WHEN gnd.wkt IS NULL THEN excluded.wkt WHEN excluded.wkt IS NULL THEN gnd.wkt "
+            "ELSE gnd.wkt || char(10) || excluded.wkt END", rows)
+        self._connection.commit()
+
+    def add(self, triples: Iterable[Triple]) -> int:
+        """Adds the GND ids of triples with their fields, returns the number of triples read."""
+        rows: List[Tuple] = []
+        # consecutive triples of a subject are merged into one row
+        current: Optional[List] = None
+        # geometry node: GND id, and WKT of the geometries read before their GND id
+        geometry_owners: Dict[str, str] = {}
+        pending_wkt: Dict[str, List[str]] = {}
+        n: int = 0
+
+        def flush() -> None:
+            if current is not None:
+                rows.append((current[0], current[1], current[2], current[3],
+                             '\n'.join(current[4]) if current[4] else None))
+
+        for subject, name, value in triples:
+            n += 1
+            match = GND_ID_PATTERN.match(subject)
+
+            if match is None:
+                # a geometry node
+                if name == AS_WKT and value is not None:
+                    owner: Optional[str] = geometry_owners.pop(subject, None)
+                    if owner is None:
+                        pending_wkt.setdefault(subject, []).append(value)
+                    else:
+                        rows.append((owner, None, None, None, value))
+                continue
+
+            gnd_id: str = match.group(1)
+            if current is None or current[0] != gnd_id:
+                flush()
+                current = [gnd_id, None, None, None, []]
+
+            if value is None:
+                pass
+            elif name in COLUMNS:
+                column: int = 1 if COLUMNS[name] == 'birth' else 2
+                current[column] = current[column] or value
+            elif name.startswith(PREFERRED_NAME_PREFIX):
+                current[3] = current[3] or value
+            elif name == AS_WKT:
+                current[4].append(value)
+            elif name == HAS_GEOMETRY:
+                if value in pending_wkt:
+                    current[4].extend(pending_wkt.pop(value))
+                else:
+                    geometry_owners[value] = gnd_id
+
+            if len(rows) >= BATCH_SIZE:
+                self._write(rows)
+                rows = []
+
+        flush()
+        self._write(rows)
+        return n
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def build_index(index_path: str, dump_paths: List[str]) -> GndIndex:
+    """Adds the GND dumps to an index (created if it does not exist)."""
+    index: GndIndex = GndIndex(index_path)
+    for dump_path in dump_paths:
+        logger.info(f'Reading {dump_path} ...')
+        n: int = index.add(read_dump(dump_path))
+        logger.info(f'{n} triples read, {len(index)} GND ids in the index.')
+    return index
+
+
+# the index used by the EAD reader, if any (see `open_index`)
+index: Optional[GndIndex] = None
+
+
+def open_index(path: str) -> GndIndex:
+    global index
+    index = GndIndex(path)
+    logger.info(f'Using the GND index {path} ({len(index)} GND ids).')
+    return index
+
+
+def lookup(gnd_id: str) -> Optional[GndEntry]:
+    """The entry of a GND id in the index of the EAD reader, None if there is no index or the id is not in it."""
+    if index is None:
+        return None
+    entry: Optional[GndEntry] = index.get(gnd_id)
+    metrics.cache('gnd_index', entry is not None)
+    return entry
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 3:
+        logger.info('Please provide as arguments: ')
+
+        logger.info('1) The index file (SQLite, created if it does not exist).')
+        logger.info('2) One or more GND dump files (N-Triples or JSON-LD lines, optionally gzipped).')
+        sys.exit()
+
+    build_index(sys.argv[1], sys.argv[2:]).close()
@@ -1,12 +1,16 @@
 import sys
 import logging
 import os
+import gnd_index
 
 from data_structures import Letter
 from ead_reader.main import process_ead_file, process_ead_files
-from neo4j_writer import import_data
+from metrics import metrics
+from neo4j_writer import connect, import_data
+from pipeline import pipelined_import
 from tsv_reader import read_data as read_tsv_file
 from typing import List
+from validation import report
 
 logging.basicConfig(format='%(asctime)s %(message)s', level=logging.DEBUG)
 logger: logging.Logger = logging.getLogger(__name__)
@@ -14,7 +18,18 @@ logger: logging.Logger = logging.getLogger(__name__)
 
 if __name__ == '__main__':
 
-    if len(sys.argv) != 6:
+    # parse, resolve the authority data and write at the same time (EAD files only)
+    pipelined: bool = '--pipelined' in sys.argv
+    if pipelined:
+        sys.argv.remove('--pipelined')
+
+    # resolve the GND ids from a local index first (see gnd_index.py)
+    if '--gnd-index' in sys.argv:
+        i: int = sys.argv.index('--gnd-index')
+        gnd_index.open_index(sys.argv[i + 1])
+        del sys.argv[i:i + 2]
+
+    if len(sys.argv) not in (6, 7):
         logger.info('Please provide as arguments: ')
 
         logger.info('1) Directory or file containing the metadata files (TSV or EAD XML).')
@@ -22,10 +37,32 @@ if __name__ == '__main__':
         logger.info('3) Neo4j port')
         logger.info('4) Neo4j username')
         logger.info('5) Neo4j user password')
+        logger.info('6) (optional) File for the metrics report of the import (JSON, default: import_metrics.json)')
+        logger.info('The problems found in the metadata are written to validation_report.csv and validation_report.json.')
+        logger.info('--pipelined: parse the EAD files, fetch the authority data and write to Neo4j concurrently.')
+        logger.info('--gnd-index FILE: look the GND ids up in a local index (built with gnd_index.py) first.')
 
         sys.exit()
 
     input_path: str = sys.argv[1]
+    metrics_path: str = sys.argv[6] if len(sys.argv) == 7 else 'import_metrics.json'
+
+    if pipelined:
+        if os.path.isdir(input_path):
+            ead_files: List[str] = sorted(os.path.join(input_path, f) for f in os.listdir(input_path)
+                                          if os.path.splitext(f)[1] == '.xml')
+        else:
+            ead_files: List[str] = [input_path]
+
+        if not ead_files or os.path.splitext(ead_files[0])[1] != '.xml':
+            logger.warning(f'No EAD files found at {input_path}.')
+            sys.exit()
+
+        pipelined_import(ead_files, connect(sys.argv[2], int(sys.argv[3]), sys.argv[4], sys.argv[5]))
+        metrics.write_report(metrics_path)
+        report.write_csv('validation_report.csv')
+        report.write_json('validation_report.json')
+        sys.exit()
 
     if os.path.isfile(input_path):
         file_name: str = os.path.splitext(input_path)[0]
@@ -60,3 +97,6 @@ if __name__ == '__main__':
         sys.exit()
 
     import_data(letters, url=sys.argv[2], port=int(sys.argv[3]), username=sys.argv[4], password=sys.argv[5])
+    metrics.write_report(metrics_path)
+    report.write_csv('validation_report.csv')
+    report.write_json('validation_report.json')
@@ -0,0 +1,169 @@
+import json
+import logging
+import threading
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# upper bounds (in seconds) of the buckets of the latency histograms
+LATENCY_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    index: int = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _latency_summary(latencies: List[float]) -> Dict:
+    values: List[float] = sorted(latencies)
+    histogram: Dict[str, int] = {}
+    i: int = 0
+    for bound in LATENCY_BUCKETS:
+        n: int = 0
+        while i < len(values) and values[i] <= bound:
+            n += 1
+            i += 1
+        histogram[f'<={bound}s' if bound != float('inf') else f'>{LATENCY_BUCKETS[-2]}s'] = n
+
+    return {
+        'count': len(values),
+        'total': round(sum(values), 3),
+        'p50': round(_percentile(values, 50), 4),
+        'p90': round(_percentile(values, 90), 4),
+        'p99': round(_percentile(values, 99), 4),
+        'max': round(values[-1], 4),
+        'histogram': histogram
+    }
+
+
+class Metrics:
+    """Collects the metrics of an import: parsing throughput, HTTP requests per endpoint, authority cache
+    hits and misses, the time of every Neo4j statement and, in a pipelined import, the busy time of every stage.
+    It can be shared by the threads of a pipelined import."""
+
+    def __init__(self):
+        self._lock: threading.Lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.start: float = time.perf_counter()
+        self.letters: int = 0
+        self.parse_seconds: float = 0.0
+        self.requests: Dict[str, List[float]] = {}
+        self.request_errors: Counter = Counter()
+        self.cache_hits: Counter = Counter()
+        self.cache_misses: Counter = Counter()
+        self.statements: Dict[str, List[float]] = {}
+        self.stages: Counter = Counter()
+
+    def add_letters(self, n: int, seconds: float) -> None:
+        """Records the letters read from an EAD file and the time it took to parse it."""
+        with self._lock:
+            self.letters += n
+            self.parse_seconds += seconds
+
+    @contextmanager
+    def request(self, endpoint: str):
+        """Times an HTTP request to an endpoint (e.g. 'd-nb.info'); failed requests are counted as errors."""
+        start: float = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            with self._lock:
+                self.request_errors[endpoint] += 1
+            raise
+        finally:
+            seconds: float = time.perf_counter() - start
+            with self._lock:
+                self.requests.setdefault(endpoint, []).append(seconds)
+
+    def cache(self, name: str, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.cache_hits[name] += 1
+            else:
+                self.cache_misses[name] += 1
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        """Records the time a stage of a pipelined import spent working (not waiting for its input queue)."""
+        with self._lock:
+            self.stages[name] += seconds
+
+    @contextmanager
+    def statement(self, name: str):
+        """Times a Neo4j statement."""
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds: float = time.perf_counter() - start
+            with self._lock:
+                self.statements.setdefault(name, []).append(seconds)
+
+    def report(self) -> Dict:
+        elapsed: float = time.perf_counter() - self.start
+        # a snapshot, so that the threads still running can go on recording
+        with self._lock:
+            letters: int = self.letters
+            parse_seconds: float = self.parse_seconds
+            request_latencies: Dict[str, List[float]] = {name: list(times) for name, times in self.requests.items()}
+            request_errors: Counter = Counter(self.request_errors)
+            cache_hits: Counter = Counter(self.cache_hits)
+            cache_misses: Counter = Counter(self.cache_misses)
+            statements: Dict[str, List[float]] = {name: list(times) for name, times in self.statements.items()}
+            stages: Counter = Counter(self.stages)
+
+        caches: Dict[str, Dict] = {}
+        for name in sorted(set(cache_hits) | set(cache_misses)):
+            total: int = cache_hits[name] + cache_misses[name]
+            caches[name] = {'hits': cache_hits[name],
+                            'misses': cache_misses[name],
+                            'hit_ratio': round(cache_hits[name] / total, 4)}
+
+        requests: Dict[str, Dict] = {}
+        for endpoint, latencies in sorted(request_latencies.items()):
+            requests[endpoint] = _latency_summary(latencies)
+            requests[endpoint]['errors'] = request_errors[endpoint]
+
+        return {
+            'elapsed': round(elapsed, 3),
+            'letters': letters,
+            'parse_seconds': round(parse_seconds, 3),
+            'letters_per_second': round(letters / parse_seconds, 2) if parse_seconds else None,
+            'requests': requests,
+            'caches': caches,
+            'statements': {name: {'count': len(times), 'total': round(sum(times), 3), 'max': round(max(times), 4)}
+                           for name, times in statements.items()},
+            'stages': {name: round(seconds, 3) for name, seconds in stages.items()}
+        }
+
+    def log_report(self) -> Dict:
+        report: Dict = self.report()
+        logger.info('-----')
+        logger.info(f'Metrics: {report["letters"]} letters parsed in {report["parse_seconds"]}s '
+                    f'({report["letters_per_second"]} letters/s), total time {report["elapsed"]}s')
+        for endpoint, r in report['requests'].items():
+            logger.info(f'{endpoint}: {r["count"]} requests ({r["errors"]} failed), {r["total"]}s, '
+                        f'p50 {r["p50"]}s, p90 {r["p90"]}s, p99 {r["p99"]}s')
+        for name, c in report['caches'].items():
+            logger.info(f'Cache {name}: {c["hits"]} hits, {c["misses"]} misses ({c["hit_ratio"]:.1%})')
+        for name, s in report['statements'].items():
+            logger.info(f'Statement {name}: {s["total"]}s')
+        for name, seconds in report['stages'].items():
+            logger.info(f'Stage {name}: {seconds}s busy')
+        logger.info('-----')
+        return report
+
+    def write_report(self, path: str) -> Dict:
+        report: Dict = self.log_report()
+        with open(path, 'w') as out:
+            json.dump(report, out, indent=2)
+        return report
+
+
+# the metrics of the current run, shared by the reader and the writer
+metrics: Metrics = Metrics()
@@ -2,15 +2,26 @@ import logging
 
 from neo4j.v1 import Driver, GraphDatabase, Transaction
 from data_structures import *
+from metrics import metrics
 from typing import Set
 
 logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
 logger: logging.Logger = logging.getLogger(__name__)
 
 
-def _import_place_nodes(transaction: Transaction, letter_list: List[Letter]):
+def _run(transaction: Transaction, name: str, statement: str, parameters: dict = None) -> None:
+    with metrics.statement(name):
+        result = transaction.run(statement, parameters)
+        # the statement is sent lazily: wait for its result, so that its time is measured
+        if result is not None:
+            result.consume()
+
+
+def _import_place_nodes(transaction: Transaction, letter_list: List[Letter], written: Set[Place] = None):
     logger.info('Importing place nodes.')
-    places: Set[Place] = set()
+    written = set() if written is None else written
+    # the reception places are also matched against the places already written
+    places: Set[Place] = set(written)
 
     for letter in letter_list:
         origin_places: List[Place] = letter.origin_places
@@ -38,7 +49,7 @@ def _import_place_nodes(transaction: Transaction, letter_list: List[Letter]):
                 places.add(reception_place)
 
     parameters = dict({'place_list': []})
-    for place in places:
+    for place in places - written:
         parameters['place_list'].append(
             {
                 'name': place.name,
@@ -56,17 +67,20 @@ def _import_place_nodes(transaction: Transaction, letter_list: List[Letter]):
         SET n = place
         """
 
-    transaction.run(statement, parameters)
+    _run(transaction, 'place_nodes', statement, parameters)
+    written.update(places)
 
 
-def _import_person_nodes(transaction: Transaction, letter_list: List[Letter]):
+def _import_person_nodes(transaction: Transaction, letter_list: List[Letter], written: Set[Person] = None):
     logger.info('Importing person nodes.')
+    written = set() if written is None else written
     persons: Set[Person] = set()
 
     for letter in letter_list:
         persons.update(letter.authors)
         persons.update(letter.recipients)
         persons.update(letter.mentioned_persons)
+    persons -= written
 
     parameters = dict({'person_list': []})
 
@@ -89,15 +103,19 @@ def _import_person_nodes(transaction: Transaction, letter_list: List[Letter]):
         SET n = person
     """
 
-    transaction.run(statement, parameters)
+    _run(transaction, 'person_nodes', statement, parameters)
+    written.update(persons)
 
 
-def _import_digital_archival_object_nodes(transaction: Transaction, letter_list: List[Letter]):
+def _import_digital_archival_object_nodes(transaction: Transaction, letter_list: List[Letter],
+                                          written: Set[DigitalArchivalObject] = None):
     logger.info('Importing digital_archival_object nodes.')
+    written = set() if written is None else written
     dao_set: Set[DigitalArchivalObject] = set()
 
     for letter in letter_list:
         dao_set.update(letter.digital_archival_objects)
+    dao_set -= written
 
     parameters = dict({'digital_archival_object_list': []})
 
@@ -113,7 +131,8 @@ def _import_digital_archival_object_nodes(transaction: Transaction, letter_list:
         SET n = dao
     """
 
-    transaction.run(statement, parameters)
+    _run(transaction, 'digital_archival_object_nodes', statement, parameters)
+    written.update(dao_set)
 
 
 def _import_letter_nodes(transaction: Transaction, letter_list: List[Letter]):
@@ -145,7 +164,7 @@ def _import_letter_nodes(transaction: Transaction, letter_list: List[Letter]):
         SET n = letter
     """
 
-    transaction.run(statement, parameters)
+    _run(transaction, 'letter_nodes', statement, parameters)
 
 
 def _import_send_from_relationships(transaction: Transaction, letter_list: List[Letter]):
@@ -175,7 +194,7 @@ def _import_send_from_relationships(transaction: Transaction, letter_list: List[
         CREATE (letter) -[:SEND_FROM { presumed: place_of_origin.name_presumed }]-> (place)
     """
 
-    transaction.run(statement, parameters)
+    _run(transaction, 'send_from_relationships', statement, parameters)
 
 
 def _import_send_to_relationships(transaction: Transaction, letter_list: List[Letter]):
@@ -205,7 +224,7 @@ def _import_send_to_relationships(transaction: Transaction, letter_list: List[Le
         CREATE (letter) -[:SEND_TO { presumed: place_of_reception.name_presumed }]-> (place)
     """
 
-    transaction.run(statement, parameters)
+    _run(transaction, 'send_to_relationships', statement, parameters)
 
 
 def _import_is_author_relationships(transaction: Transaction, letter_list: List[Letter]):
@@ -235,7 +254,7 @@ def _import_is_author_relationships(transaction: Transaction, letter_list: List[
         CREATE (person) -[:IS_AUTHOR { presumed: is_author.name_presumed }]-> (letter)
     """
 
-    transaction.run(statement, parameters)
+    _run(transaction, 'is_author_relationships', statement, parameters)
 
 
 def _import_is_recipient_relationships(transaction: Transaction, letter_list: List[Letter]):
@@ -265,7 +284,7 @@ def _import_is_recipient_relationships(transaction: Transaction, letter_list: Li
         CREATE (person) -[:IS_RECIPIENT { presumed: is_recipient.name_presumed }]-> (letter)
     """
 
-    transaction.run(statement, parameters)
+    _run(transaction, 'is_recipient_relationships', statement, parameters)
 
 
 def _import_is_mentioned_relationship(transaction: Transaction, letter_list: List[Letter]):
@@ -296,7 +315,7 @@ def _import_is_mentioned_relationship(transaction: Transaction, letter_list: Lis
         CREATE (person) -[:IS_MENTIONED { presumed: is_mentioned.name_presumed }]-> (letter)
     """
 
-    transaction.run(statement, parameters)
+    _run(transaction, 'is_mentioned_relationship', statement, parameters)
 
 
 def _import_has_arachne_url_letter_relationships(transaction: Transaction, letter_list: List[Letter]):
@@ -320,7 +339,7 @@ def _import_has_arachne_url_letter_relationships(transaction: Transaction, lette
         CREATE (letter) -[:HAS_ARACHNE_URL_LETTER]-> (dao)
     """
 
-    transaction.run(statement, parameters)
+    _run(transaction, 'has_arachne_url_letter_relationships', statement, parameters)
 
 
 def _import_has_arachne_url_attachment_relationships(transaction: Transaction, letter_list: List[Letter]):
@@ -345,7 +364,7 @@ def _import_has_arachne_url_attachment_relationships(transaction: Transaction, l
         CREATE (letter) -[:HAS_ARACHNE_URL_ATTACHMENT]-> (dao)
     """
 
-    transaction.run(statement, parameters)
+    _run(transaction, 'has_arachne_url_attachment_relationships', statement, parameters)
 
 
 def _import_has_arachne_url_undefined_relationships(transaction: Transaction, letter_list: List[Letter]):
@@ -369,7 +388,11 @@ def _import_has_arachne_url_undefined_relationships(transaction: Transaction, le
         CREATE (letter) -[:HAS_ARACHNE_URL_UNDEFINED]-> (dao)
     """
 
-    transaction.run(statement, parameters)
+    _run(transaction, 'has_arachne_url_undefined_relationships', statement, parameters)
+
+
+def connect(url: str, port: int, username: str, password: str) -> Driver:
+    return GraphDatabase.driver('bolt://%s:%i ' % (url, port), auth=(username, password))
 
 
 def import_data(data: List[Letter], url: str, port: int, username: str, password: str) -> None:
@@ -377,19 +400,49 @@ def import_data(data: List[Letter], url: str, port: int, username: str, password
     logger.info('Starting import ...')
     logger.info('-----')
 
-    driver: Driver = GraphDatabase.driver('bolt://%s:%i ' % (url, port), auth=(username, password))
+    driver: Driver = connect(url, port, username, password)
+    write_data(driver, data)
 
+    logger.info('=====')
+    logger.info('Import done.')
+    logger.info('=====')
+
+
+def write_data(driver: Driver, data: List[Letter]) -> None:
+    """Writes the schema and the letters with a driver (any object with the `session()` API of `neo4j.v1.Driver`)."""
     with driver.session() as session:
-        with session.begin_transaction() as schema_transaction:
-            schema_transaction.run('CREATE INDEX ON :Place(name)')
-            schema_transaction.run('CREATE INDEX ON :Person(name)')
-            schema_transaction.run('CREATE INDEX ON :DigitalArchivalObject(url)')
-            schema_transaction.run('CREATE CONSTRAINT ON (letter:Letter) ASSERT letter.kalliope_id IS UNIQUE')
-
-        with session.begin_transaction() as data_transaction:
-            _import_place_nodes(data_transaction, data)
-            _import_person_nodes(data_transaction, data)
-            _import_digital_archival_object_nodes(data_transaction, data)
+        writer: BatchWriter = BatchWriter(session)
+        writer.write_schema()
+        writer.write(data)
+
+
+class BatchWriter:
+    """Writes letters in batches, each batch in its own transaction.
+
+    The place, person and digital archival object nodes that were written with an earlier batch are not written
+    again, and the reception places of a batch are matched against all the places written so far. A reception place
+    is only matched against the places of origin of the letters written before it, though, so that a batched import
+    may create a few more place nodes than an import of all the letters at once."""
+
+    def __init__(self, session):
+        self.session = session
+        self.places: Set[Place] = set()
+        self.persons: Set[Person] = set()
+        self.digital_archival_objects: Set[DigitalArchivalObject] = set()
+        self.letters: int = 0
+
+    def write_schema(self) -> None:
+        with self.session.begin_transaction() as schema_transaction:
+            _run(schema_transaction, 'index_place', 'CREATE INDEX ON :Place(name)')
+            _run(schema_transaction, 'index_person', 'CREATE INDEX ON :Person(name)')
+            _run(schema_transaction, 'index_digital_archival_object', 'CREATE INDEX ON :DigitalArchivalObject(url)')
+            _run(schema_transaction, 'constraint_letter', 'CREATE CONSTRAINT ON (letter:Letter) ASSERT letter.kalliope_id IS UNIQUE')
+
+    def write(self, data: List[Letter]) -> None:
+        with self.session.begin_transaction() as data_transaction:
+            _import_place_nodes(data_transaction, data, self.places)
+            _import_person_nodes(data_transaction, data, self.persons)
+            _import_digital_archival_object_nodes(data_transaction, data, self.digital_archival_objects)
             _import_letter_nodes(data_transaction, data)
             _import_send_from_relationships(data_transaction, data)
             _import_send_to_relationships(data_transaction, data)
@@ -399,7 +452,4 @@ def import_data(data: List[Letter], url: str, port: int, username: str, password
             _import_has_arachne_url_letter_relationships(data_transaction, data)
             _import_has_arachne_url_attachment_relationships(data_transaction, data)
             _import_has_arachne_url_undefined_relationships(data_transaction, data)
-
-    logger.info('=====')
-    logger.info('Import done.')
-    logger.info('=====')
+        self.letters += len(data)
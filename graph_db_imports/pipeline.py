@@ -0,0 +1,175 @@
+import logging
+import queue
+import threading
+import time
+
+import ead_reader.main as ead_reader
+import ead_reader.places as places
+
+from data_structures import Letter
+from metrics import metrics
+from neo4j.v1 import Driver
+from neo4j_writer import BatchWriter
+from typing import Any, List, Optional, Tuple
+from validation import report
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# marks the end of the input of a stage
+_DONE: object = object()
+# how often (in seconds) a stage blocked on a queue checks whether the import has been aborted
+_POLL_INTERVAL: float = 0.1
+
+
+class ImportPipeline:
+    """Imports EAD files into Neo4j with three stages running at the same time, connected by bounded queues:
+
+    * the parser reads the letter components of the EAD files, one file after the other, and fetches the Gazetteer
+      places of every `places.GAZETTEER_BATCH_SIZE` components with batched requests (see
+      `places.prefetch_gazetteer_locations`) before passing them on;
+    * `resolvers` threads extract the letters from the components, fetching the authority data of their persons
+      and places from GND and the Gazetteer (this is where the import waits for the network);
+    * the writer writes the letters to Neo4j in batches of `batch_size` letters (see `BatchWriter`).
+
+    A stage whose output queue is full waits for the next stage, so that the memory used does not depend on the
+    size of the input and the import takes about as long as its slowest stage. If a stage fails the others stop,
+    and `run` raises its exception."""
+
+    def __init__(self, driver: Driver, batch_size: int = 500, resolvers: int = 4, queue_size: int = 1000):
+        self.driver: Driver = driver
+        self.batch_size: int = batch_size
+        self.resolvers: int = resolvers
+        self.components: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.letters: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._stop: threading.Event = threading.Event()
+        self._error: Optional[BaseException] = None
+        self.written: int = 0
+
+    def run(self, file_paths: List[str]) -> int:
+        """Imports the EAD files and returns the number of letters written."""
+        logger.info('-----')
+        logger.info(f'Starting pipelined import of {len(file_paths)} files ...')
+        logger.info('-----')
+        threads: List[threading.Thread] = [threading.Thread(target=self._stage, args=('parse', self._parse, file_paths),
+                                                            name='parse')]
+        threads += [threading.Thread(target=self._stage, args=('resolve', self._resolve), name=f'resolve-{i}')
+                    for i in range(self.resolvers)]
+        threads.append(threading.Thread(target=self._stage, args=('write', self._write), name='write'))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+        report.log()
+        logger.info('=====')
+        logger.info(f'Import done: {self.written} letters.')
+        logger.info('=====')
+        return self.written
+
+    def _stage(self, name: str, target, *args) -> None:
+        try:
+            target(*args)
+        except BaseException as error:
+            logger.error(f'Stage {name} failed: {error!r}')
+            if self._error is None:
+                self._error = error
+            self._stop.set()
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _parse(self, file_paths: List[str]) -> None:
+        for file_path in file_paths:
+            logger.info(f'Parsing input file {file_path} ...')
+            chunk: List[Tuple[str, Any]] = []
+            start: float = time.perf_counter()
+            for archive_id, xml_element in ead_reader.iter_ead_components(file_path):
+                chunk.append((archive_id, xml_element))
+                if len(chunk) >= places.GAZETTEER_BATCH_SIZE:
+                    metrics.add_stage('parse', time.perf_counter() - start)
+                    if not self._prefetch(file_path, chunk):
+                        return
+                    chunk = []
+                    start = time.perf_counter()
+            metrics.add_stage('parse', time.perf_counter() - start)
+            if not self._prefetch(file_path, chunk):
+                return
+
+        for _ in range(self.resolvers):
+            self._put(self.components, _DONE)
+
+    def _prefetch(self, file_path: str, chunk: List[Tuple[str, Any]]) -> bool:
+        """Fetches the Gazetteer places of a chunk of components, then passes the components on."""
+        start: float = time.perf_counter()
+        with report.file_scope(file_path):
+            places.prefetch_gazetteer_locations([xml_element for _, xml_element in chunk])
+        metrics.add_stage('prefetch', time.perf_counter() - start)
+
+        for archive_id, xml_element in chunk:
+            if not self._put(self.components, (file_path, archive_id, xml_element)):
+                return False
+        return True
+
+    def _resolve(self) -> None:
+        while True:
+            component: Tuple[str, str, Any] = self._get(self.components)
+            if component is _DONE:
+                self._put(self.letters, _DONE)
+                return
+
+            file_path, archive_id, xml_element = component
+            start: float = time.perf_counter()
+            with report.file_scope(file_path):
+                letter: Letter = ead_reader.extract_letter(archive_id, xml_element)
+            seconds: float = time.perf_counter() - start
+            metrics.add_letters(1, seconds)
+            metrics.add_stage('resolve', seconds)
+            if not self._put(self.letters, letter):
+                return
+
+    def _write(self) -> None:
+        done: int = 0
+        batch: List[Letter] = []
+
+        with self.driver.session() as session:
+            writer: BatchWriter = BatchWriter(session)
+            writer.write_schema()
+
+            while done < self.resolvers:
+                letter: Any = self._get(self.letters)
+                if letter is _DONE:
+                    if self._stop.is_set():
+                        return
+                    done += 1
+                else:
+                    batch.append(letter)
+
+                if len(batch) >= self.batch_size or (batch and done == self.resolvers):
+                    start: float = time.perf_counter()
+                    writer.write(batch)
+                    metrics.add_stage('write', time.perf_counter() - start)
+                    self.written += len(batch)
+                    logger.info(f'{self.written} letters written.')
+                    batch = []
+
+
+def pipelined_import(file_paths: List[str], driver: Driver, batch_size: int = 500, resolvers: int = 4,
+                     queue_size: int = 1000) -> int:
+    return ImportPipeline(driver, batch_size, resolvers, queue_size).run(file_paths)
@@ -0,0 +1,135 @@
+"""Tests of the batched GND to Gazetteer resolution, against a local fake Gazetteer endpoint"""
+
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ead_reader.places as places  # noqa: E402
+from validation import report  # noqa: E402
+
+# GND id: places of the fake Gazetteer
+PLACES = {
+    "4076769-6": [{"gazId": "2323295", "prefLocation": {"coordinates": [12.48, 41.89]}}],
+    "4005728-8": [{"gazId": "2282761", "prefLocation": {"coordinates": [13.4, 52.52]}},
+                  {"gazId": "2282762", "prefLocation": {"coordinates": [13.5, 52.5]}}],
+    "4041370-9": [{"gazId": "2049874", "prefLocation": {"coordinates": []}}],
+}
+
+
+def _gnd_ids(query):
+    ids = query["bool"]["must"][1]["nested"]["query"]["bool"]["must"][0]["bool"]["should"]
+    return [clause["match"]["ids.value"]["query"] for clause in ids]
+
+
+class FakeGazetteer(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+        server.clients.add(self.client_address)
+        # fail every request, or every request after the first `fail` ones
+        if server.fail is True or (server.fail is not False and len(server.requests) > server.fail):
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        params = parse_qs(urlparse(self.path).query)
+        results = [dict(place, identifiers=[{"context": "GND-ID", "value": gnd_id}])
+                   for gnd_id in _gnd_ids(json.loads(params["q"][0])) for place in PLACES.get(gnd_id, [])]
+        offset, limit = int(params["offset"][0]), min(int(params["limit"][0]), server.page_size)
+        body = json.dumps({"total": len(results), "result": results[offset:offset + limit]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def gazetteer():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGazetteer)
+    server.requests, server.clients, server.fail, server.page_size = [], set(), False, 100
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    places.gnd_to_gazetteer_mapping.clear()
+    report.reset()
+    yield server, "http://127.0.0.1:{}/search.json".format(server.server_port)
+    server.shutdown()
+    server.server_close()
+    places.gnd_to_gazetteer_mapping.clear()
+
+
+def test_fetch_gazetteer_locations(gazetteer):
+    server, url = gazetteer
+    gnd_ids = {"4076769-6": "k1", "4005728-8": "k2", "4041370-9": "k3", "0000000-0": "k4"}
+    places.fetch_gazetteer_locations(gnd_ids, batch_size=3, url=url)
+
+    assert len(server.requests) == 2
+    # one keep-alive connection for all the requests
+    assert len(server.clients) == 1
+    assert places.gnd_to_gazetteer_mapping == {
+        "4076769-6": ("2323295", 41.89, 12.48),
+        # the first of several places
+        "4005728-8": ("2282761", 52.52, 13.4),
+        "4041370-9": ("2049874", None, None),
+        "0000000-0": (None, None, None),
+    }
+    assert report.entries("place_without_authority_coordinates") == [("4041370-9", "2049874", "k3")]
+    assert report.entries("place_without_gnd_gazetteer_mapping") == [("0000000-0", "GND", "k4")]
+
+
+def test_fetch_gazetteer_locations_pages(gazetteer):
+    server, url = gazetteer
+    # the 4 places of the batch are read in 2 requests
+    server.page_size = 3
+    places.fetch_gazetteer_locations({"4005728-8": "k2", "4041370-9": "k3", "4076769-6": "k1"}, url=url)
+
+    assert [parse_qs(urlparse(path).query)["offset"] for path in server.requests] == [["0"], ["3"]]
+    assert places.gnd_to_gazetteer_mapping == {
+        "4076769-6": ("2323295", 41.89, 12.48),
+        "4005728-8": ("2282761", 52.52, 13.4),
+        "4041370-9": ("2049874", None, None),
+    }
+    assert report.entries("place_without_gnd_gazetteer_mapping") == []
+
+
+def test_fetch_gazetteer_locations_truncated(gazetteer):
+    server, url = gazetteer
+    # the second page, with the place of 4076769-6, cannot be read
+    server.page_size, server.fail = 2, 1
+    places.fetch_gazetteer_locations({"4005728-8": "k2", "0000000-0": "k4", "4076769-6": "k1"}, url=url)
+
+    assert len(server.requests) == 2
+    # the ids without places in the first page are left out, not mapped to no place
+    assert places.gnd_to_gazetteer_mapping == {"4005728-8": ("2282761", 52.52, 13.4)}
+    assert report.entries("place_without_gnd_gazetteer_mapping") == []
+    assert report.entries("place_without_authority_coordinates") == []
+
+
+def test_fetch_gazetteer_locations_skips_known_ids(gazetteer):
+    server, url = gazetteer
+    places.gnd_to_gazetteer_mapping["4076769-6"] = ("2323295", 41.89, 12.48)
+    places.fetch_gazetteer_locations({"4076769-6": "k1"}, url=url)
+    assert server.requests == []
+
+
+def test_fetch_gazetteer_locations_failed_request(gazetteer):
+    server, url = gazetteer
+    server.fail = True
+    places.fetch_gazetteer_locations({"4076769-6": "k1", "4005728-8": "k2"}, url=url)
+
+    assert len(server.requests) == 1
+    # requested again one by one when the letters are read
+    assert places.gnd_to_gazetteer_mapping == {}
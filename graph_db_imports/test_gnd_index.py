@@ -0,0 +1,110 @@
+"""Tests of the local GND index, built from small sample dumps"""
+
+import gzip
+import json
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import gnd_index  # noqa: E402
+import ead_reader.main as main  # noqa: E402
+import ead_reader.places as places  # noqa: E402
+
+GND = "https://d-nb.info/standards/elementset/gnd#"
+GEO = "http://www.opengis.net/ont/geosparql#"
+XSD_DATE = "^^<http://www.w3.org/2001/XMLSchema#date>"
+
+SAMPLE_NT = """\
+<https://d-nb.info/gnd/118538454> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <{gnd}DifferentiatedPerson> .
+<https://d-nb.info/gnd/118538454> <{gnd}preferredNameForThePerson> "Gerhard, Eduard" .
+<https://d-nb.info/gnd/118538454> <{gnd}preferredNameEntityForThePerson> _:n0 .
+<https://d-nb.info/gnd/118538454> <{gnd}dateOfBirth> "1795-11-29"{date} .
+<https://d-nb.info/gnd/118538454> <{gnd}dateOfDeath> "1867-05-12"{date} .
+<https://d-nb.info/gnd/118538454> <{gnd}variantNameForThePerson> "Gerhard, Friedrich Wilhelm Eduard" .
+<https://d-nb.info/gnd/1000000001> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <{gnd}DifferentiatedPerson> .
+<https://d-nb.info/gnd/4076769-6> <{gnd}preferredNameForThePlaceOrGeographicName> "Rom" .
+<https://d-nb.info/gnd/4076769-6> <{geo}hasGeometry> _:b0 .
+_:b0 <{geo}asWKT> "Point ( +012.483333 +041.900000 )"^^<{geo}wktLiteral> .
+_:b1 <{geo}asWKT> "Point ( +013.400000 +052.516667 )"^^<{geo}wktLiteral> .
+<https://d-nb.info/gnd/4005728-8> <{gnd}preferredNameForThePlaceOrGeographicName> "Berlin" .
+<https://d-nb.info/gnd/4005728-8> <{geo}hasGeometry> _:b1 .
+<https://d-nb.info/gnd/4031483-2> <{gnd}preferredNameForThePlaceOrGeographicName> "K\\u00F6ln \\"am Rhein\\"" .
+""".format(gnd=GND, geo=GEO, date=XSD_DATE)
+
+SAMPLE_JSONLD = [
+    {"id": "https://d-nb.info/gnd/118538454", "gndIdentifier": "118538454", "preferredName": "Gerhard, Eduard",
+     "dateOfBirth": ["1795-11-29"], "dateOfDeath": ["1867-05-12"]},
+    {"gndIdentifier": "4076769-6", "preferredName": "Rom",
+     "hasGeometry": [{"asWKT": ["Point ( +012.483333 +041.900000 )"], "type": "Point"}]},
+    {"@id": "https://d-nb.info/gnd/4005728-8",
+     GND + "preferredNameForThePlaceOrGeographicName": [{"@value": "Berlin"}],
+     GEO + "hasGeometry": [{"@id": "_:b1", GEO + "asWKT": [{"@value": "Point ( +013.400000 +052.516667 )"}]}]},
+]
+
+
+@pytest.fixture
+def nt_dump(tmp_path):
+    path = str(tmp_path / "gnd_sample.nt.gz")
+    with gzip.open(path, "wt", encoding="utf-8") as out:
+        out.write(SAMPLE_NT)
+    return path
+
+
+@pytest.fixture
+def jsonld_dump(tmp_path):
+    path = str(tmp_path / "gnd_sample.jsonl")
+    with open(path, "w") as out:
+        out.write("\n".join(json.dumps(node) for node in SAMPLE_JSONLD))
+    return path
+
+
+@pytest.fixture
+def index(tmp_path, nt_dump):
+    index = gnd_index.build_index(str(tmp_path / "gnd.sqlite"), [nt_dump])
+    yield index
+    index.close()
+
+
+def test_build_from_ntriples(index):
+    assert len(index) == 5
+    assert index.get("118538454") == gnd_index.GndEntry("1795-11-29", "1867-05-12", "Gerhard, Eduard", [])
+    assert index.get("1000000001") == gnd_index.GndEntry(None, None, None, [])
+    assert index.get("4076769-6") == gnd_index.GndEntry(None, None, "Rom", ["Point ( +012.483333 +041.900000 )"])
+    # the geometry is read before the place
+    assert index.get("4005728-8").wkt == ["Point ( +013.400000 +052.516667 )"]
+    assert index.get("4031483-2").name == 'Köln "am Rhein"'
+    assert index.get("0000000-0") is None
+
+
+def test_build_from_jsonld(tmp_path, jsonld_dump):
+    index = gnd_index.build_index(str(tmp_path / "gnd.sqlite"), [jsonld_dump])
+    assert len(index) == 3
+    assert index.get("118538454") == gnd_index.GndEntry("1795-11-29", "1867-05-12", "Gerhard, Eduard", [])
+    assert index.get("4076769-6") == gnd_index.GndEntry(None, None, "Rom", ["Point ( +012.483333 +041.900000 )"])
+    assert index.get("4005728-8") == gnd_index.GndEntry(None, None, "Berlin", ["Point ( +013.400000 +052.516667 )"])
+    index.close()
+
+
+def test_ead_reader_resolves_from_index(index, monkeypatch):
+    requested = []
+    # Graph.load is the rdflib < 6 API the reader uses
+    monkeypatch.setattr(main.Graph, "load", lambda graph, url: requested.append(url), raising=False)
+    monkeypatch.setattr(gnd_index, "index", index)
+    monkeypatch.setattr(main, "gnd_biographical_person_data_dict", {})
+    monkeypatch.setattr(places, "gnd_coordinates_mapping", {})
+    monkeypatch.setattr(places, "gnd_id_to_name_mapping", {})
+
+    main._fetch_gnd_biographical_person_data("k1", "118538454")
+    places._fetch_gnd_location_coordinates("k1", "4076769-6")
+    assert places._fetch_gnd_location_name("4031483-2", "k1") == 'Köln "am Rhein"'
+    assert requested == []
+    assert main.gnd_biographical_person_data_dict["118538454"] == (date(1795, 11, 29), date(1867, 5, 12))
+    assert places.gnd_coordinates_mapping["4076769-6"] == (41.9, 12.483333)
+
+    # not in the dumps: requested from d-nb.info
+    main._fetch_gnd_biographical_person_data("k2", "0000000-0")
+    assert requested == ["https://d-nb.info/gnd/0000000-0/about/lds"]
@@ -29,11 +29,11 @@ def _extract_persons(line: List[str], index_tuple_list: List[Tuple[int, int]]) -
             name_presumed = False
             gnd_id = line[j]
 
-            results.append(Person(name=name,
-                                  name_presumed=name_presumed,
-                                  is_corporation=False,
-                                  auth_source='GND',
-                                  auth_id=gnd_id))
+            results.append(Person.interned(name=name,
+                                           name_presumed=name_presumed,
+                                           is_corporation=False,
+                                           auth_source='GND',
+                                           auth_id=gnd_id))
 
     return results
 
@@ -53,7 +53,7 @@ def _extract_place(line: List[str], index_tuple: Tuple[int, int]) -> Place:
         auth_source = 'GND'
         auth_id = line[index_tuple[1]]
 
-    return Place(name=name, name_presumed=name_presumed, auth_source=auth_source, auth_id=auth_id, auth_name='')
+    return Place.interned(name=name, name_presumed=name_presumed, auth_source=auth_source, auth_id=auth_id, auth_name='')
 
 
 def _extract_letter_data(
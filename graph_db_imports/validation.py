@@ -0,0 +1,156 @@
+import csv
+import json
+import logging
+import threading
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# name of a category: (description, names of the fields of its entries)
+CATEGORIES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    'place_without_gnd_authority_source': (
+        'Places without GND authority source',
+        ('place name', 'authority source', 'authority id', 'authority name', 'kalliope_id')),
+    'place_without_gnd_gazetteer_mapping': (
+        'Places without GND Gazetteer mapping',
+        ('authority id', 'authority source', 'kalliope_id')),
+    'place_without_authority_coordinates': (
+        'Places without authority coordinates',
+        ('GND id', 'Gazetteer id', 'kalliope_id')),
+    'place_name_differs_from_authority_name': (
+        'Places where the name does not match the authority place name',
+        ('place name', 'authority name', 'kalliope_id')),
+    'place_gnd_id_invalid': (
+        'Places with GND authority id on which the GND server does not respond',
+        ('authority source', 'authority id', 'authority url', 'kalliope_id')),
+    'person_without_gnd_authority_source': (
+        'Persons without GND authority source',
+        ('person name', 'authority source', 'authority id', 'authority name', 'kalliope_id')),
+    'person_name_differs_from_authority_name': (
+        'Persons where the name does not match the authority name',
+        ('person name', 'authority name', 'kalliope_id')),
+    'person_gnd_id_invalid': (
+        'Persons with GND authority id on which the GND server does not respond',
+        ('person name', 'authority source', 'authority id', 'authority name', 'url', 'kalliope_id')),
+    'letter_origin_date_invalid': (
+        'Letters with invalid origin dates',
+        ('kalliope_id', 'origin date')),
+}
+
+GLOBAL_SCOPE: str = '*'
+
+
+def _sort_key(entry: Tuple) -> Tuple[str, ...]:
+    return tuple('' if value is None else str(value) for value in entry)
+
+
+class ValidationReport:
+    """Collects the problems found in the metadata (missing or invalid authority data, invalid dates...) by category.
+
+    Every category is an ordered set of entries (tuples with the fields of the category), in a global scope and in
+    the scope of the file that is being read (see `file_scope`), so that adding an entry takes constant time however
+    many entries there are. An entry is only added once per scope; by default an entry is identified by all of its
+    fields, another `key` (e.g. the name and the authority name, without the letter) keeps only its first occurrence.
+    It can be shared by the threads of a pipelined import."""
+
+    def __init__(self):
+        self._lock: threading.Lock = threading.Lock()
+        self._local: threading.local = threading.local()
+        self.reset()
+
+    def reset(self) -> None:
+        # scope: category: key: entry
+        self._scopes: Dict[str, Dict[str, Dict[Tuple, Tuple]]] = {GLOBAL_SCOPE: {}}
+
+    @property
+    def current_file(self) -> Optional[str]:
+        return getattr(self._local, 'file', None)
+
+    @contextmanager
+    def file_scope(self, file_path: str):
+        """The entries added by this thread inside the block are also added to the scope of the file."""
+        previous: Optional[str] = self.current_file
+        self._local.file = file_path
+        try:
+            yield
+        finally:
+            self._local.file = previous
+
+    def add(self, category: str, entry: Tuple, key: Tuple = None) -> bool:
+        """Adds an entry to a category, returns False if it was already in the report."""
+        if category not in CATEGORIES:
+            raise KeyError(f'Unknown validation category: {category}')
+        key = entry if key is None else key
+        scopes: List[str] = [GLOBAL_SCOPE] if self.current_file is None else [GLOBAL_SCOPE, self.current_file]
+
+        is_new: bool = False
+        with self._lock:
+            for scope in scopes:
+                entries: Dict[Tuple, Tuple] = self._scopes.setdefault(scope, {}).setdefault(category, {})
+                if key not in entries:
+                    entries[key] = entry
+                    is_new = True
+        return is_new
+
+    def files(self) -> List[str]:
+        return [scope for scope in self._scopes if scope != GLOBAL_SCOPE]
+
+    def entries(self, category: str, file_path: str = None) -> List[Tuple]:
+        """The entries of a category in the order in which they were added, of a file or of the whole import."""
+        return list(self._scopes.get(file_path or GLOBAL_SCOPE, {}).get(category, {}).values())
+
+    def counts(self, file_path: str = None) -> Dict[str, int]:
+        scope: Dict[str, Dict[Tuple, Tuple]] = self._scopes.get(file_path or GLOBAL_SCOPE, {})
+        return {category: len(scope[category]) for category in CATEGORIES if scope.get(category)}
+
+    def __len__(self) -> int:
+        return sum(self.counts().values())
+
+    def _rows(self) -> Iterator[Tuple[str, str, Tuple]]:
+        """(category, file, entry) for every entry of the file scopes, then for those added outside of any file."""
+        in_files: Dict[str, set] = {category: set() for category in CATEGORIES}
+        for file_path in self.files():
+            for category, entries in self._scopes[file_path].items():
+                for key, entry in entries.items():
+                    in_files[category].add(key)
+                    yield category, file_path, entry
+        for category, entries in self._scopes[GLOBAL_SCOPE].items():
+            for key, entry in entries.items():
+                if key not in in_files[category]:
+                    yield category, '', entry
+
+    def log(self, file_path: str = None) -> None:
+        """Logs the entries of a file (or of the whole import), sorted, one category after the other."""
+        scope: Dict[str, Dict[Tuple, Tuple]] = self._scopes.get(file_path or GLOBAL_SCOPE, {})
+        for category, (description, fields) in CATEGORIES.items():
+            if scope.get(category):
+                logger.info('-----')
+                logger.info(f'{description} ({", ".join(fields)}):')
+                logger.info('-----')
+                for entry in sorted(scope[category].values(), key=_sort_key):
+                    logger.info(' | '.join(str(value) for value in entry))
+
+    def write_csv(self, path: str) -> None:
+        """Writes one row per entry: category, file, then the fields of the entry (see `CATEGORIES`)."""
+        with open(path, 'w', newline='') as out:
+            writer = csv.writer(out)
+            writer.writerow(['category', 'file', 'fields...'])
+            for category, file_path, entry in self._rows():
+                writer.writerow([category, file_path] + ['' if value is None else value for value in entry])
+
+    def write_json(self, path: str) -> None:
+        """Writes a JSON list with one object per entry, written entry by entry."""
+        with open(path, 'w') as out:
+            out.write('[')
+            for i, (category, file_path, entry) in enumerate(self._rows()):
+                item: Dict = {'category': category, 'file': file_path}
+                item.update(zip(CATEGORIES[category][1], entry))
+                out.write(',\n' if i else '\n')
+                out.write(json.dumps(item, ensure_ascii=False))
+            out.write('\n]\n')
+
+
+# the validation report of the current run, shared by the readers
+report: ValidationReport = ValidationReport()
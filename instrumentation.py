@@ -0,0 +1,120 @@
+"""
+Timing and profiling of the stages of a pipeline (e.g. the annotation of a volume).
+
+An `Instrumentation` collects the wall-clock time and the number of calls of every stage, plus a few
+counters (pages, sentences, tokens...), and writes them as a JSON summary at the end of a run::
+
+    instr = Instrumentation()
+    with instr.stage("tokenize"):
+        sents = tokenize(text)
+    instr.count("sentences", len(sents))
+    ...
+    instr.write("stats.json")
+
+`timed` does the same as a decorator. With `profile=True` every stage also has its own `cProfile`
+profiler, and `dump_profiles` writes one `<stage>.prof` file per stage (to be read with `pstats`, or
+turned into a flamegraph with e.g. `flameprof` or `snakeviz`); stages must not be nested in this case.
+
+A disabled instrumentation (the default of the `Annotator`, `Instrumentation.disabled()`) returns the
+same no-op context manager for every stage, so that the instrumented code pays one method call per stage.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+_NOOP = nullcontext()
+
+
+class Instrumentation:
+    """
+    :param enabled: if False, stages and counters are not recorded
+    :param profile: run a cProfile profiler during every stage
+    """
+
+    def __init__(self, enabled=True, profile=False):
+        self.enabled = enabled
+        self.profile = profile and enabled
+        self.seconds = Counter()
+        self.calls = Counter()
+        self.counters = Counter()
+        self.profiles = {}
+        self._start = time.perf_counter()
+
+    @classmethod
+    def disabled(cls):
+        return cls(enabled=False)
+
+    def stage(self, name):
+        """Context manager that times (and if `profile`, profiles) a stage"""
+        if not self.enabled:
+            return _NOOP
+        return self._stage(name)
+
+    @contextmanager
+    def _stage(self, name):
+        profiler = None
+        if self.profile:
+            profiler = self.profiles.get(name)
+            if profiler is None:
+                profiler = self.profiles[name] = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            self.calls[name] += 1
+            if profiler is not None:
+                profiler.disable()
+
+    def timed(self, name=None):
+        """Decorator that runs a function as a stage (named after the function by default)"""
+        def decorator(func):
+            stage_name = name or func.__name__
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    def summary(self):
+        """The times of the stages (total, mean and share of the run) and the counters"""
+        elapsed = time.perf_counter() - self._start
+        stages = {}
+        for name, seconds in self.seconds.most_common():
+            stages[name] = {"calls": self.calls[name], "seconds": round(seconds, 6),
+                            "mean": round(seconds / self.calls[name], 6),
+                            "share": round(seconds / elapsed, 4) if elapsed else 0.0}
+        summary = {"elapsed": round(elapsed, 3), "stages": stages, "counters": dict(self.counters)}
+        if "pages" in self.counters and elapsed:
+            summary["pages_per_minute"] = round(60 * self.counters["pages"] / elapsed, 2)
+        return summary
+
+    def write(self, path):
+        """Writes the summary as JSON (and logs it)"""
+        summary = self.summary()
+        with open(path, "w") as out:
+            json.dump(summary, out, indent=2)
+        for name, s in summary["stages"].items():
+            logger.info("{:<12} {:>6} calls {:>10.2f}s ({:.1%})".format(name, s["calls"], s["seconds"], s["share"]))
+        return summary
+
+    def dump_profiles(self, directory):
+        """Writes the profile of every stage to `directory/<stage>.prof`"""
+        os.makedirs(directory, exist_ok=True)
+        for name, profiler in self.profiles.items():
+            profiler.dump_stats(os.path.join(directory, "{}.prof".format(name)))
@@ -1,3 +1,5 @@
+import os
+import re
 from nltk.corpus.reader import ConllCorpusReader
 from nltk.util import LazyMap, LazyConcatenation
 
@@ -37,4 +39,53 @@ class KorrIOBCorpusReader(ConllCorpusReader):
                 self._get_column(grid, self._colmap['chunk'])#,
 #                self._get_column(grid, self._colmap['entityid'])
                 ))
-                
\ No newline at end of file
+                
+
+
+# columns of (word, pos, lemma, textlayer, chunk) in the IOB files and in the WebAnno TSV files
+# written by the annotation scripts (id, word, pos, lemma, text layer, entity layer, NE tag)
+IOB_COLUMNS = (0, 1, 2, 3, 4)
+TSV_COLUMNS = (1, 2, 3, 4, 6)
+
+
+def read_tagged_page(path):
+    """
+    Reads a page file (IOB or TSV, by extension) without a corpus reader: returns the list of its
+    sentences (lists of tuples (word, pos, lemma, textlayer, chunk)), as `full_tagged_sents` does
+    """
+    columns = TSV_COLUMNS if path.endswith(".tsv") else IOB_COLUMNS
+    sents, sent = [], []
+    with open(path) as f:
+        for line in f:
+            if not line.strip() or (columns is TSV_COLUMNS and line.startswith("#")):
+                if sent:
+                    sents.append(sent)
+                    sent = []
+                continue
+            # the IOB files are split as ConllCorpusReader does (on any whitespace)
+            cols = line.rstrip("\n").split("\t") if columns is TSV_COLUMNS else line.split()
+            sent.append(tuple(cols[i] if i < len(cols) else "O" for i in columns))
+    if sent:
+        sents.append(sent)
+    return sents
+
+
+class KorrTSVCorpusReader():
+    """
+    Reads the WebAnno TSV files written by the annotation scripts (one file per page) with the same
+    interface of `KorrIOBCorpusReader.full_tagged_sents`
+    """
+
+    def __init__(self, root, fileids=r".*\.tsv"):
+        self.root = root
+        self._fileids = sorted(f for f in os.listdir(root) if re.match(fileids + "$", f))
+
+    def fileids(self):
+        return list(self._fileids)
+
+    def full_tagged_sents(self, fileids=None):
+        if fileids is None:
+            fileids = self._fileids
+        elif isinstance(fileids, str):
+            fileids = [fileids]
+        return [s for f in fileids for s in read_tagged_page(os.path.join(self.root, f))]
@@ -0,0 +1,293 @@
+"""
+Index of the letters of the IOB corpus.
+
+The pages of a volume are files of their own (e.g. `1_Braun_an_Gerhard1832-35_page001.iob`), while
+a letter can span several pages. Every page opens with a heading (text layer HEAD) that repeats the
+author, the addressee and the date of the letter, and the heading of a new letter has its own
+HEAD tokens (in the volumes without HEAD layer, the clusters of PERauthor/PERaddressee/DATEletter
+entities are used as headings). The index is built with a single scan of the corpus: a heading starts
+a new letter when its (parsed) DATEletter differs from the one of the current letter or, if one of the
+two dates is missing or cannot be parsed (e.g. OCR errors like `183 ~`), when its PERauthor or
+PERaddressee differ (names are compared loosely, as they are often garbled by the OCR).
+
+For every letter the index records its pages, the position of its first token and the position
+where the next letter starts (sentence, token), so that a letter can be retrieved or exported by
+reading only its own pages.
+
+Usage:
+    letter_index.py [options] <config-file>
+
+Options:
+    -i FILE --index=FILE    Where the index is stored (default: letters.json in the corpus directory)
+    --export DIR            Write every letter as an IOB file to DIR
+"""
+
+import json
+import logging
+import os
+import re
+from collections import namedtuple
+from date_normalizer import normalize_date, DATE_PATTERN
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "letters.json"
+
+# the entities that identify a letter
+LETTER_LABELS = ("PERauthor", "PERaddressee", "DATEletter")
+# max distance (in tokens) between the letter entities of a heading, in pages without HEAD layer
+HEADING_GAP = 12
+
+_PAGE = re.compile(r"^(?P<volume>.*)_page(?P<page>\d+)")
+
+# position of a token in the corpus: page file, sentence and token number in the page
+Position = namedtuple("Position", ["fileid", "sent", "token"])
+
+Letter = namedtuple("Letter", ["id", "volume", "author", "addressee", "date", "date_text", "pages", "start", "end"])
+Letter.__doc__ = """A letter: `start` is its first token, `end` the first token of the next letter (None at the end of the volume)"""
+
+
+def page_key(fileid):
+    """Volume and page number of a page file (the order of the pages in the index)"""
+    m = _PAGE.match(fileid)
+    return (m.group("volume"), int(m.group("page"))) if m else (fileid, 0)
+
+
+def _headings(fileid, sents):
+    """
+    The headings of a page, as tuples (position of the first token, tokens): the runs of tokens
+    of the HEAD text layer or, in pages without it, the clusters of letter entities
+    (at most `HEADING_GAP` tokens apart) with a DATEletter
+    """
+    flat = [(s, t, tok) for s, sent in enumerate(sents) for t, tok in enumerate(sent)]
+    if any(tok[3] == "HEAD" for _, _, tok in flat):
+        selected = [i for i, (_, _, tok) in enumerate(flat) if tok[3] == "HEAD"]
+        gap = 1
+    else:
+        selected = [i for i, (_, _, tok) in enumerate(flat) if tok[-1][2:] in LETTER_LABELS]
+        gap = HEADING_GAP + 1
+    runs, run = [], []
+    for i in selected:
+        if run and i - run[-1] > gap:
+            runs.append(run)
+            run = []
+        run.append(i)
+    if run:
+        runs.append(run)
+    for run in runs:
+        tokens = [flat[j][2] for j in range(run[0], run[-1] + 1)]
+        # without HEAD layer, only a date tells a heading from a signature or a greeting
+        if gap == 1 or any(tok[-1][2:] == "DATEletter" for tok in tokens):
+            yield Position(fileid, *flat[run[0]][:2]), tokens
+
+
+def _same_person(a, b):
+    """Unknown or equal names (up to OCR noise at the edges, e.g. `HBrunn` and `Brunn`)"""
+    if a is None or b is None:
+        return True
+    a, b = a.lower(), b.lower()
+    return a in b or b in a
+
+
+def _same_date(date1, text1, date2, text2):
+    """Equal dates, or the same month if one of them has no day (e.g. `August 1858`)"""
+    if date1 == date2:
+        return True
+    has_day = [DATE_PATTERN.match(t).group("day") is not None for t in (text1, text2)]
+    return not all(has_day) and date1[:7] == date2[:7]
+
+
+def _entities(tokens, labels):
+    """Text of the first entity of each label among tagged tokens (tuples ending with the IOB tag)"""
+    found, current = {}, None
+    for tok in tokens:
+        tag = tok[-1]
+        label = tag[2:]
+        if tag.startswith("I-") and label == current:
+            found[label].append(tok[0])
+        elif label in labels and label not in found:
+            found[label] = [tok[0]]
+            current = label
+        else:
+            current = None
+    return {k: " ".join(v) for k, v in found.items()}
+
+
+class LetterIndex:
+    """
+    The letters of a corpus, with O(1) access by id and by page.
+
+    :param letters: list of `Letter`
+    :param source: {fileid: [size, mtime]} of the corpus files the index was built from
+    """
+
+    def __init__(self, letters, source=None):
+        self.letters = letters
+        self.source = source or {}
+        self._by_page = {}
+        for letter in letters:
+            for p in letter.pages:
+                self._by_page.setdefault(p, []).append(letter.id)
+
+    @staticmethod
+    def _signature(corpus):
+        sig = {}
+        for f in corpus.fileids():
+            st = os.stat(os.path.join(corpus.root, f))
+            sig[f] = [st.st_size, st.st_mtime_ns]
+        return sig
+
+    @classmethod
+    def build(cls, corpus):
+        """
+        Scans a corpus once and collects its letters
+
+        :param corpus: a `KorrIOBCorpusReader`
+        """
+        letters = []
+        # the letter being built
+        current = None
+
+        def close(end):
+            if current is not None:
+                pages = current["pages"]
+                if end is not None and end[1:] == (0, 0) and pages[-1] == end.fileid:
+                    # the next letter starts with the page
+                    pages = pages[:-1]
+                letters.append(Letter(len(letters), current["volume"], current["author"], current["addressee"],
+                                      current["date"], current["date_text"], pages, current["start"], end))
+
+        for fileid in sorted(corpus.fileids(), key=page_key):
+            volume = page_key(fileid)[0]
+            if current is not None and current["volume"] != volume:
+                close(None)
+                current = None
+            if current is not None:
+                current["pages"].append(fileid)
+            sents = corpus.full_tagged_sents(fileids=[fileid])
+            for run_start, run in _headings(fileid, sents):
+                ents = _entities(run, LETTER_LABELS)
+                if not ents:
+                    # e.g. page numbers
+                    continue
+                date_text = ents.get("DATEletter")
+                date = normalize_date(date_text) if date_text else None
+                author, addressee = ents.get("PERauthor"), ents.get("PERaddressee")
+                if current is not None:
+                    if date is not None and current["date"] is not None:
+                        # the dates are more reliable than the names (OCR errors)
+                        same = _same_date(date, date_text, current["date"], current["date_text"])
+                    else:
+                        same = _same_person(author, current["author"]) and \
+                               _same_person(addressee, current["addressee"])
+                    if same:
+                        if current["date"] is None and date is not None:
+                            current["date"], current["date_text"] = date, date_text
+                        continue
+                    close(run_start)
+                current = {"volume": volume, "author": author, "addressee": addressee, "date": date,
+                           "date_text": date_text, "pages": [fileid], "start": run_start}
+        close(None)
+        logger.info("{} letters in {} pages".format(len(letters), len(corpus.fileids())))
+        return cls(letters, cls._signature(corpus))
+
+    def save(self, path):
+        with open(path, "w") as out:
+            json.dump({"source": self.source, "letters": [l._asdict() for l in self.letters]}, out)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            saved = json.load(f)
+        letters = []
+        for l in saved["letters"]:
+            l["start"] = Position(*l["start"])
+            l["end"] = Position(*l["end"]) if l["end"] else None
+            letters.append(Letter(**l))
+        return cls(letters, saved["source"])
+
+    @classmethod
+    def for_corpus(cls, corpus, path=None):
+        """Loads the index of a corpus, or (re)builds and saves it if the corpus changed"""
+        path = path or os.path.join(corpus.root, INDEX_NAME)
+        if os.path.isfile(path):
+            index = cls.load(path)
+            if index.source == cls._signature(corpus):
+                return index
+            logger.info("The corpus changed: rebuilding the letter index")
+        index = cls.build(corpus)
+        index.save(path)
+        return index
+
+    def __len__(self):
+        return len(self.letters)
+
+    def __iter__(self):
+        return iter(self.letters)
+
+    def __getitem__(self, letter_id):
+        return self.letters[letter_id]
+
+    def letters_of_page(self, fileid):
+        """The letters (or parts of letters) on a page"""
+        return [self.letters[i] for i in self._by_page.get(fileid, [])]
+
+    def letter_at(self, position):
+        """The letter a token belongs to (None if the token comes before the first letter of its volume)"""
+        for letter in reversed(self.letters_of_page(position.fileid)):
+            if letter.start.fileid != position.fileid or tuple(letter.start[1:]) <= tuple(position[1:]):
+                return letter
+        return None
+
+    def sents(self, corpus, letter_id):
+        """
+        The tagged sentences of a letter (the first and last ones may be cut at the letter boundaries);
+        only the pages of the letter are read.
+        """
+        letter = self.letters[letter_id]
+        result = []
+        for fileid in letter.pages:
+            sents = list(corpus.full_tagged_sents(fileids=[fileid]))
+            first_s, first_t = (letter.start.sent, letter.start.token) if fileid == letter.start.fileid else (0, 0)
+            if letter.end is not None and fileid == letter.end.fileid:
+                last_s, last_t = letter.end.sent, letter.end.token
+            else:
+                last_s, last_t = len(sents), 0
+            for s in range(first_s, min(last_s + 1, len(sents))):
+                sent = sents[s]
+                start = first_t if s == first_s else 0
+                stop = last_t if s == last_s else len(sent)
+                if stop > start:
+                    result.append(sent[start:stop])
+        return result
+
+    def export(self, corpus, letter_id, path):
+        """Writes a letter as an IOB file"""
+        with open(path, "w") as out:
+            for sent in self.sents(corpus, letter_id):
+                for tok in sent:
+                    out.write("\t".join(tok) + "\n")
+                out.write("\n")
+
+    def split(self, corpus, outdir):
+        """Exports every letter to `outdir` (files named `<volume>_letter<nnn>.iob`)"""
+        os.makedirs(outdir, exist_ok=True)
+        counts = {}
+        for letter in self.letters:
+            n = counts[letter.volume] = counts.get(letter.volume, 0) + 1
+            self.export(corpus, letter.id, os.path.join(outdir, "{}_letter{:03d}.iob".format(letter.volume, n)))
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+    from config_reader import ProjectCofiguration
+    from korr_corpusreader import KorrIOBCorpusReader
+
+    logging.basicConfig(level=logging.INFO)
+    args = docopt(__doc__)
+    conf = ProjectCofiguration(args["<config-file>"])
+    cols = ["words", "pos", "lemma", "textlayer", "chunk", "entityid"]
+    corpus = KorrIOBCorpusReader(conf.root_training, r".*\.iob", columntypes=cols)
+    index = LetterIndex.for_corpus(corpus, args["--index"])
+    if args["--export"]:
+        index.split(corpus, args["--export"])
@@ -0,0 +1,232 @@
+"""
+Persistence of the trained CRF models.
+
+A model is stored as two files sharing the same base name:
+
+* ``<name>.crfsuite``: the native (binary) model written by CRFsuite during training;
+* ``<name>.json``: a small metadata file with the labels, the fingerprint of the feature
+  template, the hash of the dictionaries and the hash of the training corpus.
+
+Models are loaded lazily: nothing is read from disk until the first prediction, and then
+the binary file is opened directly by the CRFsuite tagger, so that no (large) Python
+object has to be unpickled at startup.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+logger = logging.getLogger(__name__)
+
+MODEL_EXT = ".crfsuite"
+META_EXT = ".json"
+LEGACY_EXT = ".pickle"
+
+
+def template_fingerprint(template):
+    """Returns a stable fingerprint of a feature template (a tuple of tuples of (name, offset)).
+
+    :param template: the feature template
+    :type template: tuple
+    :return: str (hex digest)
+    """
+    return hashlib.sha1(repr(tuple(template)).encode("utf-8")).hexdigest()
+
+
+def dictionaries_hash(dictionaries):
+    """Returns a hash of a dictionary { category : entry_list }, independent of the order of the categories.
+
+    :param dictionaries: the dictionaries used for feature extraction
+    :type dictionaries: dict
+    :return: str (hex digest)
+    """
+    h = hashlib.sha1()
+    for k in sorted(dictionaries):
+        h.update(k.encode("utf-8"))
+        h.update("\n".join(dictionaries[k]).encode("utf-8"))
+    return h.hexdigest()
+
+
+def files_hash(paths):
+    """Returns a hash of the content of a list of files (e.g. the IOB files of a training corpus).
+
+    :param paths: list of paths
+    :return: str (hex digest)
+    """
+    h = hashlib.sha1()
+    for p in sorted(paths):
+        h.update(os.path.basename(p).encode("utf-8"))
+        with open(p, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def _base_path(path):
+    base, ext = os.path.splitext(path)
+    return base if ext in (MODEL_EXT, META_EXT, LEGACY_EXT) else path
+
+
+def save_model(crf, path, template, dictionaries, corpus_files=(), **extra):
+    """Saves a fitted `sklearn_crfsuite.CRF` as native CRFsuite model plus metadata.
+
+    :param crf: a fitted CRF
+    :param path: output path (with or without extension)
+    :param template: the feature template used to extract the features
+    :param dictionaries: the dictionaries used to extract the features
+    :param corpus_files: paths of the files of the training corpus
+    :param extra: further (JSON-serializable) values to store in the metadata
+    :return: str: the path of the native model
+    """
+    if crf.modelfile.name is None:
+        raise ValueError("The model is not fitted yet!")
+    base = _base_path(path)
+    model_path = base + MODEL_EXT
+    shutil.copyfile(crf.modelfile.name, model_path)
+
+    meta = {
+        "labels": list(crf.classes_),
+        "template": template_fingerprint(template),
+        "dictionaries": dictionaries_hash(dictionaries),
+        "corpus": files_hash(corpus_files) if corpus_files else None,
+        "params": {p: getattr(crf, p, None) for p in ("algorithm", "c1", "c2", "max_iterations",
+                                                       "all_possible_transitions")},
+    }
+    meta.update(extra)
+    with open(base + META_EXT, "w") as out:
+        json.dump(meta, out, indent=2)
+    logger.info("Model written to {}".format(model_path))
+    return model_path
+
+
+def load_model(path, template=None, dictionaries=None):
+    """Returns a lazily loaded model. If a template (or the dictionaries) is passed,
+    it is checked against the metadata and a ValueError is raised on mismatch.
+
+    For backwards compatibility, `path` may point to an old pickled model: if a native model
+    with the same base name exists it is used, otherwise the pickle is loaded on first use.
+
+    :param path: path to the model (`.crfsuite`, `.json`, `.pickle` or the base name)
+    :param template: the feature template that will be used with the model
+    :param dictionaries: the dictionaries that will be used with the model
+    :return: CRFModel
+    """
+    model = CRFModel(path)
+    if template is not None:
+        model.check_template(template)
+    if dictionaries is not None:
+        model.check_dictionaries(dictionaries)
+    return model
+
+
+class CRFModel:
+    """
+    A read-only CRF model that opens its CRFsuite tagger only when it is needed.
+    It exposes the subset of the `sklearn_crfsuite.CRF` interface used for annotation
+    (`predict`, `predict_single`, `classes_`, `tagger_`).
+    """
+
+    def __init__(self, path):
+        base = _base_path(path)
+        self.model_path = base + MODEL_EXT
+        self.meta_path = base + META_EXT
+        self.legacy_path = base + LEGACY_EXT if path.endswith(LEGACY_EXT) else None
+        self._meta = None
+        self._tagger = None
+        self._legacy = None
+
+        if not os.path.isfile(self.model_path):
+            if self.legacy_path and os.path.isfile(self.legacy_path):
+                logger.warning("No native model found for {}: it will be unpickled on first use. "
+                               "Run `python model_store.py {}` to convert it.".format(path, path))
+            else:
+                raise FileNotFoundError(self.model_path)
+
+    @property
+    def is_native(self):
+        return os.path.isfile(self.model_path)
+
+    @property
+    def metadata(self):
+        if self._meta is None:
+            if os.path.isfile(self.meta_path):
+                with open(self.meta_path) as f:
+                    self._meta = json.load(f)
+            else:
+                self._meta = {}
+        return self._meta
+
+    def check_template(self, template):
+        stored = self.metadata.get("template")
+        if stored is not None and stored != template_fingerprint(template):
+            raise ValueError("The model {} was trained with a different feature template!".format(self.model_path))
+
+    def check_dictionaries(self, dictionaries):
+        stored = self.metadata.get("dictionaries")
+        if stored is not None and stored != dictionaries_hash(dictionaries):
+            raise ValueError("The model {} was trained with different dictionaries!".format(self.model_path))
+
+    @property
+    def tagger_(self):
+        if self._tagger is None:
+            if self.is_native:
+                import pycrfsuite
+                tagger = pycrfsuite.Tagger()
+                tagger.open(self.model_path)
+                self._tagger = tagger
+            else:
+                self._tagger = self._load_legacy().tagger_
+        return self._tagger
+
+    def _load_legacy(self):
+        if self._legacy is None:
+            import pickle
+            with open(self.legacy_path, "rb") as f:
+                self._legacy = pickle.load(f)
+        return self._legacy
+
+    @property
+    def classes_(self):
+        labels = self.metadata.get("labels")
+        return list(labels) if labels is not None else self.tagger_.labels()
+
+    def predict_single(self, xseq):
+        return self.tagger_.tag(xseq)
+
+    def predict(self, X):
+        tagger = self.tagger_
+        return [tagger.tag(xseq) for xseq in X]
+
+    def close(self):
+        if self._tagger is not None and self.is_native:
+            self._tagger.close()
+        self._tagger = None
+
+
+def convert_pickle(pickle_path, template, dictionaries):
+    """Converts an old pickled CRF into a native model (plus metadata) with the same base name.
+
+    :param pickle_path: path to the pickled `sklearn_crfsuite.CRF`
+    :param template: the template the model was trained with
+    :param dictionaries: the dictionaries the model was trained with
+    :return: str: the path of the native model
+    """
+    import pickle
+    with open(pickle_path, "rb") as f:
+        crf = pickle.load(f)
+    return save_model(crf, pickle_path, template, dictionaries)
+
+
+if __name__ == "__main__":
+    import sys
+    from config_reader import ProjectCofiguration
+    from templates import template1
+    from training import load_dictionaries
+
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2:
+        print("Usage: model_store.py <model.pickle> [<config-file>]")
+        sys.exit(1)
+    conf = ProjectCofiguration(sys.argv[2] if len(sys.argv) > 2 else "lib/config/korr_main.json")
+    convert_pickle(sys.argv[1], template1, load_dictionaries(conf.dictionaries))
@@ -0,0 +1,260 @@
+"""
+Regex preprocessing of the text of the TEI pages.
+
+The preprocessing rules are a pickled list of (compiled regex, replacement) pairs
+(see `preprocessing_regexp` in the configuration) that used to be applied one by one,
+each `sub` scanning the whole page again. `RegexPreprocessor` groups consecutive compatible
+rules into *stages*: the rules of a stage are merged into a single alternation, so that the
+stage needs only one pass over the text. Since merging can change the result when a rule works
+on the output of a previous one, stages are only built (`optimize`) if their output is identical
+to the sequential application of their rules on a set of sample texts, and the plan can be
+validated on the whole TEI collection.
+
+Usage:
+    preprocessing.py [--tei DIR] [--save] <regexp-pickle>
+
+Options:
+    --tei DIR   Directory with the TEI volumes [default: data/TEI/originals]
+    --save      Save the optimized plan next to the pickle
+"""
+
+import json
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# a backslash-escaped backslash, a numbered reference \g<n> or a numbered reference \n
+_TEMPLATE_REF = re.compile(r'\\\\|\\g<(\d+)>|\\(\d{1,2})')
+# backreferences inside a pattern
+_PATTERN_BACKREF = re.compile(r'\\\d|\(\?P=')
+# global inline flags, e.g. (?i)
+_INLINE_FLAGS = re.compile(r'\(\?[aiLmsux]+\)')
+
+
+def _shift_template(template, offset):
+    """Shifts the numbered group references of a replacement template by `offset`
+
+    >>> _shift_template(r'\\1\\2', 3)
+    '\\\\g<4>\\\\g<5>'
+    """
+    def shift(m):
+        n = m.group(1) or m.group(2)
+        return m.group(0) if n is None else '\\g<{}>'.format(int(n) + offset)
+    return _TEMPLATE_REF.sub(shift, template)
+
+
+_LITERAL_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v'}
+_LITERAL_PATTERN = re.compile(r'(?:[^\\.^$*+?{}\[\]|()]|\\[^A-Za-z0-9]|\\[ntrfv]|\\x[0-9a-fA-F]{2}|\\u[0-9a-fA-F]{4})+')
+_LITERAL_TOKEN = re.compile(r'\\x([0-9a-fA-F]{2})|\\u([0-9a-fA-F]{4})|\\([ntrfv])|\\(.)|(.)', re.S)
+
+
+def _as_literal(pattern, repl):
+    """
+    Returns (string, replacement) if the rule is a plain string substitution
+    (pattern without metacharacters and case-sensitive, replacement without references), else None
+
+    >>> _as_literal(re.compile('\\xad'), '-')
+    ('\xad', '-')
+    """
+    if not isinstance(repl, str) or '\\' in repl or pattern.flags & (re.IGNORECASE | re.VERBOSE) \
+            or not _LITERAL_PATTERN.fullmatch(pattern.pattern):
+        return None
+
+    def unescape(m):
+        hex2, hex4, esc, char, plain = m.groups()
+        if hex2 or hex4:
+            return chr(int(hex2 or hex4, 16))
+        if esc:
+            return _LITERAL_ESCAPES[esc]
+        return char if char is not None else plain
+    return _LITERAL_TOKEN.sub(unescape, pattern.pattern), repl
+
+
+def _mergeable(rule):
+    pattern, repl = rule
+    # named groups could be defined twice in the alternation
+    return isinstance(repl, str) and not _PATTERN_BACKREF.search(pattern.pattern) \
+        and not _INLINE_FLAGS.match(pattern.pattern) and not pattern.groupindex
+
+
+class Stage:
+    """One or more rules applied with a single `sub`"""
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._literal = None
+        if len(self.rules) == 1:
+            self._regex, self._repl = self.rules[0]
+            # plain strings are much faster with str.replace
+            self._literal = _as_literal(*self.rules[0])
+            return
+
+        parts, self._templates = [], {}
+        group = 1
+        for pattern, repl in self.rules:
+            parts.append("({})".format(pattern.pattern))
+            self._templates[group] = _shift_template(repl, group)
+            group += 1 + pattern.groups
+        self._regex = re.compile("|".join(parts), self.rules[0][0].flags)
+        templates = self._templates
+        # the wrapping group of a rule is the last one to close, so m.lastindex tells which rule matched
+        if any('\\' in t for t in templates.values()):
+            self._repl = lambda m: m.expand(templates[m.lastindex])
+        else:
+            self._repl = lambda m: templates[m.lastindex]
+
+    def __call__(self, text):
+        if self._literal is not None:
+            return text.replace(*self._literal)
+        return self._regex.sub(self._repl, text)
+
+
+class RegexPreprocessor:
+    """
+    Applies a list of (regex, replacement) rules to a text, with the same result as
+
+        for reg in rules:
+            text = reg[0].sub(reg[1], text)
+
+    :param rules: list of tuples (compiled regex, replacement)
+    :param plan: list of lists of rule indexes (the stages); by default every rule is a stage of its own
+    """
+
+    def __init__(self, rules, plan=None):
+        self.rules = [tuple(r[:2]) for r in rules]
+        self.plan = plan if plan is not None else [[i] for i in range(len(self.rules))]
+        self._stages = [Stage([self.rules[i] for i in stage]) for stage in self.plan]
+
+    @classmethod
+    def from_pickle(cls, path):
+        """Loads the rules (and, if it was saved, the optimized plan) for a pickled list of rules"""
+        import pickle
+
+        with open(path, "rb") as f:
+            rules = pickle.load(f)
+        plan = None
+        if os.path.isfile(cls.plan_path(path)):
+            with open(cls.plan_path(path)) as f:
+                saved = json.load(f)
+            if saved.get("rules") == cls._fingerprint(rules):
+                plan = saved["plan"]
+            else:
+                logger.warning("The preprocessing plan is outdated: rules are applied sequentially")
+        return cls(rules, plan)
+
+    @staticmethod
+    def plan_path(pickle_path):
+        return os.path.splitext(pickle_path)[0] + ".stages.json"
+
+    @staticmethod
+    def _fingerprint(rules):
+        return [[r[0].pattern, r[0].flags, r[1] if isinstance(r[1], str) else None] for r in rules]
+
+    def save_plan(self, pickle_path):
+        with open(self.plan_path(pickle_path), "w") as out:
+            json.dump({"rules": self._fingerprint(self.rules), "plan": self.plan}, out, indent=2)
+
+    def __call__(self, text):
+        for stage in self._stages:
+            text = stage(text)
+        return text
+
+    def sequential(self, text):
+        """The reference result: every rule applied one after the other"""
+        for pattern, repl in self.rules:
+            text = pattern.sub(repl, text)
+        return text
+
+    def optimize(self, texts):
+        """
+        Greedily merges consecutive compatible rules, keeping a merge only if the merged stage gives
+        the same output as its rules applied in sequence on all the sample texts, and is faster.
+
+        :param texts: sample texts
+        :return: self
+        """
+        texts = list(texts)
+        plan = []
+        for i, rule in enumerate(self.rules):
+            current = plan[-1] if plan else None
+            if current and _mergeable(rule) and all(_mergeable(self.rules[j]) for j in current) \
+                    and rule[0].flags == self.rules[current[0]][0].flags:
+                candidate = current + [i]
+                if self._equivalent(candidate, texts):
+                    plan[-1] = candidate
+                    continue
+            plan.append([i])
+        self.plan = plan
+        self._stages = [Stage([self.rules[i] for i in stage]) for stage in plan]
+        return self
+
+    def _equivalent(self, indexes, texts):
+        merged = Stage([self.rules[i] for i in indexes])
+        separate = [Stage([self.rules[i]]) for i in indexes]
+        merged_time = separate_time = 0.0
+        for text in texts:
+            start = time.perf_counter()
+            expected = text
+            for stage in separate:
+                expected = stage(expected)
+            separate_time += time.perf_counter() - start
+            start = time.perf_counter()
+            result = merged(text)
+            merged_time += time.perf_counter() - start
+            if result != expected:
+                return False
+        return merged_time < separate_time
+
+    def validate(self, texts):
+        """Returns the indexes of the texts where the staged result differs from the sequential one"""
+        return [n for n, text in enumerate(texts) if self(text) != self.sequential(text)]
+
+    def profile(self, texts):
+        """
+        Time spent by every rule (applied sequentially) and by every stage of the plan on a list of texts
+
+        :return: dict with two lists of (description, seconds)
+        """
+        texts = list(texts)
+        rules = []
+        current = texts
+        for pattern, repl in self.rules:
+            start = time.perf_counter()
+            current = [pattern.sub(repl, t) for t in current]
+            rules.append((pattern.pattern, time.perf_counter() - start))
+        stages = []
+        current = texts
+        for indexes, stage in zip(self.plan, self._stages):
+            start = time.perf_counter()
+            current = [stage(t) for t in current]
+            stages.append((" | ".join(self.rules[i][0].pattern for i in indexes), time.perf_counter() - start))
+        return {"rules": rules, "stages": stages}
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+    from glob import glob
+    from lxml import etree
+
+    logging.basicConfig(level=logging.INFO)
+    args = docopt(__doc__)
+    ns = {'tei': "http://www.tei-c.org/ns/1.0"}
+
+    texts = []
+    for path in sorted(glob(os.path.join(args["--tei"], "*", "transcription.xml"))):
+        for page in etree.parse(path).xpath("//tei:body/tei:div", namespaces=ns):
+            texts.append("\n".join(p.text for p in page if p.text is not None))
+    logger.info("{} pages".format(len(texts)))
+
+    pre = RegexPreprocessor.from_pickle(args["<regexp-pickle>"]).optimize(texts)
+    mismatches = pre.validate(texts)
+    logger.info("Plan: {} ({} pages differ from the sequential result)".format(pre.plan, len(mismatches)))
+    timing = pre.profile(texts)
+    for kind in ("rules", "stages"):
+        for desc, secs in timing[kind]:
+            logger.info("{:<7} {:8.3f}s  {!r}".format(kind[:-1], secs, desc))
+    if args["--save"] and not mismatches:
+        pre.save_plan(args["<regexp-pickle>"])
@@ -1,7 +1,11 @@
 #!/usr/env/bin python
 """
 Usage:
-	python annotateTXT.py <path_to_txt_file>
+	annotateTXT.py [--stats FILE] [--profile DIR] <path_to_txt_file>
+
+Options:
+    --stats FILE    Write the times of the stages and the page/sentence/token counters to FILE (JSON)
+    --profile DIR   Profile every stage with cProfile and write the profiles to DIR (<stage>.prof)
 	
 """
 
@@ -10,125 +14,76 @@ import sys
 sys.path.append("../")
 sys.path.append("../../iDAIPublications")
 
-from config_reader import ProjectCofiguration
-from idai_journals.nlp import DAITokenizeSent
-import pyxmi
 import os
-import pickle
-from training import load_dictionaries
+from functools import lru_cache
+from instrumentation import Instrumentation
 from templates import template1
-from collections import namedtuple
-from tqdm import tqdm
-
-Annotation = namedtuple('Annotation', ['token', 'pos', 'lemma', 'header', 'ne'])
-
 
 # Fine-tune your parameters here!
-conf = ProjectCofiguration(os.path.expanduser("~/PycharmProjects/Gelehrtenkorrespondenz/lib/config/korr_mac.json"))
-outdir = os.path.join(conf.project_root, "data/test")
+config_path = os.path.expanduser("~/PycharmProjects/Gelehrtenkorrespondenz/lib/config/korr_mac.json")
 basename = '10_BOOK-ZID1313751.txt'
-model_path = os.path.join(conf.project_root, "lib/models/korrespondez_model_stage9.pickle")
+model_name = "lib/models/korrespondez_model_stage9.pickle"
 sent_tokenizer_path = os.path.expanduser('~/PycharmProjects/Gelehrtenkorrespondenz/lib/tokenizers/korrespondenz_sent_tok.pickle')
 
 #d = {
 #    "persons": "lib/dictionaries/persons.txt",
 #    "places": "lib/dictionaries/places.txt"
 #  }
-dicts = load_dictionaries(conf.dictionaries)
-
-with open(model_path, 'rb') as f:
-    crf = pickle.load(f)
-
-
-def add_ner_tags(x, ner_tagged_toks, span_toks):
-    pass
-
-
-def pos_tag_sents(tokenized_sents):
-    from treetagger import TreeTagger
-
-    tagged_sents = []
-    for i, s in enumerate(tokenized_sents):
-        tt = TreeTagger(language='german')
-        tags = [t for t in tt.tag(s) if len(t) > 1]
-        tags = [tuple(tag + ["_", ""]) for tag in tags]
-        tagged_sents.append(tags)
-    return tagged_sents
 
+# set before the first page is annotated (see the --stats and --profile options)
+instrumentation = Instrumentation.disabled()
 
-def crf_annotate(tagged_sents, model = crf, dictionaries=dicts, template=template1):
-    from training import InstanceFeatureExtractor
 
-    ext = InstanceFeatureExtractor(tagged_sents, dictionaries)
+# The configuration and the resources are loaded on first use, so that e.g. --help does not wait for the model
+@lru_cache(maxsize=None)
+def get_config():
+    from config_reader import ProjectCofiguration
+    return ProjectCofiguration(config_path)
 
-    X_anno = ext.extract_features(template)
-    y_pred = model.predict(X_anno)
-    assert len(tagged_sents) == len(y_pred), "The lists of tokens and predictions are not in sync!"
-    anno = []
-    for s, p in zip(tagged_sents, y_pred):
-        anno_sent = []
-        for tok_sent, tok_pred in zip(s, p):
-            anno_sent.append(tuple(list(tok_sent[:-1]) + [tok_pred]))
-        anno.append(anno_sent)
-    return anno
 
+@lru_cache(maxsize=None)
+def get_annotator():
+    from training import load_dictionaries
+    from model_store import load_model
+    from annotator import Annotator
 
-def _setEntityId(netag):
-    if netag == 'O':
-        entity_tag = 'O'
-    else:
-        entity_tag = netag[0] + '-webanno.custom.LetterEntity_'
-    return entity_tag
-
-
-def toTSV(annotated_sentences, tokenized_sentences):
-    assert len(annotated_sentences) == len(tokenized_sentences), "Mismatch between annotated and tokenized sentences!"
-    tsv = '''# de.tudarmstadt.ukp.dkpro.core.api.lexmorph.type.pos.POS | PosValue # de.tudarmstadt.ukp.dkpro.core.api.segmentation.type.Lemma|value  # webanno.custom.Tex | LayoutElement # webanno.custom.LetterEntity | entity_id | value\n'''
-    for sent_num, (anno_sent, tok_sent) in enumerate(zip(annotated_sentences, tokenized_sentences)):
-        tsv = "{}#id={}\n#text={}\n".format(tsv, sent_num + 1, tok_sent.replace("\n", ' '))
-        for i, t in enumerate(anno_sent):
-            tok = Annotation(*t)
-            entity_id = _setEntityId(tok.ne)
-            tsv_line = (
-            "{}-{}".format(sent_num + 1, i + 1), tok.token, tok.pos, tok.lemma, tok.header, entity_id, tok.ne, "")
-            tsv = tsv + "{}\n".format("\t".join(tsv_line))
-        tsv = tsv + "\n"
-
-    return tsv
-
-
-def annotate_sents(sents):
-    """Writes the processed page into a XMI tree
-
-    :param page: str: text of a page
-    :return: None
-    """
-    tagged_sents = pos_tag_sents(sents)
-    ner_tagged_sents = crf_annotate(tagged_sents)
-    return ner_tagged_sents
+    conf = get_config()
+    dicts = load_dictionaries(conf.dictionaries)
+    crf = load_model(os.path.join(conf.project_root, model_name), template=template1, dictionaries=dicts)
+    return Annotator(crf, dicts, template=template1, sent_tokenizer_path=sent_tokenizer_path,
+                     instrumentation=instrumentation)
 
 
 def process_page(page):
-    sents = DAITokenizeSent(page, sent_tokenizer_path)
-    annotated_sents = annotate_sents(sents)
-    tsv = toTSV(annotated_sents, sents)
-    return tsv
+    from annotator import toTSV
+
+    sents, annotated_sents = next(get_annotator().annotate_pages([page]))
+    return toTSV(annotated_sents, sents)
 
 
 def main(pages, start_num=1):
-    for num, p in enumerate(tqdm(pages)):
+    from tqdm import tqdm
+
+    outdir = os.path.join(get_config().project_root, "data/test")
+    for num, t in enumerate(tqdm(get_annotator().annotate_pages_tsv(pages), total=len(pages))):
         outname = os.path.join(outdir, basename + '_page' + "{0:0=3d}".format(int(num) + start_num) + '.tsv')
-        t = process_page(p)
-        with open(outname, 'w') as out:
+        with instrumentation.stage("write"), open(outname, 'w') as out:
             out.write(t)
 
 
 if __name__ == '__main__':
-    import sys
+    from docopt import docopt
 
-    inpath = sys.argv[1]
+    args = docopt(__doc__)
+    if args["--stats"] or args["--profile"]:
+        instrumentation = Instrumentation(profile=bool(args["--profile"]))
+    inpath = args["<path_to_txt_file>"]
     with open(inpath) as f:
         txt = f.read()
     pages = txt.split("\f")
     #main(pages[104:], start_num=105)
     main(pages)
+    if args["--stats"]:
+        instrumentation.write(args["--stats"])
+    if args["--profile"]:
+        instrumentation.dump_profiles(args["--profile"])
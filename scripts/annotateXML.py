@@ -2,8 +2,11 @@
 
 """Make sure you update your conf file and configuration options!
 Usage:
+    annotateXML.py [--stats FILE] [--profile DIR] <file.xml>
 
-annotateXML <file.xml>
+Options:
+    --stats FILE    Write the times of the stages and the page/sentence/token counters to FILE (JSON)
+    --profile DIR   Profile every stage with cProfile and write the profiles to DIR (<stage>.prof)
 
 """
 
@@ -12,21 +15,17 @@ sys.path.append("../")
 sys.path.append("../../iDAIPublications")
 
 from config_reader import ProjectCofiguration
-from idai_journals.nlp import DAITokenizeSent
 #import pyxmi
 import os
-import pickle
-from training import load_dictionaries
+from functools import lru_cache
+from annotator import toTSV
+from instrumentation import Instrumentation
+from tei_reader import PageIndex, page_text
 from templates import template1
-from collections import namedtuple
-from lxml import etree
 import logging
 
 logging.basicConfig(level=logging.INFO)
 
-Annotation = namedtuple('Annotation', ['token', 'pos', 'lemma', 'header', 'ne'])
-
-
 # Fine tune your parameters here!
 conf = ProjectCofiguration("../lib/config/korr_mac.json")
 outdir = os.path.join(conf.project_root, "data/TSV")
@@ -41,143 +40,77 @@ path_to_preproc = conf.preprocessing_regexp
 #    "persons": "lib/dictionaries/persons.txt",
 #    "places": "lib/dictionaries/places.txt"
 #  }
-dicts = load_dictionaries(conf.dictionaries)
 
-with open(model_path, 'rb') as f:
-    crf = pickle.load(f)
+# set before the first page is annotated (see the --stats and --profile options)
+instrumentation = Instrumentation.disabled()
 
 
-ns = {'tei': "http://www.tei-c.org/ns/1.0"}
-
-with open(path_to_preproc, "rb") as f:
-    regs = pickle.load(f)
-
-def getLines(page_el):
-    return [par for par in page_el if par.text is not None]
-
-
-def deleteRepeatedLines(lines):
-    half = int(len(lines) / 2)
-    isRepeat = False
-    if len(lines) <= 4:
-        lim = 2
-    else:
-        lim = 3
-    #check the first 3 lines (unless there are only 4 lines in a text...); add numbers if you want
-    for i in range(lim):
-        try:
-            if lines[half+i].text == lines[i].text:
-                isRepeat = True
-        except IndexError:
-            isRepeat = False
-    return lines[:half] if isRepeat == True else lines
-
-
-def preprocess_xml_page(page_el, regexps=regs):
-    lines = deleteRepeatedLines(getLines(page_el))
-    #lines = getLines(page_el)
-    p = "\n".join([l.text for l in lines])
-    for reg in regexps:
-        p = reg[0].sub(reg[1], p)
-    return p.replace("\n", "")
-    
-#with open("korrespondez_model.pickle", "rb") as f:
-#    crf = pickle.load(f)
-
-def getPages(xml):
-    return xml.xpath("//tei:body/tei:div", namespaces=ns)
-
-
-def add_ner_tags(x, ner_tagged_toks, span_toks):
-    pass
+# The resources are loaded on first use, so that e.g. --help does not wait for the model
+@lru_cache(maxsize=None)
+def get_annotator():
+    from training import load_dictionaries
+    from model_store import load_model
+    from annotator import Annotator
 
+    dicts = load_dictionaries(conf.dictionaries)
+    crf = load_model(model_path, template=template1, dictionaries=dicts)
+    return Annotator(crf, dicts, template=template1, sent_tokenizer_path=sent_tokenizer_path,
+                     instrumentation=instrumentation)
 
-def pos_tag_sents(tokenized_sents):
-    from treetagger import TreeTagger
 
-    tagged_sents = []
-    for i, s in enumerate(tokenized_sents):
-        tt = TreeTagger(language='german')
-        tags = [t for t in tt.tag(s) if len(t) > 1]
-        tags = [tuple(tag + ["_", ""]) for tag in tags]
-        tagged_sents.append(tags)
-    return tagged_sents
+@lru_cache(maxsize=None)
+def get_regexps():
+    from preprocessing import RegexPreprocessor
+    return RegexPreprocessor.from_pickle(path_to_preproc)
 
 
-def crf_annotate(tagged_sents, model = crf, dictionaries=dicts, template=template1):
-    from training import InstanceFeatureExtractor
-
-    ext = InstanceFeatureExtractor(tagged_sents, dictionaries)
-
-    X_anno = ext.extract_features(template)
-    y_pred = model.predict(X_anno)
-    assert len(tagged_sents) == len(y_pred), "The lists of tokens and predictions are not in sync!"
-    anno = []
-    for s, p in zip(tagged_sents, y_pred):
-        anno_sent = []
-        for tok_sent, tok_pred in zip(s, p):
-            anno_sent.append(tuple(list(tok_sent[:-1]) + [tok_pred]))
-        anno.append(anno_sent)
-    return anno
+ns = {'tei': "http://www.tei-c.org/ns/1.0"}
 
 
-def _setEntityId(netag):
-    if netag == 'O':
-        entity_tag = 'O'
-    else:
-        entity_tag = netag[0] + '-webanno.custom.LetterEntity_'
-    return entity_tag
+def preprocess_xml_page(page_el, regexps=None):
+    return page_text(page_el, regexps or get_regexps())
 
+#with open("korrespondez_model.pickle", "rb") as f:
+#    crf = pickle.load(f)
 
-def toTSV(annotated_sentences, tokenized_sentences):
-    assert len(annotated_sentences) == len(tokenized_sentences), "Mismatch between annotated and tokenized sentences!"
-    tsv = '''# de.tudarmstadt.ukp.dkpro.core.api.lexmorph.type.pos.POS | PosValue # de.tudarmstadt.ukp.dkpro.core.api.segmentation.type.Lemma|value  # webanno.custom.Tex | LayoutElement # webanno.custom.LetterEntity | entity_id | value\n'''
-    for sent_num, (anno_sent, tok_sent) in enumerate(zip(annotated_sentences, tokenized_sentences)):
-        tsv = "{}#id={}\n#text={}\n".format(tsv, sent_num + 1, tok_sent.replace("\n", ' '))
-        for i, t in enumerate(anno_sent):
-            tok = Annotation(*t)
-            entity_id = _setEntityId(tok.ne)
-            tsv_line = (
-            "{}-{}".format(sent_num + 1, i + 1), tok.token, tok.pos, tok.lemma, tok.header, entity_id, tok.ne, "")
-            tsv = tsv + "{}\n".format("\t".join(tsv_line))
-        tsv = tsv + "\n"
+def getPages(xml):
+    return xml.xpath("//tei:body/tei:div", namespaces=ns)
 
-    return tsv
 
+def add_ner_tags(x, ner_tagged_toks, span_toks):
+    pass
 
-def annotate_sents(sents):
-    """Writes the processed page into a XMI tree
 
-    :param page: str: text of a page
-    :return: None
-    """
-    tagged_sents = pos_tag_sents(sents)
-    ner_tagged_sents = crf_annotate(tagged_sents)
-    return ner_tagged_sents
+def process_page(page):
+    sents, annotated_sents = next(get_annotator().annotate_pages([page]))
+    return toTSV(annotated_sents, sents)
 
 
-def process_page(page):
-    sents = DAITokenizeSent(page, sent_tokenizer_path)
-    annotated_sents = annotate_sents(sents)
-    tsv = toTSV(annotated_sents, sents)
-    return tsv
+def _preprocess(pages):
+    for p in pages:
+        with instrumentation.stage("preprocess"):
+            text = preprocess_xml_page(p)
+        yield text
 
 
 def main(pages, start_num=1):
-    for num, p in enumerate(pages):
+    for num, t in enumerate(get_annotator().annotate_pages_tsv(_preprocess(pages))):
         logging.info("Working with page {}".format(num+start_num))
         outname = os.path.join(outdir, basename + '_page' + "{0:0=3d}".format(int(num) + start_num) + '.tsv')
-        pre = preprocess_xml_page(p)
-        t = process_page(pre)
-        with open(outname, 'w') as out:
+        with instrumentation.stage("write"), open(outname, 'w') as out:
             out.write(t)
 
 
 if __name__ == '__main__':
-    import sys
-
-    inpath = sys.argv[1]
-    #parse xml file
-    x = etree.parse(inpath)
-    pages = getPages(x)
-    main(pages[134:135], 135)
\ No newline at end of file
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    if args["--stats"] or args["--profile"]:
+        instrumentation = Instrumentation(profile=bool(args["--profile"]))
+    inpath = args["<file.xml>"]
+    # only the requested pages are parsed
+    main(PageIndex(inpath).pages(134, 135), 135)
+    if args["--stats"]:
+        instrumentation.write(args["--stats"])
+    if args["--profile"]:
+        instrumentation.dump_profiles(args["--profile"])
@@ -8,7 +8,11 @@ All the settings are defined in the first lines. Later we'll decide if we want
 to turn some of them into arguments for the program.
 
 Usage:
-    annotate_xml_letters.py <config-file>
+    annotate_xml_letters.py [--stats FILE] [--profile DIR] <config-file> <file.xml>
+
+Options:
+    --stats FILE    Write the times of the stages and the page/sentence/token counters to FILE (JSON)
+    --profile DIR   Profile every stage with cProfile and write the profiles to DIR (<stage>.prof)
 '''
 
 from lxml import etree
@@ -25,8 +29,14 @@ import logging
 import json
 from docopt import docopt
 
+sys.path.append("../")
+from model_store import load_model
+from preprocessing import RegexPreprocessor
+from tei_reader import iter_pages, PageIndex
+from instrumentation import Instrumentation
+
 
-args = docopt("__doc__")
+args = docopt(__doc__)
 
 with open(args["<config-file>"]) as f:
     j = json.load(f)
@@ -39,15 +49,16 @@ sent_tokenizer = j["sentence_tokenizer"]
 dics = j["dictionaries"]
 auth = (j["user"], j["password"])
 
+instr = Instrumentation(profile=bool(args["--profile"])) if args["--stats"] or args["--profile"] \
+    else Instrumentation.disabled()
+
 
 Annotation = namedtuple('Annotation', ['token', 'pos', 'lemma', 'header', 'ne'])
 ns = {'tei': "http://www.tei-c.org/ns/1.0"}
 
-with open(path_to_preproc, "rb") as f:
-    regs = pickle.load(f)
+regs = RegexPreprocessor.from_pickle(path_to_preproc)
 
-with open(path_to_mod, "rb") as f:
-    crf = pickle.load(f)
+crf = load_model(path_to_mod)
 
 def getLines(page_el):
     return [par for par in page_el if par.text is not None]
@@ -70,8 +81,7 @@ def deleteRepeatedLines(lines):
 def processPage(page_el, regexps=regs):
     lines = deleteRepeatedLines(getLines(page_el))
     p = "\n".join([l.text for l in lines])
-    for reg in regexps:
-        p = reg[0].sub(reg[1], p)
+    p = regexps(p)
     return p.replace("\n", "")
     
 #with open("korrespondez_model.pickle", "rb") as f:
@@ -144,20 +154,26 @@ def toTSV(annotated_sentences, tokenized_sentences):
 
 def processPages(fpath):
     basename = "tsv/" + os.path.splitext(os.path.basename(fpath))[0]
-    x = etree.parse(fpath)
-    pages = getPages(x)
-    for i, page in enumerate(pages):
+    for i, page in enumerate(iter_pages(fpath)):
         outname = basename + '_page' + "{0:0=3d}".format(i + 1) + '.tsv'
         print(outname)
         if os.path.isfile(outname):
             continue
-        proc_page = processPage(page)
-        tok_sents = tokenizeSents(proc_page)
-        tagged_sents = tagPage(tok_sents)
-        annotated_sents = annotateSents(tagged_sents)
-        tsv = toTSV(annotated_sents, tok_sents)
-        with open(outname, 'w') as out:
+        with instr.stage("preprocess"):
+            proc_page = processPage(page)
+        with instr.stage("tokenize"):
+            tok_sents = tokenizeSents(proc_page)
+        with instr.stage("pos_tag"):
+            tagged_sents = tagPage(tok_sents)
+        with instr.stage("annotate"):
+            annotated_sents = annotateSents(tagged_sents)
+        with instr.stage("tsv"):
+            tsv = toTSV(annotated_sents, tok_sents)
+        with instr.stage("write"), open(outname, 'w') as out:
             out.write(tsv)
+        instr.count("pages")
+        instr.count("sentences", len(tagged_sents))
+        instr.count("tokens", sum(len(s) for s in tagged_sents))
         #r = sendToWebanno(tsv, outname)
         #if r.status_code != requests.codes.ok:
         #    log.error("Your document was not posted: Error {}".format(r.status_code))
@@ -165,9 +181,7 @@ def processPages(fpath):
 def _test(fpath, page_num):
     basename = os.path.splitext(os.path.basename(fpath))[0]
     outname = basename + '_page' + "{0:0=3d}".format(int(page_num) + 1) + '.tsv'
-    x = etree.parse(fpath)
-    pages = getPages(x)
-    page = pages[int(page_num)]
+    page = PageIndex(fpath).page(int(page_num))
     proc_page = processPage(page)
     logging.debug("preprocessing done!")
     tok_sents = tokenizeSents(proc_page)
@@ -186,8 +200,12 @@ def _test(fpath, page_num):
 
 if __name__ == "__main__":
     #_test("/home/nlp-data/gelehrtekorrespondenz/tei/Brunn1858.xml", int(sys.argv[1]))
-    fpath  = os.path.join(xml_root, sys.argv[1])
+    fpath  = os.path.join(xml_root, args["<file.xml>"])
     processPages(fpath)
+    if args["--stats"]:
+        instr.write(args["--stats"])
+    if args["--profile"]:
+        instr.dump_profiles(args["--profile"])
 
 
 
@@ -1,28 +1,151 @@
 #!/usr/bin/env python
 
+"""
+Extract the (preprocessed) text of the TEI volumes, one TXT file per volume, with the pages
+separated by form feeds.
+
+Volumes are processed in parallel. A manifest in the output directory records, for every volume,
+the size, mtime and hash of its source and the preprocessing rules it was extracted with: volumes
+that did not change since the last build are skipped. Output files are written atomically.
+
+Usage:
+    extract_txt.py [options]
+
+Options:
+    -c CONFIG --config=CONFIG   Project configuration [default: ../lib/config/korr_mac.json]
+    --tei DIR                   Directory with the TEI volumes [default: ../data/TEI/originals]
+    --out DIR                   Output directory [default: ../data/TXT]
+    -j N --jobs=N               Number of processes (default: number of CPUs)
+    -f --force                  Extract all volumes, even if unchanged
+"""
+
 import sys
 sys.path.append("../")
 
+import hashlib
+import json
+import logging
 import os
-from lxml import etree
-from annotateXML import getPages, preprocess_xml_page
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from glob import glob
+from pathlib import Path
+from docopt import docopt
 from config_reader import ProjectCofiguration
-import pickle
-
-conf = ProjectCofiguration("../lib/config/korr_mac.json")
-path_to_preproc = conf.preprocessing_regexp
-
-with open(path_to_preproc, "rb") as f:
-    regs = pickle.load(f)
-    
-    
-files = glob("../data/TEI/originals/BOOK-*/transcription.xml")
-for f in files:
-    bookname = Path(f).parent.parts[-1]
-    x = etree.parse(f)
-    pages = getPages(x)
-    txts = [preprocess_xml_page(p) for p in pages]
-    with open("../data/TXT/" + bookname + '.txt', 'w') as out:
-        out.write("\n\f".join(txts))
\ No newline at end of file
+from file_utils import write_atomic
+from preprocessing import RegexPreprocessor
+from tei_reader import iter_pages, page_text
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = ".manifest.json"
+
+# the preprocessor of a worker process (see _init_worker)
+_regexps = None
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def rules_hash(preprocessor):
+    """Hash of the preprocessing rules: changing them invalidates all the volumes"""
+    return hashlib.sha1(json.dumps(preprocessor._fingerprint(preprocessor.rules)).encode("utf-8")).hexdigest()
+
+
+def load_manifest(outdir):
+    try:
+        with open(os.path.join(outdir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(outdir, manifest):
+    write_atomic(os.path.join(outdir, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True))
+
+
+def _init_worker(regexp_path):
+    global _regexps
+    _regexps = RegexPreprocessor.from_pickle(regexp_path)
+
+
+def extract_volume(src, dest):
+    """Extracts the text of a volume to `dest` (runs in a worker process)"""
+    txts = [page_text(p, _regexps) for p in iter_pages(src)]
+    write_atomic(dest, "\n\f".join(txts))
+    return len(txts)
+
+
+def plan(files, outdir, manifest, rules, force=False):
+    """
+    Compares the volumes with the manifest.
+
+    :return: (list of (bookname, src, dest, entry) to extract, number of unchanged volumes)
+    """
+    todo, unchanged = [], 0
+    for src in files:
+        bookname = Path(src).parent.parts[-1]
+        dest = os.path.join(outdir, bookname + '.txt')
+        st = os.stat(src)
+        entry = {"source": [st.st_size, st.st_mtime_ns], "rules": rules}
+        old = manifest.get(bookname)
+        if not force and old and os.path.isfile(dest) and old["rules"] == rules:
+            if old["source"] == entry["source"]:
+                unchanged += 1
+                continue
+            # touched, but not modified
+            entry["sha1"] = file_sha1(src)
+            if entry["sha1"] == old.get("sha1"):
+                manifest[bookname] = dict(old, source=entry["source"])
+                unchanged += 1
+                continue
+        todo.append((bookname, src, dest, entry))
+    return todo, unchanged
+
+
+def build(tei_dir, outdir, regexp_path, jobs=None, force=False):
+    """
+    Extracts the new or modified volumes of `tei_dir` to `outdir`
+
+    :return: dict with the number of extracted, unchanged and failed volumes
+    """
+    os.makedirs(outdir, exist_ok=True)
+    manifest = load_manifest(outdir)
+    rules = rules_hash(RegexPreprocessor.from_pickle(regexp_path))
+    files = sorted(glob(os.path.join(tei_dir, "BOOK-*", "transcription.xml")))
+    todo, unchanged = plan(files, outdir, manifest, rules, force)
+    logger.info("{} volumes to extract, {} unchanged".format(len(todo), unchanged))
+
+    failed = []
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(regexp_path,)) as pool:
+            futures = {pool.submit(extract_volume, src, dest): (bookname, src, entry)
+                       for bookname, src, dest, entry in todo}
+            for fut in as_completed(futures):
+                bookname, src, entry = futures[fut]
+                try:
+                    n_pages = fut.result()
+                except Exception:
+                    logger.exception("Extraction of {} failed".format(src))
+                    manifest.pop(bookname, None)
+                    failed.append(bookname)
+                    continue
+                entry.setdefault("sha1", file_sha1(src))
+                entry["pages"] = n_pages
+                manifest[bookname] = entry
+                logger.info("{}: {} pages".format(bookname, n_pages))
+    save_manifest(outdir, manifest)
+    return {"extracted": len(todo) - len(failed), "unchanged": unchanged, "failed": failed}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = docopt(__doc__)
+    conf = ProjectCofiguration(args["--config"])
+    jobs = int(args["--jobs"]) if args["--jobs"] else None
+    report = build(args["--tei"], args["--out"], conf.preprocessing_regexp, jobs=jobs, force=args["--force"])
+    print(json.dumps(report, indent=2))
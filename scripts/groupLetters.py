@@ -1,60 +1,86 @@
-import locale
-from datetime import datetime
+"""
+Writes the list of the pages of the gold corpus with the date of the letter they belong to
+(the first DATEletter entity of the page, normalized with date_normalizer), and the list of
+the dates that could not be parsed.
+
+Usage:
+    groupLetters.py [options]
+
+Options:
+    --iob DIR           Directory with the IOB files [default: ../data/IOB_GOLD]
+    -o FILE --out=FILE  Output list [default: LetterPageList.csv]
+    --log FILE          List of the dates that were not parsed [default: DatesNotParsed.tsv]
+    -j N --jobs=N       Number of processes (default: number of CPUs)
+"""
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from docopt import docopt
 from tqdm import tqdm
 
 import sys
 sys.path.append("../")
-from korr_corpusreader import KorrIOBCorpusReader
+from date_normalizer import normalize_date
 
+cols = ["words", "pos", "lemma", "textlayer", "chunk", "entityid"]
+WORDS, CHUNK = cols.index("words"), cols.index("chunk")
 
 
-locale.setlocale(locale.LC_TIME, ("de_DE", "UTF-8"))
-date_formats = ["%d %B %Y", "%d . %B %Y", "%d %B , %Y", "%d . %B , %Y",
-                "%d.%B %Y", "%d.%B.%Y", "%B %Y"]
+def sub_leaves(path, label):
+    """
+    Reads an IOB file and returns the words of the entities with a given label
+    (I- tags not continuing an entity of the same label open a new one, as in nltk's conlltags2tree)
+    """
+    chunks = []
+    current = None
+    with open(path) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) <= CHUNK:
+                current = None
+                continue
+            tag = fields[CHUNK]
+            if tag[2:] != label or tag == "O":
+                current = None
+                continue
+            if tag.startswith("B-") or current is None:
+                current = []
+                chunks.append(current)
+            current.append(fields[WORDS])
+    return chunks
 
-def sub_leaves(tree, label):
-    """it works with a tree and a label (from the chunker: ORG, LOC, PER, MISC).
-    it will return only the sub-tree correspodning to the label"""
-    return [t.leaves() for t in tree.subtrees(lambda s: s.label() == label)]
 
+def letter_date(path):
+    """
+    The (normalized) date of the letter of a page
 
-cols = ["words", "pos", "lemma", "textlayer", "chunk", "entityid"]
-korr = KorrIOBCorpusReader("../data/IOB_GOLD", ".*\.iob", columntypes=cols)
-
-letter_start = "###"
-
-not_parsed = []
-parsed = 0
-
-with open("LetterPageList.csv", "w") as out:
-    for f in tqdm(korr.fileids()):
-        cks_sents = korr.chunked_sents(f)
-        dates = []
-        for t in cks_sents:
-            dates.extend(sub_leaves(t, "DATEletter"))
-        dt_output = "Not parsed"
-        for date in dates:
-            if dt_output != "Not parsed":
-                break
-            dlist = [w[0] for w in date]
-            dlist[0] = dlist[0].zfill(2)
-            d = " ".join(dlist)
-            for date_format in date_formats:
-                try:
-                    dt = datetime.strptime(d, date_format)
-                    dt_output = dt.strftime('%Y-%m-%d')
-                except ValueError :
-                    not_parsed.append((f, d))
-                else:
-                    parsed += 1
-                    break
-            if dt_output == "Not parsed":
-                dt_output = d
-        out.write("{}\t{}\n".format(f, dt_output))
-
-
-with open("DatesNotParsed.tsv", "w") as log:
-    for n in not_parsed:
-        log.write("\t".join(n)+"\n")
-
-print("Tot files with a parsed date: {}".format(parsed))
+    :return: tuple (date or raw text of the first DATEletter, or "Not parsed" if there is none; parsed: bool)
+    """
+    dates = sub_leaves(path, "DATEletter")
+    if not dates:
+        return "Not parsed", False
+    dlist = dates[0]
+    dlist[0] = dlist[0].zfill(2)
+    d = " ".join(dlist)
+    dt_output = normalize_date(d)
+    return (dt_output, True) if dt_output is not None else (d, False)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    fileids = sorted(f for f in os.listdir(args["--iob"]) if re.match(r".*\.iob", f))
+    paths = [os.path.join(args["--iob"], f) for f in fileids]
+    jobs = int(args["--jobs"]) if args["--jobs"] else None
+
+    parsed = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool, open(args["--out"], "w") as out, \
+            open(args["--log"], "w") as log:
+        for f, (dt_output, ok) in zip(fileids, tqdm(pool.map(letter_date, paths, chunksize=64), total=len(paths))):
+            out.write("{}\t{}\n".format(f, dt_output))
+            if ok:
+                parsed += 1
+            elif dt_output != "Not parsed":
+                log.write("{}\t{}\n".format(f, dt_output))
+
+    print("Tot files with a parsed date: {}".format(parsed))
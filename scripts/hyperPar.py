@@ -4,6 +4,7 @@ sys.path.append("../")
 from korr_corpusreader import KorrIOBCorpusReader
 from training import Trainer
 from templates import template1
+from model_store import load_model
 
 from sklearn.metrics import make_scorer
 from sklearn.model_selection import RandomizedSearchCV
@@ -12,17 +13,16 @@ import scipy
 
 import sklearn_crfsuite
 from sklearn_crfsuite import scorers
-from sklearn_crfsuite import metrics
+from evaluation import flat_f1_score
 
 import pickle
 
-with open("../lib/models/korrespondez_model_stage4.pickle", "rb") as f:
-    m = pickle.load(f)
+m = load_model("../lib/models/korrespondez_model_stage4.pickle")
 
 labels = list(m.classes_)
 labels.remove('O') 
 
-f1_scorer = make_scorer(metrics.flat_f1_score,
+f1_scorer = make_scorer(flat_f1_score,
                         average='weighted', labels=labels)
 
 t = Trainer("../lib/config/korr_nlp.json")
@@ -1,7 +1,6 @@
 from matplotlib import pyplot as plt
 import numpy as np
 from sklearn.model_selection import learning_curve
-from sklearn_crfsuite import metrics
 from sklearn.metrics import make_scorer
 import pickle
 
@@ -9,6 +8,8 @@ import sys
 sys.path.append("../")
 from training import Trainer
 from templates import template1
+from model_store import load_model
+from evaluation import flat_f1_score
 
 
 def plot_learning_curve(estimator, title, X, y, scorer, ylim=None, cv=None,
@@ -82,13 +83,12 @@ def plot_learning_curve(estimator, title, X, y, scorer, ylim=None, cv=None,
     return train_sizes, train_scores, test_scores
 
 
-with open("../lib/models/korrespondez_model_stage7.pickle", "rb") as f:
-    m = pickle.load(f)
+m = load_model("../lib/models/korrespondez_model_stage7.pickle")
 
 labels = list(m.classes_)
 labels.remove('O')
 
-f1_scorer = make_scorer(metrics.flat_f1_score,
+f1_scorer = make_scorer(flat_f1_score,
                         average='weighted', labels=labels)
 
 t = Trainer("../lib/config/korr_nlp.json")
@@ -0,0 +1,42 @@
+"""
+Measure time and peak memory (resident set size) of the feature extraction
+(and optionally of the training) on the training corpus of a configuration.
+Run it once before and once after a change to compare.
+
+Usage:
+    measure_memory.py [--fit] <config-file>
+
+Options:
+    --fit   Fit the model too
+"""
+
+import sys
+sys.path.append("../")
+
+import resource
+import time
+from docopt import docopt
+from training import Trainer
+from templates import template1
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    start = time.perf_counter()
+    t = Trainer(args["<config-file>"])
+    t.set_feats_labels(template1)
+    n_tokens = sum(len(s) for s in t.X_train)
+    print("Feature extraction: {} sentences, {} tokens in {:.1f}s".format(len(t.X_train), n_tokens,
+                                                                          time.perf_counter() - start))
+    print("Peak RSS after feature extraction: {:.1f} MB".format(peak_rss_mb()))
+    if args["--fit"]:
+        start = time.perf_counter()
+        t.fit()
+        print("Fit: {:.1f}s".format(time.perf_counter() - start))
+        print("Peak RSS after fit: {:.1f} MB".format(peak_rss_mb()))
@@ -3,50 +3,148 @@ A small script that takes care to verify (and in case, correct) some errors
 that may occasionally occur in the annotation. The most egregious one is
 produced when a transition is created from O to a I- tag.
 
+The errors that are detected are:
+
+* `O-I`: an I- tag following an O (e.g. `O, I-PERauthor`);
+* `I-X-I-Y`: an I- tag continuing an entity of another type (e.g. `B-PERauthor, I-DATEletter`);
+* `dangling`: an entity continued from the previous sentence (an I- tag opening a sentence) or,
+  in the TSV files, an entity layer (`B-webanno.custom.LetterEntity_`) out of step with the NE tag.
+
+The first I- tag of a broken entity is turned into a B- tag (`--fix` rewrites the files in place).
+Only `O-I` and `I-X-I-Y` are corrected by default: `dangling` entities are often entities split by
+the sentence tokenizer, add that type to `--types` to correct them too.
+Both the TSV files produced by the annotation scripts (`*.tsv`) and the IOB files used for
+training (`*.iob`) are checked; files are processed in parallel and a JSON report is printed.
+
 Usage:
-    postprocess.py [-r <regexp>] <data-folder>
+    postprocess.py [options] <data-folder>...
 
 Options:
-    -r <reg>    regular expression for file names (regexp as in Unix paths!)
+    -r <reg>                glob pattern for file names (as in Unix paths!) [default: *.tsv *.iob]
+    --fix                   Rewrite the files with the errors corrected
+    -t TYPES --types=TYPES  Types of errors to correct [default: O-I I-X-I-Y]
+    -o FILE --report=FILE   Write the JSON report to FILE instead of the standard output
+    -j N --jobs=N           Number of processes (default: number of CPUs)
 """
 
+import sys
+sys.path.append("../")
+
 from docopt import docopt
 from glob import glob
-import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from file_utils import write_atomic
+import json
 import os
 import logging
 
 logging.basicConfig(level=logging.INFO)
 
-def fix_iob(lines, fname):
-    for index,line in enumerate(lines[:-1]):
-        #annos = [l.split("\t") for l in lines if len(l.split("\t")) > 1]
-        #for i, a in enumerate(annos):
-        l = line.split('\t')
-        try:
-            currentner = l[6]
-        except IndexError:
-            currentner = "O"
+ERROR_TYPES = ("O-I", "I-X-I-Y", "dangling")
+# `dangling` is only corrected on request
+FIX_TYPES = ("O-I", "I-X-I-Y")
+
+# column of the NE tag and of the entity layer (None if absent), by file extension
+COLUMNS = {".tsv": (6, 5), ".iob": (4, None)}
+
+
+def _entity_layer(netag):
+    return 'O' if netag == 'O' else netag[0] + '-webanno.custom.LetterEntity_'
+
+
+def fix_iob(lines, fname, ne_col=6, layer_col=5, fix_types=FIX_TYPES):
+    """
+    Checks the BIO transitions of the lines of a file (one token per line, tab-separated;
+    sentences are separated by empty lines or comments).
+
+    :param lines: list of lines (with their newline)
+    :param fname: name of the file (for the messages)
+    :param ne_col: column of the NE tag
+    :param layer_col: column of the entity layer (TSV only)
+    :param fix_types: the types of errors that are corrected
+    :return: tuple (list of errors, list of corrected lines)
+    """
+    errors = []
+    fixed = list(lines)
+    prev, sentence_start = "O", True
+    for index, line in enumerate(lines):
+        if not line.strip() or line.startswith("#"):
+            prev, sentence_start = "O", True
+            continue
+        l = line.rstrip("\n").split('\t')
+        currentner = l[ne_col] if len(l) > ne_col else "O"
+        kind = None
+        if currentner.startswith("I-"):
+            if prev == "O":
+                kind = "dangling" if sentence_start else "O-I"
+            elif prev[2:] != currentner[2:]:
+                kind = "I-X-I-Y"
+        if kind is not None:
+            corrected = "B-" + currentner[2:]
+        else:
+            corrected = currentner
+        if layer_col is not None and len(l) > ne_col and l[layer_col] != _entity_layer(corrected) \
+                and kind is None:
+            kind = "dangling"
+        if kind is not None:
+            logging.error('Line {}, token {} in {} is not correct ({}: {} after {})'.format(
+                index + 1, l[0], fname, kind, currentner, prev))
+            errors.append({"file": fname, "line": index + 1, "token": l[0], "type": kind,
+                           "tag": currentner, "fix": corrected, "fixed": kind in fix_types})
+            if kind in fix_types:
+                l[ne_col] = corrected
+                if layer_col is not None:
+                    l[layer_col] = _entity_layer(corrected)
+                fixed[index] = "\t".join(l) + "\n"
+            else:
+                corrected = currentner
+        prev, sentence_start = corrected, False
+    return errors, fixed
+
+
+def check_file(fpath, fix=False, fix_types=FIX_TYPES):
+    """Checks (and if `fix`, rewrites) a file; returns the list of errors"""
+    ne_col, layer_col = COLUMNS.get(os.path.splitext(fpath)[1], COLUMNS[".tsv"])
+    with open(fpath) as f:
+        lines = f.readlines()
+    errors, fixed = fix_iob(lines, fpath, ne_col, layer_col, fix_types if fix else ())
+    if any(e["fixed"] for e in errors):
+        write_atomic(fpath, "".join(fixed))
+    return errors
+
+
+def _check(args):
+    return check_file(*args)
+
 
-        reg = re.compile(r'\tI-([A-Z]{3})')
+def check_files(files, fix=False, fix_types=FIX_TYPES, jobs=None):
+    """
+    Checks a list of files in parallel
 
-        if currentner == "O" and reg.search(lines[index+1]):
-            logging.error('Line {}, token {} in {} is not correct ("O" followed by "I-")'.format(index+1, lines[index+1].split("\t")[0], fname) )
-            #lines[index + 1] = reg.sub(r"\tB-\1")
+    :return: the report (dict)
+    """
+    errors = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for file_errors in pool.map(_check, [(f, fix, fix_types) for f in files], chunksize=32):
+            errors.extend(file_errors)
+    return {"files": len(files),
+            "files_with_errors": len({e["file"] for e in errors}),
+            "errors": dict(Counter(e["type"] for e in errors)),
+            "fixed": sum(e["fixed"] for e in errors),
+            "details": errors}
 
 
 if __name__ == "__main__":
     args = docopt(__doc__)
-    files = os.listdir(args["<data-folder>"])
-    if args["-r"]:
-        reg = args["-r"]
+    files = sorted({f for folder in args["<data-folder>"] for reg in args["-r"].split()
+                    for f in glob(os.path.join(folder, reg))})
+    logging.info("{} files".format(len(files)))
+    report = check_files(files, fix=args["--fix"], fix_types=tuple(args["--types"].split()),
+                         jobs=int(args["--jobs"]) if args["--jobs"] else None)
+    logging.info("{} errors in {} files".format(len(report["details"]), report["files_with_errors"]))
+    if args["--report"]:
+        with open(args["--report"], "w") as out:
+            json.dump(report, out, indent=2, ensure_ascii=False)
     else:
-        reg = "*.tsv"
-    path = os.path.join(args["<data-folder>"], reg)
-    print(path)
-    files = glob(path)
-    print(len(files))
-    for fpath in files:
-        with open(fpath) as f:
-            lines = f.readlines()
-        fix_iob(lines, fpath)
+        print(json.dumps(report, indent=2, ensure_ascii=False))
@@ -0,0 +1,31 @@
+"""
+Retrain the CRF model after a new annotation stage has been downloaded from WebAnno
+(see getTrainingFromWebanno.py). The features of the IOB files used in the previous stages
+are read from a cache, so that only the newly downloaded files have to be featurized.
+
+Usage:
+    retrain.py [-m MODEL] [-c CACHE] <config-file> <output-model>
+
+Options:
+    -m MODEL --previous=MODEL   Model of the previous stage (used for the report)
+    -c CACHE --cache=CACHE      Directory of the feature cache [default: ../lib/cache/features]
+"""
+
+import sys
+sys.path.append("../")
+
+import json
+import logging
+from docopt import docopt
+from training import Trainer
+from templates import template1
+
+logging.basicConfig(level=logging.INFO)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    t = Trainer(args["<config-file>"])
+    report = t.retrain(template1, args["--cache"], previous_model=args["--previous"])
+    t.write_model(args["<output-model>"])
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,166 @@
+"""
+Reading the pages of the TEI transcriptions (`//tei:body/tei:div`) without parsing whole volumes.
+
+* `iter_pages` streams the page elements of a volume with `iterparse`, freeing each page
+  as soon as the next one is requested;
+* `PageIndex` gives random access to page N: the byte offsets of the pages are collected
+  once per volume (and saved next to it), then only the bytes of the requested pages are parsed.
+"""
+
+import json
+import os
+import re
+from lxml import etree
+
+TEI_NS = "http://www.tei-c.org/ns/1.0"
+ns = {'tei': TEI_NS}
+
+_BODY = "{%s}body" % TEI_NS
+_DIV = "{%s}div" % TEI_NS
+_BODY_START = re.compile(rb'<body[\s>]')
+# opening, closing and self-closing div tags
+_DIV_TAG = re.compile(rb'<(/?)div(?=[\s/>])[^>]*?(/?)>')
+_XMLNS = re.compile(rb'\sxmlns(?::\w+)?="[^"]*"')
+_ROOT_TAG = re.compile(rb'<(?![?!])[^>]*>')
+
+
+def iter_pages(path):
+    """
+    Yields the pages (the `div` children of the TEI body) of a volume one at a time.
+    A page element is cleared when the next one is requested: copy what you need before moving on.
+
+    :param path: path to a TEI file (e.g. transcription.xml)
+    :return: generator of lxml elements
+    """
+    for _, el in etree.iterparse(path, events=("end",), tag=_DIV):
+        parent = el.getparent()
+        if parent is None or parent.tag != _BODY:
+            continue
+        yield el
+        el.clear()
+        # drop the pages already seen, so that the tree never grows
+        while el.getprevious() is not None:
+            del parent[0]
+
+
+def getLines(page_el):
+    return [par for par in page_el if par.text is not None]
+
+
+def deleteRepeatedLines(lines):
+    half = int(len(lines) / 2)
+    isRepeat = False
+    if len(lines) <= 4:
+        lim = 2
+    else:
+        lim = 3
+    #check the first 3 lines (unless there are only 4 lines in a text...); add numbers if you want
+    for i in range(lim):
+        try:
+            if lines[half+i].text == lines[i].text:
+                isRepeat = True
+        except IndexError:
+            isRepeat = False
+    return lines[:half] if isRepeat == True else lines
+
+
+def page_text(page_el, regexps=None):
+    """
+    The text of a page: its lines (without the repeated ones), preprocessed and joined.
+
+    :param page_el: page element
+    :param regexps: a `preprocessing.RegexPreprocessor` (or any callable str -> str)
+    :return: str
+    """
+    lines = deleteRepeatedLines(getLines(page_el))
+    p = "\n".join([l.text for l in lines])
+    if regexps is not None:
+        p = regexps(p)
+    return p.replace("\n", "")
+
+
+class PageIndex:
+    """
+    Random access to the pages of a TEI volume.
+
+    :param path: path to the TEI file
+    :param index_path: where to store the offsets (default: next to the volume, with extension `.pages.json`)
+    """
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + ".pages.json"
+        self._offsets = None
+        self._wrapper = None
+
+    @property
+    def offsets(self):
+        """List of (start, end) byte offsets of the pages"""
+        if self._offsets is None:
+            self._load_or_build()
+        return self._offsets
+
+    def _signature(self):
+        st = os.stat(self.path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def _load_or_build(self):
+        if os.path.isfile(self.index_path):
+            with open(self.index_path) as f:
+                saved = json.load(f)
+            if saved["source"] == self._signature():
+                self._offsets = [tuple(o) for o in saved["pages"]]
+                self._wrapper = saved["wrapper"].encode("utf-8")
+                return
+        self.build()
+
+    def build(self):
+        """Scans the volume once and saves the offsets of its pages"""
+        with open(self.path, "rb") as f:
+            data = f.read()
+        root = _ROOT_TAG.search(data)
+        namespaces = b"".join(_XMLNS.findall(root.group(0)))
+        self._wrapper = b"<pages" + namespaces + b">"
+
+        offsets = []
+        body = _BODY_START.search(data)
+        depth, start = 0, None
+        for m in _DIV_TAG.finditer(data, body.end() if body else 0):
+            closing, selfclosing = m.group(1), m.group(2)
+            if closing:
+                depth -= 1
+                if depth == 0:
+                    offsets.append((start, m.end()))
+            elif selfclosing:
+                if depth == 0:
+                    offsets.append((m.start(), m.end()))
+            else:
+                if depth == 0:
+                    start = m.start()
+                depth += 1
+        self._offsets = offsets
+
+        try:
+            with open(self.index_path, "w") as out:
+                json.dump({"source": self._signature(), "wrapper": self._wrapper.decode("utf-8"),
+                           "pages": offsets}, out)
+        except OSError:
+            # read-only location: the index will be rebuilt next time
+            pass
+        return self
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def page(self, n):
+        """Parses and returns page n (0-based)"""
+        return next(self.pages(n, n + 1 or None))
+
+    def pages(self, start=0, stop=None):
+        """Parses and yields the pages from start to stop (as in a slice)"""
+        offsets = self.offsets[start:stop]
+        with open(self.path, "rb") as f:
+            for begin, end in offsets:
+                f.seek(begin)
+                xml = self._wrapper + f.read(end - begin) + b"</pages>"
+                yield etree.fromstring(xml)[0]
@@ -1,3 +1,4 @@
+import os
 import pytest
 import training as trn
 from templates import template1
@@ -44,3 +45,272 @@ def test_split(trainer):
     flat_test = [i for sent in test for i in sent ]
     assert len(flat_test) >= 17641
 
+
+
+def test_write_model(trainer, tagged_sent0, tmpdir):
+    from model_store import load_model
+    trainer.training = [tagged_sent0, ]
+    trainer.set_feats_labels(template1)
+    trainer.fit()
+    path = trainer.write_model(str(tmpdir.join("model")))
+    model = load_model(path, template=template1, dictionaries=trainer.dictionaries)
+    assert model.predict(trainer.X_train) == trainer.crf.predict(trainer.X_train)
+    with pytest.raises(ValueError):
+        load_model(path, template=template1[:-1])
+
+
+def test_retrain(tmpdir):
+    import json
+    import shutil
+    iob = tmpdir.mkdir("iob")
+    pages = ["data/IOB_GOLD/1_Braun_an_Gerhard1832-35_page00{}.iob".format(i) for i in (1, 2, 3)]
+    with open("lib/config/korr_main.json") as f:
+        config = json.load(f)
+    config.update(project_root=os.getcwd(), root_training=str(iob))
+    tmpdir.join("config.json").write(json.dumps(config))
+    cache = str(tmpdir.join("cache"))
+
+    for page in pages[:2]:
+        shutil.copy(page, str(iob))
+    trainer = trn.Trainer(str(tmpdir.join("config.json")))
+    assert trainer.retrain(template1, cache)["featurized"] == 2
+    model = trainer.write_model(str(tmpdir.join("stage1")))
+
+    # a new annotation stage: only the new file is featurized
+    shutil.copy(pages[2], str(iob))
+    trainer = trn.Trainer(str(tmpdir.join("config.json")))
+    report = trainer.retrain(template1, cache, previous_model=model)
+    assert (report["cached"], report["featurized"], report["new_files"]) == (2, 1, 1)
+    assert report["previous_iterations"] > 0 and "iterations_saved" not in report
+    cached = trainer.X_train
+    trainer.set_feats_labels_cached(template1, str(tmpdir.join("empty_cache")))
+    assert trainer.X_train == cached
+
+
+def test_word_types(dicts, tagged_sent0):
+    table = trn.WordTypeTable(dicts)
+    feats = trn.SentFeatureExtractor(tagged_sent0, 0, dicts, table).features
+    expected = [trn.TokenFeatureExtractor(tagged_sent0, i, 0, dicts).feature_dict for i in range(len(tagged_sent0))]
+    assert feats == expected
+    assert table.stats["misses"] == len(set(t[0] for t in tagged_sent0))
+
+
+def test_word_type_table_size(dicts):
+    table = trn.WordTypeTable(dicts, max_types=2)
+    records = [table.record(w) for w in ("Braun", "an", "Gerhard", "Braun")]
+    assert records[0] == records[3] and records[0]["isInPersonDic"] == "True"
+    assert len(table._table) == 2 and table.stats["misses"] == 4
+
+
+def test_page_index(tmpdir):
+    from lxml import etree
+    from tei_reader import PageIndex, iter_pages, ns
+    path = "data/TEI/originals/BOOK-ZID1313531/transcription.xml"
+    pages = etree.parse(path).xpath("//tei:body/tei:div", namespaces=ns)
+    index = PageIndex(path, str(tmpdir.join("index.json")))
+    assert len(index) == len(pages) == sum(1 for _ in iter_pages(path))
+    assert [p.text for p in index.page(3)] == [p.text for p in pages[3]]
+
+
+@pytest.fixture
+def webanno_stub():
+    """A local stub of the WebAnno remote API serving data/example.tsv as the only document"""
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    with open("data/example.tsv") as f:
+        docs = {1: {"name": "5_example.tsv", "state": "COMPLETE", "timestamp": "2018-05-01", "tsv": f.read()}}
+    downloads = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.split("?")[0].strip("/").split("/")[3:]
+            if parts == ["projects", "3", "documents"]:
+                body = json.dumps({"body": [{"id": i, "name": d["name"]} for i, d in docs.items()]})
+            elif len(parts) == 5:
+                d = docs[int(parts[3])]
+                body = json.dumps({"body": [{"user": "marina", "state": d["state"], "timestamp": d["timestamp"]}]})
+            else:
+                downloads.append(parts[3])
+                body = docs[int(parts[3])]["tsv"]
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(body.encode("utf-8"))
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("localhost", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://localhost:{}".format(server.server_port), docs, downloads
+    server.shutdown()
+
+
+def test_webanno_sync(webanno_stub, tmpdir):
+    from webanno import WebAnnoClient, WebAnnoSync
+    url, docs, downloads = webanno_stub
+    client = WebAnnoClient(url, ("user", "pwd"))
+    out = str(tmpdir)
+    assert WebAnnoSync(client, 3, out, stage=5).sync()["updated"] == ["5_example.tsv"]
+    assert tmpdir.join("5_example_tsv.iob").read().split("\n")[2].startswith("Gerhard\tNE\tGerhard")
+    umask = os.umask(0)
+    os.umask(umask)
+    for f in ("5_example_tsv.iob", ".webanno.json"):
+        assert os.stat(str(tmpdir.join(f))).st_mode & 0o777 == 0o666 & ~umask
+    # nothing changed: the document is not downloaded again
+    assert WebAnnoSync(client, 3, out, stage=5).sync()["unchanged"] == 1
+    assert len(downloads) == 1
+    docs[1]["timestamp"] = "2018-06-01"
+    assert WebAnnoSync(client, 3, out, stage=5).sync()["unchanged"] == 1
+    assert len(downloads) == 2
+
+
+def test_write_atomic(tmpdir):
+    from file_utils import write_atomic
+    path = str(tmpdir.join("out.txt"))
+    write_atomic(path, "Braun an Gerhard\n")
+    write_atomic(path, "Gerhard an Braun\n")
+    assert tmpdir.join("out.txt").read() == "Gerhard an Braun\n"
+    umask = os.umask(0)
+    os.umask(umask)
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~umask
+    # a failed write leaves the file as it was, and no temporary file
+    with pytest.raises(TypeError):
+        write_atomic(path, None)
+    assert tmpdir.listdir() == [tmpdir.join("out.txt")]
+    assert tmpdir.join("out.txt").read() == "Gerhard an Braun\n"
+
+
+def test_iter_iob():
+    from webanno import iter_iob, tsv2iob, splitInLinesFile
+    with open("data/example.tsv") as f:
+        iob = list(iter_iob(f))
+    assert iob == tsv2iob(splitInLinesFile("data/example.tsv"))
+    # the first token is never the continuation of an entity
+    tsv = ["#T_SP=webanno.custom.LetterEntity|entity_id|value", "", "1-1\t0-5\tBraun\t*\tPERauthor",
+           "1-2\t6-8\tan\t_\t_", "1-3\t9-16\tGerhard\t*\tPERauthor"]
+    assert [t[4] for t in next(iter_iob(tsv))] == ["B-PERauthor", "O", "B-PERauthor"]
+
+
+def test_fix_iob(tmpdir):
+    import sys
+    sys.path.append("scripts")
+    from postprocess import ERROR_TYPES, check_file, fix_iob
+    lines = ["Braun\tNE\tBraun\tHEAD\tI-PERauthor\n", "an\tAPPR\tan\tHEAD\tO\n",
+             "Gerhard\tNE\tGerhard\tHEAD\tI-PERaddressee\n", "Berlin\tNE\tBerlin\tHEAD\tI-PLACEletter\n", "\n"]
+    errors, fixed = fix_iob(lines, "x.iob", ne_col=4, layer_col=None)
+    assert [(e["line"], e["type"], e["fixed"]) for e in errors] == [(1, "dangling", False), (3, "O-I", True),
+                                                                    (4, "I-X-I-Y", True)]
+    # dangling entities are only corrected on request
+    assert [l.split("\t")[4].strip() for l in fixed[:4]] == ["I-PERauthor", "O", "B-PERaddressee", "B-PLACEletter"]
+    errors, fixed_all = fix_iob(lines, "x.iob", ne_col=4, layer_col=None, fix_types=ERROR_TYPES)
+    assert all(e["fixed"] for e in errors) and fixed_all[0].split("\t")[4] == "B-PERauthor\n"
+
+    path = tmpdir.join("x.iob")
+    path.write("".join(lines))
+    assert len(check_file(str(path), fix=True)) == 3
+    assert path.read() == "".join(fixed)
+    umask = os.umask(0)
+    os.umask(umask)
+    assert os.stat(str(path)).st_mode & 0o777 == 0o666 & ~umask
+
+
+def test_preprocessing_stages():
+    import re
+    from preprocessing import RegexPreprocessor, Stage, _mergeable
+    rules = [(re.compile(r"(\w+)-\n(\w+)"), r"\1\g<2>"),
+             (re.compile("\xad"), ""),
+             (re.compile(r"(\d+) ?(\.|,) ?(\d+)"), r"\g<1>\2\3"),
+             (re.compile(r"\\"), r"\\\\"),
+             (re.compile(r"ſ"), "s"),
+             (re.compile(r"([A-Z])\.([A-Z])\."), r"\2.\1.")]
+    texts = ["Ge-\nlehrte", "Gerhard an Braun, 12 . 3, 1844", "Mu\xadseum A.B. ſ \\ Ro-\nm 1 ,2"]
+    pre = RegexPreprocessor(rules, plan=[list(range(len(rules)))])
+    assert [pre(t) for t in texts] == [pre.sequential(t) for t in texts]
+    assert pre.validate(texts) == []
+    # every pair of rules, merged in a single stage
+    for i in range(len(rules)):
+        for j in range(i + 1, len(rules)):
+            merged, separate = Stage([rules[i], rules[j]]), RegexPreprocessor([rules[i], rules[j]])
+            assert [merged(t) for t in texts] == [separate.sequential(t) for t in texts]
+
+    assert not _mergeable((re.compile(r"(?P<day>\d+)\."), r"\g<day>"))
+    assert not _mergeable((re.compile(r"(\w)\1"), r"\1"))
+    assert _mergeable(rules[0])
+
+
+def test_normalize_date():
+    from date_normalizer import normalize_date
+    assert normalize_date("23 . Juli 1835") == "1835-07-23"
+    assert normalize_date("23 Luglio , 1835") == "1835-07-23"
+    assert normalize_date("März 1832") == "1832-03-01"
+    assert normalize_date("10 . März 183 ~") is None
+
+
+def test_letter_index(tmpdir):
+    from korr_corpusreader import KorrIOBCorpusReader
+    from letter_index import LetterIndex, Position
+    cols = ["words", "pos", "lemma", "textlayer", "chunk", "entityid"]
+    corpus = KorrIOBCorpusReader("data/IOB_GOLD", r"1_.*\.iob", columntypes=cols)
+    index = LetterIndex.for_corpus(corpus, str(tmpdir.join("letters.json")))
+    first = index[0]
+    assert (first.author, first.addressee, first.date) == ("Braun", "Gerhard", "1832-03-10")
+    assert index.letter_at(Position(first.pages[-1], 0, 0)) == first
+    assert LetterIndex.for_corpus(corpus, str(tmpdir.join("letters.json"))).letters == index.letters
+    assert index.sents(corpus, 0)[0][2] == ('Braun', 'NE', 'Braun', 'HEAD', 'B-PERauthor')
+
+
+def test_entity_network(tmpdir):
+    import xml.etree.ElementTree as ET
+    from entity_network import EntityNetwork, page_mentions
+    mentions = page_mentions("data/IOB_GOLD/1_Braun_an_Gerhard1832-35_page001.iob")
+    assert mentions[0] == (0, 2, "PERauthor", "Braun")
+    network = EntityNetwork()
+    network.add_letter([(label, text) for _, _, label, text in mentions])
+    network.add_letter([("PERauthor", "Braun"), ("PERaddressee", "Gerhard")])
+    assert network.edges[(("PERaddressee", "Gerhard"), ("PERauthor", "Braun"))] == 2
+    network.write(str(tmpdir.join("net.gexf")))
+    assert len(ET.parse(str(tmpdir.join("net.gexf"))).getroot()[0][2]) == len(network.edges)
+
+
+def test_instrumentation(tmpdir):
+    import json
+    from instrumentation import Instrumentation
+
+    instr = Instrumentation(profile=True)
+    square = instr.timed("square")(lambda x: x * x)
+    for i in range(3):
+        with instr.stage("tokenize"):
+            square(i)
+        instr.count("pages")
+    summary = instr.write(str(tmpdir.join("stats.json")))
+    assert summary["stages"]["tokenize"]["calls"] == summary["stages"]["square"]["calls"] == 3
+    assert summary["counters"] == {"pages": 3}
+    assert json.loads(tmpdir.join("stats.json").read())["counters"] == {"pages": 3}
+    instr.dump_profiles(str(tmpdir.join("prof")))
+    assert sorted(tmpdir.join("prof").listdir()) == [tmpdir.join("prof", "square.prof"),
+                                                      tmpdir.join("prof", "tokenize.prof")]
+
+    off = Instrumentation.disabled()
+    with off.stage("tokenize"):
+        off.count("pages")
+    assert off.summary()["stages"] == {} and off.summary()["counters"] == {}
+
+
+def test_evaluation():
+    from sklearn_crfsuite import metrics
+    from evaluation import Evaluation, flat_f1_score
+    y_true = [["B-PERauthor", "I-PERauthor", "O", "B-DATEletter"], ["I-PLACEfrom", "O"]]
+    y_pred = [["B-PERauthor", "O", "O", "B-DATEletter"], ["B-PLACEfrom", "B-PLACEfrom"]]
+    labels = ["B-DATEletter", "B-PERauthor", "I-PERauthor", "B-PLACEfrom", "I-PLACEfrom"]
+    assert flat_f1_score(y_true, y_pred, labels=labels) == \
+        pytest.approx(metrics.flat_f1_score(y_true, y_pred, average="weighted", labels=labels))
+    ev = Evaluation(y_true, y_pred, labels)
+    assert ev.confusion_matrix().sum() == 6
+    spans = ev.span_scores()
+    # the dangling I-PLACEfrom opens an entity, matched by the first predicted PLACEfrom
+    assert spans["exact"]["recall"] == pytest.approx(2 / 3)
+    assert spans["partial"]["recall"] == 1.0 and spans["partial"]["precision"] == pytest.approx(3 / 4)
+    low, high = ev.bootstrap(200, jobs=1)["token_f1"]
+    assert 0 <= low <= ev.flat_f1() <= high <= 1
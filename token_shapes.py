@@ -0,0 +1,84 @@
+"""
+Orthographic ("shape") features of a token: character patterns, digit/case flags and affixes.
+
+The features only depend on the word form, so they are computed once per word type and memoized
+in a bounded LRU cache: as most tokens of the corpus belong to a few frequent types, the typical
+cost of a lookup is a single dict hit. Patterns are built with `str.translate` and a lazily filled
+translation table instead of testing every character in Python.
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+
+# max number of word types kept in the cache
+SHAPE_CACHE_SIZE = 2 ** 17
+
+Shape = namedtuple("Shape", ["pattern_long", "pattern_short", "isDigit", "isUpper", "isTitle", "hasDigit",
+                             "endsWithDigit", "prefix_long", "prefix_short", "suffix_long", "suffix_short"])
+
+
+class _PatternTable(dict):
+    """
+    Translation table for `str.translate` mapping every character to its class:
+    'a' (lower-case letter), 'A' (other letter), '0' (other alphanumeric, e.g. digits) or '-' (anything else).
+    Entries are computed the first time a character is met.
+    """
+
+    def __missing__(self, code):
+        char = chr(code)
+        if char.isalnum():
+            if char.isalpha():
+                cls = 'a' if char.islower() else 'A'
+            else:
+                cls = '0'
+        else:
+            cls = '-'
+        self[code] = cls
+        return cls
+
+
+_PATTERN_TABLE = _PatternTable()
+
+
+def pattern(word):
+    """
+    >>> pattern("Homéro,1999")
+    'Aaaaaa-0000'
+    """
+    return word.translate(_PATTERN_TABLE)
+
+
+def short_pattern(long_pattern):
+    """The classes of a pattern, in order of first occurrence
+
+    >>> short_pattern('Aaaaaa-0000')
+    'Aa-0'
+    """
+    return ''.join(dict.fromkeys(long_pattern))
+
+
+@lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def word_shape(word):
+    """Returns the (memoized) `Shape` of a word form
+
+    >>> word_shape("1835,").endsWithDigit
+    False
+    """
+    long_pattern = pattern(word)
+    return Shape(pattern_long=long_pattern,
+                 pattern_short=short_pattern(long_pattern),
+                 isDigit=word.isdigit(),
+                 isUpper=word.isupper(),
+                 isTitle=word.istitle(),
+                 hasDigit=any(map(str.isdigit, word)),
+                 # same as re.search(r'\d+$', word): \d matches the decimal digits
+                 endsWithDigit=word[-1:].isdecimal(),
+                 prefix_long=word[:5],
+                 prefix_short=word[:3],
+                 suffix_long=word[-4:],
+                 suffix_short=word[-2:])
+
+
+def cache_info():
+    """Hits, misses and size of the shape cache"""
+    return word_shape.cache_info()
@@ -1,18 +1,17 @@
+import os
 import re
+from sys import intern
 from config_reader import ProjectCofiguration
-#from
-
-import sklearn
-import scipy.stats
-from sklearn.metrics import make_scorer
-
-from sklearn_crfsuite import CRF, scorers, metrics
-
-from korr_corpusreader import KorrIOBCorpusReader
+# sklearn_crfsuite and nltk (through the corpus reader) take about a second to import: they are imported
+# by the Trainer, so that the feature extraction (used by the annotator) can be imported without them
 from crfsuite import feature_extractor
+from token_shapes import SHAPE_CACHE_SIZE, word_shape, pattern
 
 import logging
 
+# the values of the boolean token attributes
+_STR = {True: "True", False: "False"}
+
 def load_dictionaries(dics):
     """Takes a dictionary with {category : path} and returns a dictionary
     { category : entry_list }
@@ -40,12 +39,17 @@ def sent2simplifiedlabel(sent):
 
 class Trainer():
     def __init__(self, config):
+        from sklearn_crfsuite import CRF
+        from korr_corpusreader import KorrIOBCorpusReader
+
         self._config = ProjectCofiguration(config)
         self._cols = ["words", "pos", "lemma", "textlayer", "chunk", "entityid"]
         self._corpus = KorrIOBCorpusReader(self._config.root_training, r".*\.iob", columntypes=self._cols)
         self.training = self._corpus.full_tagged_sents()
         self.test = None
         self.dictionaries = load_dictionaries(self._config.dictionaries)
+        self.word_types = WordTypeTable(self.dictionaries)
+        self.template = None
 
         # Logger
         self.logger = logging.getLogger(__name__)
@@ -97,22 +101,89 @@ class Trainer():
 
 
     def set_feats_labels(self, templ):
-        ext = InstanceFeatureExtractor(self.training, self.dictionaries)
+        self.template = templ
+        ext = InstanceFeatureExtractor(self.training, self.dictionaries, self.word_types)
         self.X_train = ext.extract_features(templ)
         self.y_train = [sent2simplifiedlabel(s) for s in self.training]
 
         if self.test:
-            test_ext = InstanceFeatureExtractor(self.test, self.dictionaries)
+            test_ext = InstanceFeatureExtractor(self.test, self.dictionaries, self.word_types)
             self.X_test = test_ext.extract_features(templ)
             self.y_test = [sent2simplifiedlabel(s) for s in self.test]
 
 
+    def set_feats_labels_cached(self, templ, cache_dir):
+        """
+        Like `set_feats_labels`, but the features of the training corpus are extracted file by file
+        and stored in `cache_dir`: only new or modified IOB files are featurized, the others are read from the cache.
+        Note that here the whole corpus is used (not `self.training`) and sentences are ranked within each file,
+        as it happens when a page is annotated.
+        :param templ: the feature template
+        :param cache_dir: directory of the feature cache
+        :return: dict with the number of files taken from the cache and of those that had to be featurized
+        """
+        self.template = templ
+        cache = FeatureCache(cache_dir, templ, self.dictionaries, self.word_types)
+        self.X_train, self.y_train = [], []
+        for fileid in self._corpus.fileids():
+            path = os.path.join(self._config.root_training, fileid)
+            X, y = cache.get(path, lambda: self._corpus.full_tagged_sents(fileids=[fileid]))
+            self.X_train.extend(X)
+            self.y_train.extend(y)
+        self.logger.info("Features: {cached} files from the cache, {featurized} featurized".format(**cache.stats))
+        return cache.stats
+
+
     def fit(self):
         self.crf.fit(self.X_train, self.y_train)
 
 
-    def evaluate(self):
+    @property
+    def iterations(self):
+        """Number of L-BFGS iterations of the last fit (None if the model is not fitted)"""
+        log = getattr(self.crf, "training_log_", None)
+        return len(log.iterations) if log is not None else None
+
+
+    def retrain(self, templ, cache_dir, previous_model=None):
+        """
+        Incremental training for a new annotation stage: the features of the files already seen are
+        read from the cache and only the new files are featurized before fitting.
+        python-crfsuite offers no way to initialize L-BFGS with the weights of a previous model,
+        so the optimization itself restarts from zero: the iterations of the fit and those recorded for
+        the previous model are both in the report, but only to compare the stages (nothing is saved there).
+        :param templ: the feature template
+        :param cache_dir: directory of the feature cache
+        :param previous_model: path to the model of the previous stage (optional)
+        :return: dict (report)
+        """
+        report = self.set_feats_labels_cached(templ, cache_dir)
+        previous = {}
+        if previous_model:
+            from model_store import load_model
+            previous = load_model(previous_model, template=templ).metadata
+            prev_files = previous.get("files", {})
+            report["new_files"] = len([f for f, h in self._file_hashes().items() if prev_files.get(f) != h])
+        self.fit()
+        report["iterations"] = self.iterations
+        report["previous_iterations"] = previous.get("iterations")
+        return report
+
+
+    def _file_hashes(self):
+        from model_store import files_hash
+        return {f: files_hash([os.path.join(self._config.root_training, f)]) for f in self._corpus.fileids()}
+
+
+    def evaluate(self, bootstrap=0, jobs=None):
+        """
+        Scores the model on the test set (see `evaluation.Evaluation`)
+        :param bootstrap: number of bootstrap replicates for the confidence intervals of the F1 scores (0: none)
+        :param jobs: number of processes for the bootstrap
+        :return: dict
+        """
         from collections import Counter
+        from evaluation import Evaluation
 
         def return_transitions(trans_features):
             trans = []
@@ -120,31 +191,88 @@ class Trainer():
                 trans.append("%-6s -> %-7s %0.6f" % (label_from, label_to, weight))
             return trans
 
-        #print("Top likely transitions:")
-        #print_transitions(Counter(crf.transition_features_).most_common(20))
-
-        #print("\nTop unlikely transitions:")
-        #print_transitions(Counter(crf.transition_features_).most_common()[-20:])
         labels = list(self.crf.classes_)
 
         labels.remove('O')
         y_pred = self.crf.predict(self.X_test)
-        eval = {"F1_general" : metrics.flat_f1_score(self.y_test, y_pred,
-                      average='weighted', labels=labels)}
+        ev = Evaluation(self.y_test, y_pred, labels)
+        eval = {"F1_general" : ev.flat_f1()}
         sorted_labels = sorted(labels, key=lambda name: (name[1:], name[0]))
-        eval["F1_class"] = metrics.flat_classification_report(self.y_test, y_pred, labels=sorted_labels, digits=3)
-        eval["Top_likely_transitions"] = return_transitions(Counter(self.crf.transition_features_).most_common(20))
-        eval["Top_unlikely_transitions"] = return_transitions(Counter(self.crf.transition_features_).most_common()[-20:])
+        eval["F1_class"] = ev.report(sorted_labels, digits=3)
+        eval["F1_spans"] = ev.span_scores()
+        transitions = Counter(self.crf.transition_features_).most_common()
+        eval["Top_likely_transitions"] = return_transitions(transitions[:20])
+        eval["Top_unlikely_transitions"] = return_transitions(transitions[-20:])
+        if bootstrap:
+            eval["F1_confidence_intervals"] = ev.bootstrap(bootstrap, jobs=jobs)
 
         return eval
 
 
     def write_model(self, outfile):
-        import pickle
-        pass
+        """
+        Write the fitted model as native CRFsuite file (plus a JSON file with the metadata).
+        See `model_store` for details.
+        :param outfile: path of the model (the extensions .crfsuite and .json are added)
+        :return: str: path of the native model
+        """
+        from model_store import save_model
+
+        assert self.template is not None, "Extract the features (set_feats_labels) before writing the model"
+        corpus_files = [os.path.join(self._config.root_training, f) for f in self._corpus.fileids()]
+        return save_model(self.crf, outfile, self.template, self.dictionaries, corpus_files,
+                          files=self._file_hashes(), iterations=self.iterations)
+
 
 
 
+class FeatureCache:
+    """
+    On-disk cache of the features (and labels) extracted from the single files of a corpus.
+    Entries are keyed by the content of the file, the template and the dictionaries,
+    so a modified file or a different template simply misses the cache.
+    """
+
+    def __init__(self, cache_dir, template, dictionaries, word_types=None):
+        from model_store import template_fingerprint, dictionaries_hash
+
+        self._dir = cache_dir
+        self._template = template
+        self._dictionaries = dictionaries
+        self._word_types = word_types
+        self._salt = template_fingerprint(template) + dictionaries_hash(dictionaries)
+        self.stats = {"cached": 0, "featurized": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, path):
+        import hashlib
+        h = hashlib.sha1(self._salt.encode("utf-8"))
+        with open(path, "rb") as f:
+            h.update(f.read())
+        return os.path.join(self._dir, h.hexdigest() + ".pickle")
+
+    def get(self, path, load_sents):
+        """
+        Returns the features and labels of a file, extracting them (and filling the cache) if needed
+        :param path: path to the IOB file
+        :param load_sents: function returning the tagged sentences of the file
+        :return: tuple (X, y)
+        """
+        import pickle
+
+        cache_path = self._path(path)
+        if os.path.isfile(cache_path):
+            with open(cache_path, "rb") as f:
+                self.stats["cached"] += 1
+                return pickle.load(f)
+        sents = list(load_sents())
+        X = InstanceFeatureExtractor(sents, self._dictionaries, self._word_types).extract_features(self._template)
+        y = [sent2simplifiedlabel(s) for s in sents]
+        with open(cache_path, "wb") as out:
+            pickle.dump((X, y), out, protocol=pickle.HIGHEST_PROTOCOL)
+        self.stats["featurized"] += 1
+        return X, y
+
 
 class InstanceFeatureExtractor:
     """
@@ -152,25 +280,28 @@ class InstanceFeatureExtractor:
     Use this class to transform a collection of sentences into a list of list of feature.
     """
 
-    def __init__(self, instance, dictionaries):
+    def __init__(self, instance, dictionaries, word_types=None):
         self._dictionaries = dictionaries
         self._sentences = instance
-        self._featdictlist = [SentFeatureExtractor(s,i, self._dictionaries).features
-                              for i,s in enumerate(self._sentences)]
+        self._word_types = word_types if word_types is not None else WordTypeTable(dictionaries)
         # Logger
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
 
-        self.logger.info("Generating the list of features for the tokens")
-
 
     def extract_features(self, templ_name):
+       """
+       Generate the token attributes of one sentence at a time and apply the template to them.
+       Only the resulting feature dicts ("F") are kept: the attribute dicts of a sentence can be
+       garbage-collected as soon as the sentence is done.
+       """
        sent_feats = []
        self.logger.info("Extracting the features with the specified template")
-       for sent in self._featdictlist:
+       for i, s in enumerate(self._sentences):
+           sent = SentFeatureExtractor(s, i, self._dictionaries, self._word_types).features
            feature_extractor(sent, templ_name)
-           s = [f["F"] for f in sent]
-           sent_feats.append(s)
+           sent_feats.append([f["F"] for f in sent])
+       self.logger.info("Word type table: {types} types, hit rate {hit_rate:.1%}".format(**self._word_types.stats))
        return sent_feats
 
 
@@ -202,11 +333,12 @@ class InstanceFeatureExtractor:
 
 
 class SentFeatureExtractor():
-    def __init__(self, tokens, sentence_num, dictionaries):
+    def __init__(self, tokens, sentence_num, dictionaries, word_types=None):
         self._tokens = tokens
         self._num = sentence_num
         self._sentlen = len(tokens)
         self._dictionaries = dictionaries
+        self._word_types = word_types if word_types is not None else WordTypeTable(dictionaries)
 
         # Logger
         self.logger = logging.getLogger(__name__)
@@ -215,12 +347,35 @@ class SentFeatureExtractor():
 
     @property
     def features(self):
-        #self.logger.info("Generating the list of features for the tokens")
-        extrs = [TokenFeatureExtractor(self._tokens, i, self._num, self._dictionaries) for i in range(self._sentlen)]
-        return [t.feature_dict for t in extrs]
+        """
+        Same attributes as `TokenFeatureExtractor.feature_dict`, but everything that depends only on the
+        word form is taken from the word type table (see `WordTypeTable.record`): only the context-dependent
+        attributes are computed per token.
+        """
+        sent_rank = intern(str(self._num))
+        feats = []
+        for i, tok in enumerate(self._tokens):
+            d = self._word_types.record(tok[0])
+            d["pos"] = intern(tok[1])
+            d["lemma"] = intern(tok[2])
+            d["rank"] = intern(str(i))
+            d["sent_rank"] = sent_rank
+            d["F"] = {}
+            feats.append(d)
+        return feats
 
 
 class TokenFeatureExtractor():
+    """
+    Reference implementation of the attributes of a token, computed token by token: the features are extracted
+    with `SentFeatureExtractor`, which must give the same attributes (see test_train.py).
+    """
+    # names of the token attributes available to the templates
+    FEATURES = ("w", "w_lower", "pos", "lemma", "rank", "sent_rank", "isDigit", "isUpper", "isTitle",
+                "suffix_long", "suffix_short", "prefix_long", "prefix_short", "hasDigit", "endsWithDigit",
+                "isInPersonDic", "isInPlaceDic", "pattern_long", "pattern_short")
+    __slots__ = ("_token", "_dictionaries") + FEATURES
+
     def __init__(self, sentence, tok_num, sentence_num, dictionaries):
         """
         This particular token feature extractor expects the token to have the following structure:
@@ -234,9 +389,6 @@ class TokenFeatureExtractor():
         :param sentence_num: index of the sentence
         :param dictionaries: dictionary ( dict_type : list of values)
         """
-        
-        from collections import OrderedDict
-        
         self._token = sentence[tok_num]
         self._dictionaries = dictionaries
 
@@ -247,46 +399,113 @@ class TokenFeatureExtractor():
         self.lemma = self._token[2]
         self.rank = str(tok_num)
         self.sent_rank = str(sentence_num)
-        self.isDigit = self.w.isdigit()
-        self.isUpper = self.w.isupper()
-        self.isTitle = self.w.istitle()
-        self.suffix_long = self.w[-4:]
-        self.suffix_short = self.w[-2:]
-        self.prefix_long = self.w[:5]
-        self.prefix_short = self.w[:3]
-        self.hasDigit = any(i.isdigit() for i in self.w)
-        self.endsWithDigit = True if re.search(r'\d+$', self.w) else False
+        shape = word_shape(self.w)
+        self.isDigit = shape.isDigit
+        self.isUpper = shape.isUpper
+        self.isTitle = shape.isTitle
+        self.suffix_long = shape.suffix_long
+        self.suffix_short = shape.suffix_short
+        self.prefix_long = shape.prefix_long
+        self.prefix_short = shape.prefix_short
+        self.hasDigit = shape.hasDigit
+        self.endsWithDigit = shape.endsWithDigit
         self.isInPersonDic = self.w in self._dictionaries["persons"]
         self.isInPlaceDic = self.w in self._dictionaries["places"]
-        self.pattern_long = self.extract_pattern_feature(self.w)
-        self.pattern_short = ''.join(OrderedDict.fromkeys(self.pattern_long).keys())
+        self.pattern_long = shape.pattern_long
+        self.pattern_short = shape.pattern_short
 
 
     def extract_pattern_feature(self, check_str):
         """
-        >>> fe = FeatureExtractor()
-        >>> test = u"Homéro,1999"
-        >>> value = fe.extract_pattern_feature(test)
-        >>> print value[1]
-        Aaaaaa-0000
+        >>> TokenFeatureExtractor.extract_pattern_feature(None, u"Homéro,1999")
+        'Aaaaaa-0000'
         """
-        result=[]
-        for n,char in enumerate(check_str):
-            if(char.isalnum()):
-                if(char.isalpha()):
-                    if(char.islower()):
-                        result.append('a')
-                    else:
-                        result.append('A')
-                else:
-                    result.append('0')
-            else:
-                result.append('-')
-        return ("".join(result))
+        return pattern(check_str)
 
     @property
     def feature_dict(self):
-        d = { k : str(v) for k,v in self.__dict__.items() if k[0] != "_"}
+        # interning makes the (very repetitive) attribute values of the corpus share the same string objects
+        d = { k : intern(str(getattr(self, k))) for k in self.FEATURES}
         d["F"] = {}
         return d
 
+
+class WordTypeTable():
+    """
+    Table word form -> dictionary membership, for the attributes that only depend on the form: the shape and
+    affixes come from the (memoized) `token_shapes.word_shape`, so that frequent types are featurized only once.
+    A table belongs to the Trainer or Annotator that featurizes the sentences, and keeps the `max_types` most
+    recently added types; it can also be saved and reloaded in a later run.
+    """
+    TYPE_FEATURES = ("w", "w_lower", "isDigit", "isUpper", "isTitle", "suffix_long", "suffix_short", "prefix_long",
+                     "prefix_short", "hasDigit", "endsWithDigit", "isInPersonDic", "isInPlaceDic",
+                     "pattern_long", "pattern_short")
+    # the attributes stored in the table
+    DICT_FEATURES = ("isInPersonDic", "isInPlaceDic")
+
+    def __init__(self, dictionaries, path=None, max_types=SHAPE_CACHE_SIZE):
+        """
+        :param dictionaries: dictionary ( dict_type : list of values)
+        :param path: file where the table is persisted (it is loaded now if it exists)
+        :param max_types: max number of word types in the table (the oldest are dropped first)
+        """
+        from model_store import dictionaries_hash
+
+        self._persons = frozenset(dictionaries["persons"])
+        self._places = frozenset(dictionaries["places"])
+        self._dict_hash = dictionaries_hash(dictionaries)
+        self._path = path
+        self.max_types = max_types
+        self._table = {}
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.isfile(path):
+            self.load(path)
+
+    def _add(self, w, flags):
+        if len(self._table) >= self.max_types:
+            del self._table[next(iter(self._table))]
+        self._table[w] = flags
+
+    def record(self, w):
+        """Returns a new dict with the type-level attributes of a word form"""
+        flags = self._table.get(w)
+        if flags is None:
+            self.misses += 1
+            flags = (_STR[w in self._persons], _STR[w in self._places])
+            self._add(w, flags)
+        else:
+            self.hits += 1
+        shape = word_shape(w)
+        return {"w": w, "w_lower": w.lower(), "isDigit": _STR[shape.isDigit], "isUpper": _STR[shape.isUpper],
+                "isTitle": _STR[shape.isTitle], "suffix_long": shape.suffix_long, "suffix_short": shape.suffix_short,
+                "prefix_long": shape.prefix_long, "prefix_short": shape.prefix_short,
+                "hasDigit": _STR[shape.hasDigit], "endsWithDigit": _STR[shape.endsWithDigit],
+                "isInPersonDic": flags[0], "isInPlaceDic": flags[1],
+                "pattern_long": shape.pattern_long, "pattern_short": shape.pattern_short}
+
+    @property
+    def stats(self):
+        total = self.hits + self.misses
+        return {"types": len(self._table), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+    def save(self, path=None):
+        import pickle
+
+        path = path or self._path
+        with open(path, "wb") as out:
+            pickle.dump({"dictionaries": self._dict_hash, "features": self.DICT_FEATURES, "table": self._table},
+                        out, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path):
+        """Loads a saved table; it is ignored if it was built with other dictionaries or attributes"""
+        import pickle
+
+        with open(path, "rb") as f:
+            saved = pickle.load(f)
+        if saved["dictionaries"] != self._dict_hash or tuple(saved["features"]) != self.DICT_FEATURES:
+            logging.getLogger(__name__).warning("The word type table {} does not match the dictionaries: ignored".format(path))
+            return
+        for w, flags in saved["table"].items():
+            self._add(intern(w), tuple(_STR[v == "True"] for v in flags))
@@ -0,0 +1,326 @@
+"""
+Download of the annotated documents from WebAnno and their conversion to IOB.
+
+The conversion functions read WebAnno's TSV3 export in a single pass (see `iter_iob`).
+`WebAnnoSync` keeps a local directory of IOB files in sync with a WebAnno project: a manifest (`.webanno.json` in the output
+directory) records, for every document, the state of its annotation and the hash of the last
+downloaded TSV, so that only new or changed documents are downloaded (in parallel, over a pool
+of reused connections) and converted.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from operator import itemgetter
+from file_utils import write_atomic
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = ".webanno.json"
+
+
+def splitInLinesFile(tsv_path):
+    """Functions that reads a Webanno TSV file
+    and returns the list of lines
+    
+    >>> splitInLinesFile("data/example.tsv")[0]
+    ['2-1', '10-13', '929', 'CARD', '929', '_', '_']
+    
+    >>> splitInLinesFile("data/example.tsv")[-1]
+    ['3-5', '84-88', '1835', 'CARD', '@card@', '*[7]', 'DATEletter[7]']
+    """
+    with open(tsv_path) as f:
+        tsv_in = [l.strip() for l in f.readlines()]
+    lines = [l.split("\t") for l in tsv_in if len(l.split("\t")) > 1]
+    return lines
+
+
+
+def splitInLines(tsv_in):
+    lines = []
+    for l in tsv_in.split("\n"):
+        l = l.strip()
+        l = l.split("\t")
+        if len(l) > 1:
+            lines.append(l)
+    return lines
+
+
+# WebAnno layers and features (as declared in the #T_SP header) -> field of the IOB rows
+LAYER_FIELDS = {
+    ("de.tudarmstadt.ukp.dkpro.core.api.lexmorph.type.pos.POS", "PosValue"): "pos",
+    ("de.tudarmstadt.ukp.dkpro.core.api.segmentation.type.Lemma", "value"): "lemma",
+    ("webanno.custom.Tex", "LayoutElement"): "text_layer",
+    ("webanno.custom.LetterEntity", "entity_id"): "entity_id",
+    ("webanno.custom.LetterEntity", "value"): "ne",
+}
+
+# fields of the IOB rows taken from the TSV columns (the NE tag is built from the `ne` column)
+IOB_FIELDS = ("form", "pos", "lemma", "text_layer", "entity_id", "ne")
+
+
+def column_plan(colmapping):
+    """
+    Indexes of the IOB fields in a TSV row, given the list of column names.
+    Missing columns get index -1, i.e. the '_' appended to every row.
+
+    >>> column_plan(['sent-tok', 'offset', 'form', 'pos', 'lemma'])
+    (2, 3, 4, -1, -1, -1)
+    """
+    return tuple(colmapping.index(f) if f in colmapping else -1 for f in IOB_FIELDS)
+
+
+def header_columns(header_lines):
+    """
+    Column names of a WebAnno TSV3 export, from the layers declared in its header
+    (`#T_SP=layer|feature|...`, `#T_CH=...`, `#T_RL=...`); unknown features get a None column.
+    """
+    cols = ['sent-tok', 'offset', 'form']
+    for line in header_lines:
+        if line.startswith(("#T_SP=", "#T_CH=", "#T_RL=")):
+            layer, *features = line.rstrip("\n")[6:].split("|")
+            cols.extend(LAYER_FIELDS.get((layer, f)) for f in features)
+    return cols
+
+
+def _iob_sentences(rows, plan):
+    """
+    Turns TSV rows (lists of columns, followed by a '_' for the missing ones) into IOB sentences,
+    one sentence at a time.
+    A token gets a B- tag if its entity (e.g. `DATEletter[7]`) differs from the one of the previous token,
+    an I- tag if it is the same.
+    """
+    get = itemgetter(*plan)
+    sent_id, sent = None, []
+    prev_ne = "O"
+    for row in rows:
+        s, _, tok = row[0].partition("-")
+        if not tok.isdigit():
+            raise ValueError("Unexpected token number: {}".format(row[0]))
+        if s != sent_id:
+            if sent:
+                yield sent
+            sent_id, sent = s, []
+        form, pos, lemma, text_layer, entity_id, ne = get(row)
+        if ne == '_' or ne == 'O':
+            prev_ne, tag = 'O', 'O'
+        else:
+            tag = ("I-" if ne == prev_ne else "B-") + ne.split("[", 1)[0]
+            prev_ne = ne
+        sent.append([form, pos, lemma, text_layer, tag, entity_id])
+    if sent:
+        yield sent
+
+
+def tsv2iob(lines, colmapping=['sent-tok', 'offset', 'form', 'pos', 'lemma', 'entity_id', 'ne']):
+    """
+    Convert WebAnno's TSV (already split in lines and columns) into IOB sentences.
+    >>> lines = splitInLinesFile("data/example.tsv")
+    >>> tsv2iob(lines)[0][2]
+    ['Gerhard', 'NE', 'Gerhard', '_', 'B-PERaddressee', '*']
+    >>> tsv2iob(lines)[1][3:]
+    [['Luglio', 'NN', '<unknown>', '_', 'B-DATEletter', '*[7]'], ['1835', 'CARD', '@card@', '_', 'I-DATEletter', '*[7]']]
+    """
+    return list(_iob_sentences((l + ['_'] for l in lines), column_plan(colmapping)))
+
+
+def iter_iob(f):
+    """
+    Streams the IOB sentences of a WebAnno TSV3 export from a file handle, in a single pass.
+    The columns are resolved once from the `#T_SP` header of the file.
+
+    :param f: file handle (or any iterable of lines)
+    :return: generator of sentences (lists of [form, pos, lemma, text_layer, ne, entity_id])
+    """
+    lines = iter(f)
+    header = []
+    for line in lines:
+        if line.strip() and not line.startswith("#"):
+            break
+        header.append(line)
+    else:
+        return
+    plan = column_plan(header_columns(header)) if any(h.startswith("#T_") for h in header) else \
+        column_plan(['sent-tok', 'offset', 'form', 'pos', 'lemma', 'entity_id', 'ne'])
+
+    def rows():
+        for l in chain([line], lines):
+            if l.startswith("#"):
+                continue
+            cols = l.strip().split("\t")
+            if len(cols) > 1:
+                cols.append('_')
+                yield cols
+    yield from _iob_sentences(rows(), plan)
+
+
+def convert_file(tsv_path, iob_path):
+    """Converts a WebAnno TSV3 export to an IOB file, with constant memory"""
+    with open(tsv_path, encoding="utf-8") as f:
+        write_iob(iter_iob(f), iob_path)
+
+
+def iob_name(doc_name):
+    """Name of the IOB file of a WebAnno document
+
+    >>> iob_name("1_Braun_an_Gerhard1832-35_page001.tsv")
+    '1_Braun_an_Gerhard1832-35_page001_tsv.iob'
+    """
+    return '_'.join(doc_name.split(".")[:2]) + '.iob'
+
+
+def write_iob(iob, path):
+    """Writes the IOB sentences to `path` (atomically)"""
+    write_atomic(path, "".join("".join("\t".join(t) + "\n" for t in sent) + "\n" for sent in iob))
+
+
+class WebAnnoClient:
+    """
+    Minimal client for the WebAnno remote API (`/api/aero/v1`). A single session is shared
+    by all the requests, so that connections are reused (up to `pool_size` at a time).
+
+    :param url: base URL of WebAnno (e.g. https://example.org/webanno)
+    :param auth: tuple (user, password)
+    :param pool_size: max number of connections kept open
+    :param timeout: timeout of each request (seconds)
+    """
+
+    def __init__(self, url, auth, pool_size=8, timeout=60):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.api = url.rstrip("/") + "/api/aero/v1"
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.auth = auth
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _get(self, path, **params):
+        r = self.session.get(self.api + path, params=params, timeout=self.timeout)
+        r.raise_for_status()
+        return r
+
+    def documents(self, project_id):
+        """List of the documents of a project (dicts with id, name and state)"""
+        return self._get("/projects/{}/documents".format(project_id)).json()["body"]
+
+    def annotations(self, project_id, doc_id):
+        """List of the annotations of a document (dicts with user, state and timestamp)"""
+        return self._get("/projects/{}/documents/{}/annotations".format(project_id, doc_id)).json()["body"]
+
+    def download_annotation(self, project_id, doc_id, user, fmt="ctsv3"):
+        """The annotation of a document by a user, exported in format `fmt` (text)"""
+        r = self._get("/projects/{}/documents/{}/annotations/{}".format(project_id, doc_id, user), format=fmt)
+        r.encoding = "utf-8"
+        return r.text
+
+    def close(self):
+        self.session.close()
+
+
+class WebAnnoSync:
+    """
+    Keeps the IOB files in `out_dir` in sync with the annotations of a WebAnno project.
+
+    :param client: a `WebAnnoClient`
+    :param project_id: id of the WebAnno project
+    :param out_dir: directory of the IOB files (the manifest is stored there too)
+    :param user: the annotator whose annotations are downloaded
+    :param stage: if given, only the documents whose name starts with `<stage>_` are synced
+    :param workers: number of concurrent downloads
+    """
+
+    def __init__(self, client, project_id, out_dir, user="marina", stage=None, workers=4):
+        self.client = client
+        self.project_id = project_id
+        self.out_dir = out_dir
+        self.user = user
+        self.stage = stage
+        self.workers = workers
+        self.manifest_path = os.path.join(out_dir, MANIFEST)
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self):
+        write_atomic(self.manifest_path, json.dumps(self.manifest, indent=2, sort_keys=True))
+
+    def documents(self):
+        docs = self.client.documents(self.project_id)
+        if self.stage is not None:
+            docs = [d for d in docs if d["name"].split("_")[0] == str(self.stage)]
+        return docs
+
+    def remote_state(self, doc):
+        """State and timestamp of the annotation of `user` (None if WebAnno does not tell)"""
+        try:
+            annotations = self.client.annotations(self.project_id, doc["id"])
+        except Exception as e:
+            logger.debug("No annotation state for doc {}: {}".format(doc["id"], e))
+            return None
+        for a in annotations:
+            if a.get("user") == self.user:
+                return [a.get("state"), a.get("timestamp")]
+        return None
+
+    def sync_document(self, doc):
+        """
+        Downloads and converts a document, unless it did not change since the last sync.
+
+        :return: tuple (status, manifest entry), with status in unchanged, updated, failed
+        """
+        key = str(doc["id"])
+        old = self.manifest.get(key)
+        outname = os.path.join(self.out_dir, iob_name(doc["name"]))
+        state = self.remote_state(doc)
+        if old and state is not None and old.get("state") == state and os.path.isfile(outname):
+            return "unchanged", old
+
+        try:
+            tsv = self.client.download_annotation(self.project_id, doc["id"], self.user)
+        except Exception as e:
+            logger.error("Error with doc {} (id={}): {}".format(doc["name"], doc["id"], e))
+            return "failed", old
+        sha1 = hashlib.sha1(tsv.encode("utf-8")).hexdigest()
+        entry = {"name": doc["name"], "state": state, "sha1": sha1, "output": os.path.basename(outname)}
+        if old and old.get("sha1") == sha1 and os.path.isfile(outname):
+            return "unchanged", entry
+
+        logger.info("Writing file {} to {}".format(doc["id"], outname))
+        try:
+            write_iob(iter_iob(io.StringIO(tsv)), outname)
+        except ValueError:
+            logger.error("Doc {}: Dot in token num".format(doc["name"]))
+            return "failed", old
+        return "updated", entry
+
+    def sync(self):
+        """
+        Syncs all the documents of the project (or of the stage).
+
+        :return: dict with the names of the updated and failed documents and the number of unchanged ones
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        docs = self.documents()
+        report = {"updated": [], "unchanged": 0, "failed": []}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for doc, (status, entry) in zip(docs, pool.map(self.sync_document, docs)):
+                if entry is not None:
+                    self.manifest[str(doc["id"])] = entry
+                if status == "unchanged":
+                    report["unchanged"] += 1
+                else:
+                    report[status].append(doc["name"])
+        self.save_manifest()
+        return report